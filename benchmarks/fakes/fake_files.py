@@ -0,0 +1,80 @@
+#
+# Canned output files of the fake KiCad executables and pcbnew module.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import time
+
+EMPTY_ERC_REPORT = u'''ERC report ({date}, Encoding UTF8)
+
+***** Sheet /
+
+ ** ERC messages: 0  Errors 0  Warnings 0
+'''
+
+EMPTY_DRC_REPORT = u'''** Drc report for {board} **
+** Created on {date} **
+
+** Found 0 DRC errors **
+
+** Found 0 unconnected pads **
+
+** End of Report **
+'''
+
+def write_report(filename, canned_report_variable, empty_report, **fields):
+    """
+    Copy the report named by the environment variable canned_report_variable
+    to filename, or write empty_report when it is not set.
+    """
+    canned_report = os.environ.get(canned_report_variable)
+    if canned_report:
+        shutil.copyfile(canned_report, filename)
+        return
+    with open(filename, 'wb') as f:
+        f.write(empty_report.format(date=time.strftime('%Y-%m-%d %H:%M:%S'), **fields).encode('utf-8'))
+
+def pdf(title='Plot'):
+    """
+    A single page PDF.
+    """
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] >>',
+        b'<< /Title (' + title.encode('ascii', 'replace') + b') >>',
+    ]
+    data = b'%PDF-1.4\n'
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b'%d 0 obj ' % number + content + b' endobj\n'
+    xref = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    data += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    data += b'trailer << /Size %d /Root 1 0 R /Info 4 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return data
+
+SVG_HEADER = (u'<?xml version="1.0" standalone="no"?>\n'
+    u'<svg xmlns="http://www.w3.org/2000/svg" width="297mm" height="210mm" viewBox="0 0 297 210">\n'
+    u'<title>{}</title>\n')
+SVG_FOOTER = u'</svg>\n'
+
+def svg(title='Plot'):
+    return (SVG_HEADER.format(title) +
+        u'<g style="fill:#000000; stroke:#000000; stroke-width:0.15"><rect x="10" y="10" width="277" height="190"/></g>\n' +
+        SVG_FOOTER).encode('utf-8')
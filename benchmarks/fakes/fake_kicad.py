@@ -0,0 +1,279 @@
+#
+# Stand-ins for the eeschema and pcbnew executables, to benchmark the UI
+# automation without KiCad. They open windows with the titles the automation
+# waits for, react to the keys it types and use the clipboard like KiCad, and
+# write canned ERC and DRC reports and plot files. Every wait, key press and
+# clipboard transfer of a real run still happens, without the time KiCad
+# takes to start and to do the actual work.
+#
+# Environment variables:
+#
+#   FAKE_KICAD_DELAY       seconds to wait before showing each window, to
+#                          mimic a slow KiCad (default: 0)
+#   FAKE_KICAD_ERC_REPORT  ERC report to write instead of an empty one
+#   FAKE_KICAD_DRC_REPORT  DRC report to write instead of an empty one
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import os
+import time
+
+from collections import deque
+
+from Xlib import X, XK, Xatom
+from Xlib import display as xdisplay
+from Xlib.protocol import event as xevent
+
+from fake_files import EMPTY_DRC_REPORT, EMPTY_ERC_REPORT, pdf, svg, write_report
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DELAY = float(os.environ.get('FAKE_KICAD_DELAY', '0'))
+
+# The keys the automation types, other keys are ignored
+KEY_NAMES = ['Return', 'Tab', 'Escape', 'Home', 'Up', 'Down', 'space'] + \
+    [chr(c) for c in range(ord('a'), ord('z') + 1)]
+
+# Order of the formats in the eeschema plot dialog
+PLOT_FORMATS = ['ps', 'pdf', 'svg', 'dxf', 'hpgl']
+
+class TextField(object):
+    """
+    The text control of a dialog, as far as the automation edits it.
+    """
+
+    def __init__(self, text=u''):
+        self.text = text
+        self.cursor = len(text)
+        self.selected = False
+
+    def key(self, key, app):
+        if key == 'Home':
+            self.cursor = 0
+            self.selected = False
+        elif key == 'ctrl+a':
+            self.selected = True
+        elif key == 'ctrl+c':
+            app.copy(self.text)
+        elif key == 'ctrl+v':
+            text = app.paste()
+            if self.selected:
+                self.text = text
+                self.cursor = len(text)
+                self.selected = False
+            else:
+                self.text = self.text[:self.cursor] + text + self.text[self.cursor:]
+                self.cursor += len(text)
+
+class FakeApp(object):
+    """
+    A KiCad application: windows with a key handler each, the clipboard and
+    the event loop. Key handlers are called with the window and the key, as
+    a key sequence like the automation types it ('Return', 'ctrl+v').
+    """
+
+    def __init__(self):
+        self.display = xdisplay.Display()
+        self.root = self.display.screen().root
+        self.net_wm_name = self.display.intern_atom('_NET_WM_NAME')
+        self.utf8_string = self.display.intern_atom('UTF8_STRING')
+        self.clipboard = self.display.intern_atom('CLIPBOARD')
+        self.targets = self.display.intern_atom('TARGETS')
+        self.selection_property = self.display.intern_atom('FAKE_KICAD_SELECTION')
+        # Owns the clipboard and receives pasted data
+        self.selection_window = self.root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self.clipboard_text = None
+        self.handlers = {}
+        self.running = True
+        self._events = deque()
+        self._key_names = dict((XK.string_to_keysym(name), name) for name in KEY_NAMES)
+
+    def open_window(self, title, handler):
+        if DELAY:
+            time.sleep(DELAY)
+        window = self.root.create_window(0, 0, 640, 480, 0, X.CopyFromParent,
+            event_mask=X.KeyPressMask | X.StructureNotifyMask)
+        window.set_wm_name(title.encode('ascii', 'replace'))
+        window.change_property(self.net_wm_name, self.utf8_string, 8, title.encode('utf-8'))
+        window.map()
+        # Dialogs take the focus when they open
+        window.set_input_focus(X.RevertToParent, X.CurrentTime)
+        self.display.sync()
+        self.handlers[window.id] = handler
+        logger.info('Opened window %s', title)
+        return window
+
+    def close_window(self, window):
+        del self.handlers[window.id]
+        window.destroy()
+        self.display.sync()
+
+    def copy(self, text):
+        self.clipboard_text = text.encode('utf-8')
+        self.selection_window.set_selection_owner(self.clipboard, X.CurrentTime)
+        self.display.sync()
+
+    def paste(self, timeout=5):
+        self.selection_window.convert_selection(self.clipboard, self.utf8_string, self.selection_property,
+            X.CurrentTime)
+        self.display.flush()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            event = self.display.next_event()
+            if event.type == X.SelectionNotify and event.requestor.id == self.selection_window.id:
+                if event.property == X.NONE:
+                    return u''
+                prop = self.selection_window.get_full_property(self.selection_property, X.AnyPropertyType)
+                value = prop.value if prop is not None else b''
+                return value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+            elif event.type == X.SelectionRequest:
+                self._answer_selection_request(event)
+            else:
+                # Keys typed while waiting are handled after the paste
+                self._events.append(event)
+        return u''
+
+    def _answer_selection_request(self, request):
+        prop = request.property if request.property != X.NONE else request.target
+        if self.clipboard_text is None:
+            prop = X.NONE
+        elif request.target == self.targets:
+            request.requestor.change_property(prop, Xatom.ATOM, 32, [self.targets, self.utf8_string, Xatom.STRING])
+        elif request.target in (self.utf8_string, Xatom.STRING):
+            request.requestor.change_property(prop, request.target, 8, self.clipboard_text)
+        else:
+            prop = X.NONE
+        request.requestor.send_event(xevent.SelectionNotify(
+            time=request.time,
+            requestor=request.requestor,
+            selection=request.selection,
+            target=request.target,
+            property=prop))
+        self.display.flush()
+
+    def _key(self, event):
+        name = self._key_names.get(self.display.keycode_to_keysym(event.detail, 0))
+        if name is None:
+            return None
+        if event.state & X.Mod1Mask:
+            name = 'alt+' + name
+        if event.state & X.ControlMask:
+            name = 'ctrl+' + name
+        return name
+
+    def run(self):
+        while self.running:
+            event = self._events.popleft() if self._events else self.display.next_event()
+            if event.type == X.KeyPress:
+                handler = self.handlers.get(event.window.id)
+                key = self._key(event)
+                if handler is not None and key is not None:
+                    handler(event.window, key)
+            elif event.type == X.SelectionRequest:
+                self._answer_selection_request(event)
+            elif event.type == X.SelectionClear:
+                self.clipboard_text = None
+
+class FakeEeschema(FakeApp):
+    """
+    Runs the ERC (Inspect->Electrical Rules Checker) and plots (File->Plot)
+    the way the automation in eeschema/schematic.py drives them.
+    """
+
+    def __init__(self, schematic):
+        super(FakeEeschema, self).__init__()
+        self.schematic = os.path.abspath(schematic)
+        self.name = os.path.splitext(os.path.basename(self.schematic))[0]
+        self.menu = None
+        # The plot dialog remembers the last format, set_default_plot_option()
+        # makes that HPGL
+        self.plot_format = 'hpgl'
+        self.field = None
+        self.open_window(u'Eeschema \u2014 {} [{}]'.format(self.name, os.path.dirname(self.schematic)),
+            self.main_key)
+
+    def main_key(self, window, key):
+        if key in ('alt+i', 'alt+f'):
+            self.menu = key
+            return
+        menu, self.menu = self.menu, None
+        if menu == 'alt+i' and key == 'c':
+            self.open_window(u'Electrical Rules Checker', self.erc_key)
+        elif menu == 'alt+f' and key == 'l':
+            self.field = TextField()
+            self.open_window(u'Plot Schematic Options', self.plot_key)
+
+    def erc_key(self, window, key):
+        if key == 'Return':
+            self.field = TextField(u'{}.erc'.format(self.name))
+            self.open_window(u'ERC File', self.erc_file_key)
+        elif key == 'Escape':
+            self.close_window(window)
+
+    def erc_file_key(self, window, key):
+        if key == 'Return':
+            write_report(self.field.text, 'FAKE_KICAD_ERC_REPORT', EMPTY_ERC_REPORT)
+            self.close_window(window)
+        else:
+            self.field.key(key, self)
+
+    def plot_key(self, window, key):
+        if key in ('Up', 'Down'):
+            index = PLOT_FORMATS.index(self.plot_format) + (1 if key == 'Down' else -1)
+            self.plot_format = PLOT_FORMATS[min(max(index, 0), len(PLOT_FORMATS) - 1)]
+        elif key == 'Return':
+            output_file = os.path.join(self.field.text, '{}.{}'.format(self.name, self.plot_format))
+            with open(output_file, 'wb') as f:
+                f.write(svg(self.name) if self.plot_format == 'svg' else pdf(self.name))
+        elif key == 'Escape':
+            self.close_window(window)
+        else:
+            self.field.key(key, self)
+
+class FakePcbnew(FakeApp):
+    """
+    Runs the DRC (Inspect->DRC) the way pcbnew_automation/run_drc.py drives
+    it.
+    """
+
+    def __init__(self, board_file):
+        super(FakePcbnew, self).__init__()
+        self.board_file = os.path.abspath(board_file)
+        self.menu = None
+        self.field = None
+        self.open_window(u'Pcbnew \u2014 {}'.format(self.board_file), self.main_key)
+
+    def main_key(self, window, key):
+        if key == 'alt+i':
+            self.menu = key
+            return
+        menu, self.menu = self.menu, None
+        if menu == 'alt+i' and key == 'd':
+            self.field = TextField()
+            self.open_window(u'DRC Control', self.drc_key)
+
+    def drc_key(self, window, key):
+        if key == 'Return':
+            write_report(self.field.text, 'FAKE_KICAD_DRC_REPORT', EMPTY_DRC_REPORT, board=self.board_file)
+            self.close_window(window)
+            self.open_window(u'Disk File Report Completed', self.report_completed_key)
+        else:
+            self.field.key(key, self)
+
+    def report_completed_key(self, window, key):
+        if key == 'Return':
+            self.close_window(window)
@@ -0,0 +1,343 @@
+#
+# Fake pcbnew scripting module for the benchmarks, as far as pcb_util and
+# plot.py use it. Layouts are read with pcbnew_automation.kicad_pcb. Gerber
+# plots hold the tracks, pads, vias and zone fills of their layer and the
+# drill file the vias and pad holes, so the plots can be checked and
+# compared. The board outline is a rectangle around the copper, PDF and SVG
+# plots are a blank page.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import math
+import os
+import sys
+
+fakes_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repo_root = os.path.dirname(os.path.dirname(fakes_dir))
+
+sys.path.append(fakes_dir)
+sys.path.append(os.path.join(repo_root, 'src'))
+
+import fake_files
+from pcbnew_automation import kicad_pcb
+
+PLOT_FORMAT_HPGL = 0
+PLOT_FORMAT_GERBER = 1
+PLOT_FORMAT_POST = 2
+PLOT_FORMAT_DXF = 3
+PLOT_FORMAT_PDF = 4
+PLOT_FORMAT_SVG = 5
+
+_EXTENSIONS = {
+    PLOT_FORMAT_HPGL: 'plt',
+    PLOT_FORMAT_GERBER: 'gbr',
+    PLOT_FORMAT_POST: 'ps',
+    PLOT_FORMAT_DXF: 'dxf',
+    PLOT_FORMAT_PDF: 'pdf',
+    PLOT_FORMAT_SVG: 'svg',
+}
+
+UNDEFINED_LAYER = -1
+
+# Default layer colors, as RGBA with red in the low byte
+_LAYER_COLORS = {
+    kicad_pcb.F_Cu: 0xff0000c8,
+    kicad_pcb.B_Cu: 0xffc80000,
+    kicad_pcb.F_SilkS: 0xffc8c800,
+    kicad_pcb.B_SilkS: 0xffc800c8,
+    kicad_pcb.Edge_Cuts: 0xff00c8c8,
+}
+_DEFAULT_COLOR = 0xff848484
+
+def GetBuildVersion():
+    return '(5.0.1)-fake'
+
+def FromMM(mm):
+    return int(round(mm * 1e6))
+
+class wxPoint(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class COLOR4D(object):
+    def __init__(self, rgba):
+        self.rgba = rgba
+
+    def ToU32(self):
+        return self.rgba
+
+class _Colors(object):
+    def GetLayerColor(self, layer_id):
+        return COLOR4D(_LAYER_COLORS.get(layer_id, _DEFAULT_COLOR))
+
+class LSET(object):
+    def __init__(self, layer_ids):
+        self.layer_ids = set(layer_ids)
+
+    def UIOrder(self):
+        return [layer_id for layer_id in kicad_pcb.UI_ORDER if layer_id in self.layer_ids]
+
+class PCB_PLOT_PARAMS(object):
+    """
+    Plot options: every SetX(value) has a GetX().
+    """
+    NO_DRILL_SHAPE = 0
+    SMALL_DRILL_SHAPE = 1
+    FULL_DRILL_SHAPE = 2
+
+    def __init__(self, layer_selection):
+        self._values = {
+            'DrillMarksType': self.NO_DRILL_SHAPE,
+            'OutputDirectory': '',
+            'LayerSelection': LSET(layer_selection),
+        }
+
+    def __getattr__(self, name):
+        if name.startswith('Set'):
+            return lambda value: self._values.__setitem__(name[3:], value)
+        if name.startswith('Get'):
+            return lambda: self._values.get(name[3:])
+        raise AttributeError(name)
+
+class BOARD(object):
+    def __init__(self, board_file):
+        self.board_file = os.path.abspath(board_file)
+        self.model = kicad_pcb.load(board_file)
+        self.plot_options = PCB_PLOT_PARAMS(self.model.plot_layer_selection())
+
+    def GetFileName(self):
+        return self.board_file
+
+    def GetLayerName(self, layer_id):
+        return self.model.layer_name(layer_id)
+
+    def GetLayerID(self, layer_name):
+        try:
+            return self.model.layer_id(layer_name)
+        except KeyError:
+            return UNDEFINED_LAYER
+
+    def GetEnabledLayers(self):
+        return LSET(self.model.enabled_layers())
+
+    def GetPlotOptions(self):
+        return self.plot_options
+
+    def Colors(self):
+        return _Colors()
+
+def LoadBoard(board_file):
+    return BOARD(board_file)
+
+def _rotate(x, y, degrees):
+    # KiCad rotates counterclockwise on screen, with y pointing down
+    angle = math.radians(degrees)
+    return x * math.cos(angle) + y * math.sin(angle), -x * math.sin(angle) + y * math.cos(angle)
+
+def _pads(model):
+    """
+    Yields (position, size, shape, drill, layers) for the pads of the board.
+    """
+    for footprint in model.footprints:
+        for pad in footprint.pads:
+            if not pad.position:
+                continue
+            dx, dy = _rotate(pad.position[0], pad.position[1], footprint.rotation)
+            width, height = pad.size
+            angle = (pad.position[2] if len(pad.position) > 2 else 0) % 180
+            if angle == 90:
+                width, height = height, width
+            yield ((footprint.position[0] + dx, footprint.position[1] + dy), (width, height),
+                pad.shape, pad.drill, pad.layers)
+
+def _on_layer(layers, layer_name):
+    return layer_name in layers or ('*.Cu' in layers and layer_name.endswith('.Cu')) \
+        or ('*.Mask' in layers and layer_name.endswith('.Mask'))
+
+class _GerberWriter(object):
+    def __init__(self, f, function):
+        self.f = f
+        self.apertures = {}
+        f.write('G04 Fake pcbnew plot*\n%TF.FileFunction,{}*%\n%FSLAX46Y46*%\n%MOMM*%\n%LPD*%\nG01*\n'.format(function))
+
+    def aperture(self, template, *sizes):
+        key = (template,) + tuple(round(size, 6) for size in sizes)
+        if key not in self.apertures:
+            code = 10 + len(self.apertures)
+            self.apertures[key] = code
+            self.f.write('%ADD{}{},{}*%\n'.format(code, template, 'X'.join('{:.6f}'.format(s) for s in sizes)))
+        self.f.write('D{}*\n'.format(self.apertures[key]))
+
+    @staticmethod
+    def _xy(point):
+        return 'X{}Y{}'.format(int(round(point[0] * 1e6)), int(round(-point[1] * 1e6)))
+
+    def line(self, start, end):
+        self.f.write('{}D02*\n{}D01*\n'.format(self._xy(start), self._xy(end)))
+
+    def flash(self, point):
+        self.f.write('{}D03*\n'.format(self._xy(point)))
+
+    def region(self, points):
+        self.f.write('G36*\n{}D02*\n'.format(self._xy(points[0])))
+        for point in points[1:] + points[:1]:
+            self.f.write('{}D01*\n'.format(self._xy(point)))
+        self.f.write('G37*\n')
+
+    def close(self):
+        self.f.write('M02*\n')
+
+def _board_outline(model, margin=1.0):
+    xs = []
+    ys = []
+    for track in model.tracks:
+        xs.extend((track.start[0], track.end[0]))
+        ys.extend((track.start[1], track.end[1]))
+    for via in model.vias:
+        xs.append(via.position[0])
+        ys.append(via.position[1])
+    for position, size, _, _, _ in _pads(model):
+        xs.append(position[0])
+        ys.append(position[1])
+    for zone in model.zones:
+        xs.extend(zone.outline[0::2])
+        ys.extend(zone.outline[1::2])
+    if not xs:
+        return None
+    return (min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+
+def _plot_gerber(model, layer_id, filename):
+    layer_name = model.layer_name(layer_id)
+    copper = layer_name.endswith('.Cu')
+    if copper:
+        function = 'Copper,L{},{}'.format(1 if layer_id == kicad_pcb.F_Cu else layer_id + 1,
+            'Top' if layer_id == kicad_pcb.F_Cu else 'Bot' if layer_id == kicad_pcb.B_Cu else 'Inr')
+    elif layer_id == kicad_pcb.Edge_Cuts:
+        function = 'Profile,NP'
+    else:
+        function = 'Other,{}'.format(layer_name)
+    with open(filename, 'w') as f:
+        gerber = _GerberWriter(f, function)
+        if layer_id == kicad_pcb.Edge_Cuts:
+            outline = _board_outline(model)
+            if outline is not None:
+                gerber.aperture('C', 0.05)
+                x0, y0, x1, y1 = outline
+                corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+                for start, end in zip(corners, corners[1:] + corners[:1]):
+                    gerber.line(start, end)
+        for track in model.tracks.on_layer(layer_id):
+            gerber.aperture('C', track.width)
+            gerber.line(track.start, track.end)
+        if copper:
+            for via in model.vias:
+                if min(via.layers) <= layer_id <= max(via.layers):
+                    gerber.aperture('C', via.size)
+                    gerber.flash(via.position)
+        for position, size, shape, _, layers in _pads(model):
+            if not _on_layer(layers, layer_name):
+                continue
+            if shape == 'circle':
+                gerber.aperture('C', size[0])
+            elif shape == 'oval':
+                gerber.aperture('O', size[0], size[1])
+            else:
+                gerber.aperture('R', size[0], size[1])
+            gerber.flash(position)
+        for zone in model.zones:
+            if layer_id in zone.layers:
+                for polygon in zone.filled_polygons:
+                    points = list(zip(polygon[0::2], polygon[1::2]))
+                    if len(points) > 2:
+                        gerber.region(points)
+        gerber.close()
+
+class PLOT_CONTROLLER(object):
+    def __init__(self, board):
+        self.board = board
+        self.layer_id = None
+        self.plot_format = None
+        self.plot_file_name = None
+
+    def GetPlotOptions(self):
+        return self.board.plot_options
+
+    def SetColorMode(self, color_mode):
+        pass
+
+    def SetLayer(self, layer_id):
+        self.layer_id = layer_id
+
+    def OpenPlotfile(self, suffix, plot_format, sheet_description):
+        name = os.path.splitext(os.path.basename(self.board.board_file))[0]
+        self.plot_format = plot_format
+        self.plot_file_name = os.path.join(self.board.plot_options.GetOutputDirectory(),
+            '{}-{}.{}'.format(name, suffix.replace('.', '_'), _EXTENSIONS[plot_format]))
+        return True
+
+    def GetPlotFileName(self):
+        return self.plot_file_name
+
+    def PlotLayer(self):
+        layer_name = self.board.GetLayerName(self.layer_id)
+        if self.plot_format == PLOT_FORMAT_GERBER:
+            _plot_gerber(self.board.model, self.layer_id, self.plot_file_name)
+        else:
+            with open(self.plot_file_name, 'wb') as f:
+                f.write(fake_files.svg(layer_name) if self.plot_format == PLOT_FORMAT_SVG
+                    else fake_files.pdf(layer_name))
+        return True
+
+    def ClosePlot(self):
+        pass
+
+class EXCELLON_WRITER(object):
+    def __init__(self, board):
+        self.board = board
+
+    def SetOptions(self, mirror, minimal_header, offset, merge_npth):
+        pass
+
+    def SetFormat(self, metric, *args):
+        pass
+
+    def SetMapFileFormat(self, plot_format):
+        pass
+
+    def CreateDrillandMapFilesSet(self, directory, generate_drill, generate_map):
+        model = self.board.model
+        name = os.path.splitext(os.path.basename(self.board.board_file))[0]
+        holes = [(via.position, via.drill) for via in model.vias if via.drill]
+        holes.extend((position, drill) for position, _, _, drill, _ in _pads(model) if drill)
+        # Like pcbnew, nothing is written for boards without holes
+        if not holes:
+            return
+        if generate_drill:
+            tools = sorted(set(drill for _, drill in holes))
+            with open(os.path.join(directory, '{}.drl'.format(name)), 'w') as f:
+                f.write('M48\nMETRIC,TZ\n')
+                for number, drill in enumerate(tools, 1):
+                    f.write('T{}C{:.3f}\n'.format(number, drill))
+                f.write('%\nG90\nG05\n')
+                for number, drill in enumerate(tools, 1):
+                    f.write('T{}\n'.format(number))
+                    for position, hole_drill in holes:
+                        if hole_drill == drill:
+                            f.write('X{:.3f}Y{:.3f}\n'.format(position[0], -position[1]))
+                f.write('T0\nM30\n')
+        if generate_map:
+            with open(os.path.join(directory, '{}-drl_map.pdf'.format(name)), 'wb') as f:
+                f.write(fake_files.pdf('Drill map'))
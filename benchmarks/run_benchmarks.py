@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#
+# Benchmarks of the automation scripts. Every stage runs a script like CI
+# does, and its wall time, the CPU time of the script and everything it
+# started, and the number of processes forked while it ran are measured.
+#
+# With --kicad fake the eeschema and pcbnew executables and the pcbnew module
+# are replaced by the stand-ins in fakes/. They behave like KiCad towards the
+# automation but take no time to start or to do the work, so the timings show
+# the overhead of the automation itself: waiting for windows and files,
+# typing keys and using the clipboard. With --kicad real the installed KiCad
+# is used.
+#
+#   run_benchmarks.py --repeat 5 --output before.json
+#   run_benchmarks.py --repeat 5 --compare before.json
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import OrderedDict
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(benchmarks_dir)
+src_dir = os.path.join(repo_root, 'src')
+fakes_dir = os.path.join(benchmarks_dir, 'fakes')
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KICAD_FAKE = 'fake'
+KICAD_REAL = 'real'
+
+DEFAULT_PROJECT = os.path.join(repo_root, 'test-projects', 'good-project')
+
+def _schematic_command(*args):
+    return [sys.executable, os.path.join(src_dir, 'eeschema', 'schematic.py')] + list(args)
+
+def _pcbnew_command(script, *args):
+    return [sys.executable, os.path.join(src_dir, 'pcbnew_automation', script)] + list(args)
+
+# The command of every stage, from the schematic, layout and output directory
+STAGES = OrderedDict([
+    ('eeschema_run_erc', lambda schematic, board, output_dir:
+        _schematic_command('run_erc', schematic, output_dir)),
+    ('eeschema_export_schematic', lambda schematic, board, output_dir:
+        _schematic_command('export', '--file_format', 'pdf', schematic, output_dir)),
+    ('run_drc', lambda schematic, board, output_dir:
+        _pcbnew_command('run_drc.py', board, output_dir)),
+    ('plot', lambda schematic, board, output_dir:
+        _pcbnew_command('plot.py', board, output_dir)),
+])
+
+def fork_count():
+    """
+    The number of processes forked on the system since it booted, None when
+    /proc is not available. Other processes on the machine add to it too.
+    """
+    try:
+        with open('/proc/stat') as f:
+            for line in f:
+                if line.startswith('processes '):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+def stage_environment(kicad):
+    env = dict(os.environ)
+    if kicad == KICAD_FAKE:
+        env['PATH'] = fakes_dir + os.pathsep + env.get('PATH', '')
+        python_path = [os.path.join(fakes_dir, 'python')]
+        if env.get('PYTHONPATH'):
+            python_path.append(env['PYTHONPATH'])
+        env['PYTHONPATH'] = os.pathsep.join(python_path)
+    return env
+
+def run_stage(command, env, log_file):
+    """
+    Run a stage and return its measurements.
+    """
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    forks_before = fork_count()
+    start = time.time()
+    with open(log_file, 'wb') as log:
+        returncode = subprocess.call(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wall = time.time() - start
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    forks = fork_count()
+    # Only includes the processes the stage waited for, which are all of
+    # them unless it leaves processes behind
+    user = usage.ru_utime - usage_before.ru_utime
+    system = usage.ru_stime - usage_before.ru_stime
+    return {
+        'returncode': returncode,
+        'wall': round(wall, 4),
+        'user': round(user, 4),
+        'system': round(system, 4),
+        'cpu': round(user + system, 4),
+        'forks': forks - forks_before if forks is not None and forks_before is not None else None,
+    }
+
+def _median(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def summarize(runs):
+    summary = OrderedDict()
+    for stage in STAGES:
+        stage_runs = [run for run in runs if run['stage'] == stage]
+        if not stage_runs:
+            continue
+        summary[stage] = {
+            'runs': len(stage_runs),
+            'failed': len([run for run in stage_runs if run['returncode'] != 0]),
+            'wall': _median(run['wall'] for run in stage_runs),
+            'wall_min': min(run['wall'] for run in stage_runs),
+            'cpu': _median(run['cpu'] for run in stage_runs),
+            'forks': _median(run['forks'] for run in stage_runs),
+        }
+    return summary
+
+def _format(value, unit=''):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '{:.3f}{}'.format(value, unit) if unit else '{:g}'.format(value)
+    return '{}{}'.format(value, unit)
+
+def _change(value, reference):
+    if value is None or not reference:
+        return ''
+    return ' ({:+.0%})'.format(float(value) / reference - 1)
+
+def log_summary(summary, reference=None):
+    logger.info('{:<28}{:>6}{:>22}{:>22}{:>14}'.format('stage', 'runs', 'wall (median)', 'cpu (median)', 'forks'))
+    for stage, results in summary.items():
+        before = reference.get(stage, {}) if reference else {}
+        logger.info('{:<28}{:>6}{:>22}{:>22}{:>14}{}'.format(
+            stage,
+            results['runs'],
+            _format(results['wall'], ' s') + _change(results['wall'], before.get('wall')),
+            _format(results['cpu'], ' s') + _change(results['cpu'], before.get('cpu')),
+            _format(results['forks']),
+            '  {} failed'.format(results['failed']) if results['failed'] else ''))
+
+def project_files(project):
+    """
+    The schematic and layout of a project directory, named after it.
+    """
+    name = os.path.basename(os.path.normpath(project))
+    return os.path.join(project, name + '.sch'), os.path.join(project, name + '.kicad_pcb')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the KiCad automation scripts')
+
+    parser.add_argument('--kicad', help='Run the stages with the fake KiCad stand-ins or the installed KiCad',
+        choices=[KICAD_FAKE, KICAD_REAL],
+        default=KICAD_FAKE
+    )
+    parser.add_argument('--project', help='KiCad project directory (default: test-projects/good-project)',
+        default=DEFAULT_PROJECT
+    )
+    parser.add_argument('--stage', '-s', help='Stage to run, can be given multiple times (default: all)',
+        choices=list(STAGES),
+        action='append',
+        dest='stages'
+    )
+    parser.add_argument('--repeat', '-r', help='Number of runs of every stage',
+        type=int,
+        default=3
+    )
+    parser.add_argument('--fake_delay', help='Seconds the fake KiCad waits before showing a window',
+        type=float,
+        default=0
+    )
+    parser.add_argument('--output', '-o', help='Write the measurements to this JSON file')
+    parser.add_argument('--compare', help='Show the changes relative to the measurements in this JSON file')
+    parser.add_argument('--work_dir', help='Directory for the stage outputs and logs, kept after the run')
+
+    args = parser.parse_args()
+
+    schematic, board = project_files(os.path.abspath(args.project))
+    stages = args.stages or list(STAGES)
+    env = stage_environment(args.kicad)
+    if args.kicad == KICAD_FAKE:
+        env['FAKE_KICAD_DELAY'] = str(args.fake_delay)
+
+    reference = None
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)['summary']
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='kicad-automation-benchmarks-')
+    runs = []
+    try:
+        for run in range(args.repeat):
+            for stage in stages:
+                output_dir = os.path.join(work_dir, '{}-{}'.format(stage, run))
+                os.makedirs(output_dir)
+                command = STAGES[stage](schematic, board, output_dir)
+                result = run_stage(command, env, output_dir + '.log')
+                result['stage'] = stage
+                result['run'] = run
+                runs.append(result)
+                logger.info('{} run {}: {:.3f} s wall, {:.3f} s cpu, {} forks{}'.format(stage, run,
+                    result['wall'], result['cpu'], _format(result['forks']),
+                    ', failed with {}{}'.format(result['returncode'],
+                        ', see {}.log'.format(output_dir) if args.work_dir else '')
+                    if result['returncode'] != 0 else ''))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    log_summary(summary, reference)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'kicad': args.kicad,
+                'project': os.path.abspath(args.project),
+                'python': platform.python_version(),
+                'fake_delay': args.fake_delay if args.kicad == KICAD_FAKE else None,
+                'runs': runs,
+                'summary': summary,
+            }, f, indent=2)
+
+    exit(1 if any(results['failed'] for results in summary.values()) else 0)
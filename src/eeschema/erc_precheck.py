@@ -0,0 +1,288 @@
+#
+# Electrical rules checks that only need the schematic files: duplicate or
+# missing annotations (errors), unconnected pins and power inputs that are not
+# driven (warnings, like in the eeschema ERC). They find the common ERC
+# failures in milliseconds, without starting eeschema. The checks are
+# conservative, the eeschema ERC remains the reference for schematics that
+# pass them.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import os
+
+from collections import namedtuple
+
+from eeschema import sch_parser
+from util.report_writers import JunitXmlWriter, JsonReportWriter
+
+logger = logging.getLogger(__name__)
+
+# ERC error codes as used in the eeschema ERC report
+ERCE_UNSPECIFIED = 0
+ERCE_PIN_NOT_CONNECTED = 2
+ERCE_PIN_NOT_DRIVEN = 3
+
+ERROR_MESSAGES = {
+    ERCE_UNSPECIFIED: 'Annotation error',
+    ERCE_PIN_NOT_CONNECTED: 'Pin not connected (use a "no connection" flag to suppress this error)',
+    ERCE_PIN_NOT_DRIVEN: 'Pin connected to other pins, but not driven by any pin',
+}
+
+ELECTRICAL_TYPES = {
+    'I': 'Input',
+    'O': 'Output',
+    'B': 'BiDi',
+    'T': '3State',
+    'P': 'Passive',
+    'U': 'Unspecified',
+    'W': 'Power input',
+    'w': 'Power output',
+    'C': 'Open collector',
+    'E': 'Open emitter',
+    'N': 'Not connected',
+}
+
+# Sheet coordinates are in mils, reports use mm
+MM_PER_MIL = 0.0254
+
+SEVERITY_ERROR = 'error'
+SEVERITY_WARNING = 'warning'
+
+ErcIssue = namedtuple('ErcIssue', ['sheet', 'error_type', 'severity', 'message', 'position'])
+
+def _location(issue):
+    return '@({:.2f} mm, {:.2f} mm): {}'.format(
+        issue.position[0] * MM_PER_MIL, issue.position[1] * MM_PER_MIL, issue.message)
+
+class _UnionFind(object):
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent
+        root = item
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[item] != root:
+            parent[item], item = root, parent[item]
+        return root
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a != b:
+            self.parent[a] = b
+
+def _on_segment(point, start, end):
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    if (x2 - x1) * (y - y1) != (y2 - y1) * (x - x1):
+        return False
+    return min(x1, x2) <= x <= max(x1, x2) and min(y1, y2) <= y <= max(y1, y2)
+
+def _is_hidden(pin):
+    return pin.shape.startswith('N')
+
+PlacedPin = namedtuple('PlacedPin', ['sheet', 'reference', 'pin', 'position', 'node'])
+
+def _check_annotation(instances):
+    issues = []
+    units = {}
+    for instance in instances:
+        sheet, component = instance.sheet, instance.component
+        reference, unit = component.instance(sheet.path)
+        if reference.endswith('?'):
+            issues.append(ErcIssue(sheet.name_path, ERCE_UNSPECIFIED, SEVERITY_ERROR,
+                'Item not annotated: {}'.format(reference), component.position))
+            continue
+        key = (reference, unit)
+        if key in units:
+            issues.append(ErcIssue(sheet.name_path, ERCE_UNSPECIFIED, SEVERITY_ERROR,
+                'Duplicate reference {} (unit {})'.format(reference, unit), component.position))
+        units[key] = component
+    return issues
+
+_ComponentInSheet = namedtuple('_ComponentInSheet', ['sheet', 'component'])
+
+def precheck(schematic_file):
+    """
+    Run the checks on a schematic hierarchy. Returns a list of ErcIssue.
+    Needs the project's -cache.lib for the symbol pins.
+    """
+    library_file = sch_parser.cache_library_file(schematic_file)
+    if not os.path.isfile(library_file):
+        logger.warning('No symbol cache {}, only checking annotation'.format(library_file))
+        library = None
+    else:
+        library = sch_parser.load_library(library_file)
+
+    sheets = list(sch_parser.walk_hierarchy(schematic_file))
+    instances = [_ComponentInSheet(sheet, component)
+        for sheet in sheets for component in sheet.schematic.components]
+
+    issues = _check_annotation(instances)
+    if library is None:
+        return issues
+
+    nets = _UnionFind()
+    pins = []
+    no_connects = set()
+    has_buses = False
+    for sheet in sheets:
+        schematic = sheet.schematic
+        # Every item is connected to the point it is placed on, wires
+        # connect all points on them
+        points = set()
+        points.update(wire.start for wire in schematic.wires)
+        points.update(wire.end for wire in schematic.wires)
+        points.update(schematic.junctions)
+        points.update(label.position for label in schematic.labels)
+
+        for component in schematic.components:
+            symbol = sch_parser.lib_symbol(library, component.lib_id)
+            if symbol is None:
+                logger.warning('Symbol {} not found in {}'.format(component.lib_id, library_file))
+                continue
+            reference, unit = component.instance(sheet.path)
+            for pin in symbol.unit_pins(unit, component.convert):
+                position = component.pin_position(pin)
+                node = ('pin', sheet.path, reference, pin.number, len(pins))
+                pins.append(PlacedPin(sheet, reference, pin, position, node))
+                points.add(position)
+                nets.union(node, (sheet.path, position))
+                if _is_hidden(pin) and pin.electrical_type == 'W':
+                    # Hidden power inputs connect to the net with their name
+                    nets.union(node, ('global', pin.name))
+
+        for position in schematic.no_connects:
+            no_connects.add((sheet.path, position))
+
+        for label in schematic.labels:
+            if label.kind == 'label':
+                nets.union((sheet.path, label.position), ('local', sheet.path, label.text))
+            elif label.kind == 'glabel':
+                nets.union((sheet.path, label.position), ('global', label.text))
+            elif label.kind == 'hlabel':
+                nets.union((sheet.path, label.position), ('hier', sheet.path, label.text))
+
+        for sub_sheet in schematic.sheets:
+            sub_sheet_path = sheet.path + sub_sheet.timestamp + '/'
+            for sheet_pin in sub_sheet.pins:
+                points.add(sheet_pin.position)
+                nets.union((sheet.path, sheet_pin.position), ('hier', sub_sheet_path, sheet_pin.name))
+
+        # Wires are almost always horizontal or vertical, so only the points
+        # with the same x or y coordinate have to be tested
+        points_by_x = {}
+        points_by_y = {}
+        for point in points:
+            points_by_x.setdefault(point[0], []).append(point)
+            points_by_y.setdefault(point[1], []).append(point)
+
+        for wire in schematic.wires:
+            if wire.kind != 'wire':
+                has_buses = has_buses or wire.kind == 'bus'
+                continue
+            if wire.start[0] == wire.end[0]:
+                candidates = points_by_x[wire.start[0]]
+            elif wire.start[1] == wire.end[1]:
+                candidates = points_by_y[wire.start[1]]
+            else:
+                candidates = points
+            for point in candidates:
+                if _on_segment(point, wire.start, wire.end):
+                    nets.union((sheet.path, point), (sheet.path, wire.start))
+
+    pins_by_net = {}
+    for placed_pin in pins:
+        pins_by_net.setdefault(nets.find(placed_pin.node), []).append(placed_pin)
+
+    for net_pins in pins_by_net.values():
+        for placed_pin in net_pins:
+            pin = placed_pin.pin
+            if len(net_pins) == 1 and pin.electrical_type != 'N' and not _is_hidden(pin) \
+                    and (placed_pin.sheet.path, placed_pin.position) not in no_connects:
+                issues.append(ErcIssue(placed_pin.sheet.name_path, ERCE_PIN_NOT_CONNECTED, SEVERITY_WARNING,
+                    'Pin {} ({}) of component {} is unconnected.'.format(
+                        pin.number, ELECTRICAL_TYPES.get(pin.electrical_type, pin.electrical_type),
+                        placed_pin.reference),
+                    placed_pin.position))
+
+        # Nets through buses are not followed, so drivers could be missed
+        if has_buses:
+            continue
+        if any(p.pin.electrical_type == 'w' for p in net_pins):
+            continue
+        for placed_pin in net_pins:
+            if placed_pin.pin.electrical_type == 'W' and len(net_pins) > 1:
+                issues.append(ErcIssue(placed_pin.sheet.name_path, ERCE_PIN_NOT_DRIVEN, SEVERITY_WARNING,
+                    'Pin {} (Power input) of component {} is not driven.'.format(
+                        placed_pin.pin.number, placed_pin.reference),
+                    placed_pin.position))
+                break
+
+    issues.sort(key=lambda issue: (issue.sheet, issue.error_type, issue.position))
+    return issues
+
+def write_reports(issues, sheets, output_dir, generate_junit_xml=False, generate_json=False):
+    """
+    Write the issues to junit.xml, with a test suite per sheet like
+    eeschema_parse_erc, and to erc.json in output_dir.
+    """
+    if generate_junit_xml:
+        with JunitXmlWriter(os.path.join(output_dir, 'junit.xml')) as junit:
+            for sheet in sheets:
+                junit.start_suite('ERC {}'.format(sheet))
+                for issue in issues:
+                    if issue.sheet == sheet:
+                        junit.add_case('ERC rule {}'.format(issue.error_type), sheet,
+                            failure_message=ERROR_MESSAGES[issue.error_type] + ' ' + _location(issue),
+                            failure_type=str(issue.error_type))
+
+    if generate_json:
+        json_writer = JsonReportWriter(os.path.join(output_dir, 'erc.json'))
+        for issue in issues:
+            json_writer.add({
+                'sheet': issue.sheet,
+                'rule': issue.error_type,
+                'message': ERROR_MESSAGES[issue.error_type],
+                'location': _location(issue),
+                'position': [round(issue.position[0] * MM_PER_MIL, 2), round(issue.position[1] * MM_PER_MIL, 2)],
+                'item': issue.message,
+            })
+        json_writer.close({
+            'errors': len([issue for issue in issues if issue.severity == SEVERITY_ERROR]),
+            'warnings': len([issue for issue in issues if issue.severity == SEVERITY_WARNING]),
+            'sheets': sheets,
+            'precheck': True,
+        })
+
+def run_precheck(schematic_file, output_dir, warning_as_error=False, generate_junit_xml=False,
+        generate_json=False):
+    """
+    Returns the number of errors found, counting warnings too when
+    warning_as_error is set. When that is not 0 the schematic fails ERC, and
+    the issues are written to junit.xml and erc.json in output_dir as
+    requested.
+    """
+    issues = precheck(schematic_file)
+    for issue in issues:
+        logger.info('Pre-ERC {}: {} {}'.format(issue.severity, issue.sheet, _location(issue)))
+    if not warning_as_error:
+        issues = [issue for issue in issues if issue.severity == SEVERITY_ERROR]
+    if issues:
+        sheets = [sheet.name_path for sheet in sch_parser.walk_hierarchy(schematic_file)]
+        write_reports(issues, sheets, output_dir, generate_junit_xml, generate_json)
+    return len(issues)
@@ -0,0 +1,120 @@
+#
+# Streaming parser for the ERC report written by eeschema:
+#
+#   ***** Sheet /
+#   ErrType(2): Pin not connected (use a "no connection" flag to suppress this error)
+#       @(78.74 mm, 90.80 mm): Pin 2 (Passive) of component R1 is unconnected.
+#
+#    ** ERC messages: 1  Errors 0  Warnings 1
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import re
+
+from collections import namedtuple
+
+from util import baseline
+
+logger = logging.getLogger(__name__)
+
+class ErcReportError(Exception):
+    pass
+
+_SHEET_RE = re.compile(r'^\*\*\*\*\* Sheet (.+)$')
+_ERROR_RE = re.compile(r'^ErrType\(([0-9]+)\): (.+)$')
+_LOCATION_RE = re.compile(r'^\s+@\(\s*(-?[0-9.]+) *(\w*), *(-?[0-9.]+) *(\w*)\): *(.*)$')
+_SUMMARY_RE = re.compile(r'^ \*\* ERC messages: ([0-9]+) +Errors ([0-9]+) +Warnings ([0-9]+)+$')
+
+ErcViolation = namedtuple('ErcViolation', ['sheet', 'rule', 'message', 'location', 'position', 'item'])
+
+def fingerprint(violation):
+    """
+    Baseline fingerprint of a violation, without its position.
+    """
+    return baseline.fingerprint('erc', violation.sheet, violation.rule, violation.message, violation.item)
+
+class ErcReport(object):
+    """
+    Iterate over an ErcReport to get the violations of a report, as
+    ErcViolation records, while the file is read. The sheets and counts are
+    available once the iteration is done:
+
+        report = ErcReport(f)
+        for violation in report:
+            ...
+        report.errors
+    """
+
+    def __init__(self, lines, name='ERC report'):
+        self.lines = lines
+        self.name = name
+        self.sheets = []
+        self.rule_counts = {}
+        self.violations = 0
+        self.messages = None
+        self.errors = None
+        self.warnings = None
+
+    def __iter__(self):
+        sheet = None
+        error = None
+        line_number = 0
+        for line_number, line in enumerate(self.lines, 1):
+            line = line.rstrip('\r\n')
+            if error is not None:
+                rule, message = error
+                error = None
+                match = _LOCATION_RE.match(line)
+                if match:
+                    self.violations += 1
+                    self.rule_counts[rule] = self.rule_counts.get(rule, 0) + 1
+                    yield ErcViolation(sheet, rule, message, line.strip(),
+                        (float(match.group(1)), float(match.group(3))), match.group(5))
+                    continue
+                logger.error('Did not find location on line {}: {}'.format(line_number, line))
+
+            if line.startswith('ErrType'):
+                match = _ERROR_RE.match(line)
+                if match:
+                    error = (int(match.group(1)), match.group(2))
+            elif line.startswith('*****'):
+                match = _SHEET_RE.match(line)
+                if match:
+                    sheet = match.group(1)
+                    self.sheets.append(sheet)
+            elif line.startswith(' **'):
+                match = _SUMMARY_RE.match(line)
+                if match:
+                    self.messages, self.errors, self.warnings = (int(g) for g in match.groups())
+
+        if line_number == 0:
+            raise ErcReportError('{} is empty'.format(self.name))
+        if self.errors is None:
+            raise ErcReportError('No ERC summary found in {}'.format(self.name))
+
+    def error_count(self, warning_as_error=False):
+        if warning_as_error:
+            return self.errors + self.warnings
+        return self.errors
+
+    def summary(self):
+        return {
+            'messages': self.messages,
+            'errors': self.errors,
+            'warnings': self.warnings,
+            'sheets': self.sheets,
+            'rules': dict((str(rule), count) for rule, count in self.rule_counts.items()),
+        }
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 #   Copyright 2015-2016 Scott Bezek and the splitflap contributors
+#   Copyright 2019 Productize SPRL
 #
 #   Licensed under the Apache License, Version 2.0 (the "License");
 #   you may not use this file except in compliance with the License.
@@ -14,69 +15,114 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import argparse
+import csv
+import io
+import json
 import logging
 import os
-import subprocess
+import re
 import sys
-import time
 
-from contextlib import contextmanager
+eeschema_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(eeschema_dir)
 
-electronics_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-repo_root = os.path.dirname(electronics_root)
 sys.path.append(repo_root)
 
+from eeschema import sch_parser
 from util import file_util
-from ui_automation import (
-    PopenContext,
-    xdotool,
-    wait_for_window,
-    recorded_xvfb,
-)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def eeschema_export_bom(output_directory):
-    wait_for_window('eeschema', '\[')
-
-    logger.info('Focus main eeschema window')
-    xdotool(['search', '--name', '\[', 'windowfocus'])
-
-    logger.info('Open Tools->Generate Bill Of Materials')
-    xdotool(['key', 'alt+t'])
-    xdotool(['key', 'm'])
-
-    logger.info('Run generate')
-    wait_for_window('plot', 'Bill of Material')
-    xdotool(['search', '--name', 'Bill of Material', 'windowfocus'])
-    xdotool(['key', 'Return'])
-
-    logger.info('Wait before shutdown')
-    time.sleep(2)
-
-def export_bom():
-    schematic_file = os.path.join(electronics_root, 'splitflap.sch')
-    output_dir = os.path.join(electronics_root, 'build')
+BOM_FORMATS = ['csv', 'json']
+
+BOM_COLUMNS = ['References', 'Quantity', 'Value', 'Footprint', 'Datasheet', 'Symbol']
+
+def _natural_key(reference):
+    # R2 sorts before R10
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', reference)]
+
+def bom_groups(schematic):
+    """
+    Group the components of a schematic hierarchy by symbol, value, footprint
+    and user fields. Power symbols and other references starting with '#' are
+    left out, units of the same component are counted once.
+    """
+    components = {}
+    for instance in sch_parser.component_instances(schematic):
+        if instance.reference.startswith('#'):
+            continue
+        # The first unit found provides the fields
+        components.setdefault(instance.reference, instance.component)
+
+    groups = {}
+    for reference, component in components.items():
+        user_fields = tuple((field.name, field.text) for field in component.user_fields() if field.text)
+        key = (component.lib_id, component.value, component.footprint, component.datasheet, user_fields)
+        groups.setdefault(key, []).append(reference)
+
+    bom = []
+    for (lib_id, value, footprint, datasheet, user_fields), references in groups.items():
+        references.sort(key=_natural_key)
+        bom.append({
+            'references': references,
+            'quantity': len(references),
+            'value': value,
+            'footprint': footprint,
+            'datasheet': datasheet,
+            'symbol': lib_id,
+            'fields': dict(user_fields),
+        })
+    bom.sort(key=lambda group: _natural_key(group['references'][0]))
+    return bom
+
+def write_bom_csv(bom, output_file):
+    field_names = sorted(set(name for group in bom for name in group['fields']))
+    rows = [BOM_COLUMNS + field_names]
+    for group in bom:
+        rows.append([' '.join(group['references']), str(group['quantity']), group['value'],
+            group['footprint'], group['datasheet'], group['symbol']]
+            + [group['fields'].get(name, '') for name in field_names])
+
+    if sys.version_info[0] < 3:
+        with open(output_file, 'wb') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow([cell.encode('utf-8') for cell in row])
+    else:
+        with io.open(output_file, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+def write_bom_json(bom, output_file):
+    with open(output_file, 'w') as f:
+        json.dump(bom, f, indent=2, sort_keys=True)
+
+def export_bom(schematic, output_dir, file_format='csv'):
+    """
+    Write the grouped BOM of a schematic to output_dir, without eeschema.
+    Returns the output file.
+    """
     file_util.mkdir_p(output_dir)
+    output_file = os.path.join(output_dir,
+        os.path.splitext(os.path.basename(schematic))[0] + '-bom.' + file_format)
 
-    screencast_output_file = os.path.join(output_dir, 'export_bom_screencast.ogv')
-
-    with recorded_xvfb(screencast_output_file, width=800, height=600, colordepth=24):
-        with PopenContext(['eeschema', schematic_file], close_fds=True) as eeschema_proc:
-            eeschema_export_bom(output_dir)
-            eeschema_proc.terminate()
-
-    logger.info('Convert component XML to useful BOM CSV file...')
-    subprocess.check_call([
-        'python',
-        '-u',
-        os.path.join(electronics_root, 'bom', 'generate_bom_csv.py'),
-        os.path.join(electronics_root, 'splitflap.xml'),
-        os.path.join(output_dir, 'bom.csv'),
-    ])
-
+    bom = bom_groups(schematic)
+    if file_format == 'json':
+        write_bom_json(bom, output_file)
+    else:
+        write_bom_csv(bom, output_file)
+    logger.info('Wrote {} BOM lines to {}'.format(len(bom), output_file))
+    return output_file
 
 if __name__ == '__main__':
-    export_bom()
-
+    parser = argparse.ArgumentParser(description='Export the bill of materials of a KiCad schematic')
+    parser.add_argument('schematic', help='KiCad schematic file')
+    parser.add_argument('output_dir', help='output directory')
+    parser.add_argument('--file_format', '-f', help='BOM file format',
+        choices=BOM_FORMATS,
+        default='csv'
+    )
+    args = parser.parse_args()
+
+    export_bom(os.path.abspath(args.schematic), os.path.abspath(args.output_dir), args.file_format)
@@ -0,0 +1,372 @@
+#
+# Parser for the legacy eeschema file formats (KiCad 5 and earlier): the
+# .sch schematic sheets and the -cache.lib symbol library. Reading the files
+# directly is a lot faster than opening them in eeschema to get at the
+# symbol fields, and doesn't need a display.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import logging
+import os
+import re
+
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+class ParseError(Exception):
+    pass
+
+_STRING = r'"((?:[^"\\]|\\.)*)"'
+_FIELD_RE = re.compile(r'^F\s+(\d+)\s+' + _STRING + r'(.*?)(?:\s+' + _STRING + r')?\s*$')
+_SHEET_FIELD_RE = re.compile(r'^F(\d+)\s+' + _STRING + r'\s*(.*)$')
+_AR_RE = re.compile(r'^AR\s+Path="([^"]*)"\s+Ref="([^"]*)"\s+Part="(\d+)"')
+_ESCAPE_RE = re.compile(r'\\(.)')
+
+def _unquote(text):
+    return _ESCAPE_RE.sub(r'\1', text)
+
+Field = namedtuple('Field', ['number', 'text', 'name'])
+Wire = namedtuple('Wire', ['kind', 'start', 'end'])
+Label = namedtuple('Label', ['kind', 'text', 'position', 'orientation', 'shape'])
+SheetPin = namedtuple('SheetPin', ['name', 'shape', 'side', 'position'])
+LibPin = namedtuple('LibPin', ['name', 'number', 'position', 'length', 'orientation',
+    'unit', 'convert', 'electrical_type', 'shape'])
+
+# Names of the fixed component fields
+FIELD_NAMES = ['Reference', 'Value', 'Footprint', 'Datasheet']
+
+class Component(object):
+    __slots__ = ['lib_id', 'reference', 'unit', 'convert', 'timestamp', 'position',
+        'fields', 'matrix', 'references']
+
+    def __init__(self):
+        self.lib_id = None
+        self.reference = None
+        self.unit = 1
+        self.convert = 1
+        self.timestamp = None
+        self.position = (0, 0)
+        self.fields = []
+        # Orientation matrix, maps symbol to sheet coordinates
+        self.matrix = (1, 0, 0, -1)
+        # Reference and unit per sheet path, for multiple instances of a sheet
+        self.references = {}
+
+    def field(self, name, default=''):
+        for field in self.fields:
+            if field.name == name:
+                return field.text
+        return default
+
+    @property
+    def value(self):
+        return self.field('Value')
+
+    @property
+    def footprint(self):
+        return self.field('Footprint')
+
+    @property
+    def datasheet(self):
+        return self.field('Datasheet')
+
+    def user_fields(self):
+        return [field for field in self.fields if field.number >= len(FIELD_NAMES)]
+
+    def instance(self, sheet_path):
+        """
+        Reference and unit of this component in the instance of its sheet
+        with the given path, e.g. '/5CA326B7/'.
+        """
+        return self.references.get(sheet_path + self.timestamp, (self.reference, self.unit))
+
+    def pin_position(self, pin):
+        """
+        Position of a library pin of this component on the sheet.
+        """
+        # Library coordinates have y pointing up, the default matrix flips it
+        a, b, c, d = self.matrix
+        x, y = pin.position
+        return (self.position[0] + a * x + b * y, self.position[1] + c * x + d * y)
+
+    def __repr__(self):
+        return 'Component({}, {})'.format(self.reference, self.lib_id)
+
+class Sheet(object):
+    __slots__ = ['name', 'file_name', 'timestamp', 'position', 'size', 'pins']
+
+    def __init__(self):
+        self.name = None
+        self.file_name = None
+        self.timestamp = None
+        self.position = (0, 0)
+        self.size = (0, 0)
+        self.pins = []
+
+    def __repr__(self):
+        return 'Sheet({}, {})'.format(self.name, self.file_name)
+
+class Schematic(object):
+    """
+    The contents of one .sch file.
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.title_block = {}
+        self.components = []
+        self.sheets = []
+        self.wires = []
+        self.junctions = []
+        self.no_connects = []
+        self.labels = []
+
+class LibSymbol(object):
+    __slots__ = ['name', 'reference', 'aliases', 'unit_count', 'power', 'pins', 'footprint_filters']
+
+    def __init__(self, name, reference, unit_count, power):
+        self.name = name
+        self.reference = reference
+        self.unit_count = unit_count
+        self.power = power
+        self.aliases = []
+        self.pins = []
+        self.footprint_filters = []
+
+    def unit_pins(self, unit, convert=1):
+        """
+        Pins of a unit, including the pins common to all units.
+        """
+        return [pin for pin in self.pins
+            if pin.unit in (0, unit) and pin.convert in (0, convert)]
+
+def _ints(values):
+    return tuple(int(v) for v in values)
+
+def _read_lines(file_name):
+    with io.open(file_name, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+def _parse_component(lines):
+    component = Component()
+    position_read = False
+    for line in lines:
+        if line.startswith('$EndComp'):
+            return component
+        tokens = line.split()
+        if not tokens:
+            continue
+        if tokens[0] == 'L':
+            component.lib_id = tokens[1]
+            component.reference = tokens[2]
+        elif tokens[0] == 'U':
+            component.unit = int(tokens[1])
+            component.convert = int(tokens[2])
+            component.timestamp = tokens[3]
+        elif tokens[0] == 'P':
+            component.position = _ints(tokens[1:3])
+        elif tokens[0] == 'AR':
+            match = _AR_RE.match(line.strip())
+            if match:
+                component.references[match.group(1)] = (match.group(2), int(match.group(3)))
+        elif tokens[0] == 'F':
+            match = _FIELD_RE.match(line)
+            if not match:
+                raise ParseError('Invalid field: {}'.format(line))
+            number = int(match.group(1))
+            if number < len(FIELD_NAMES):
+                name = FIELD_NAMES[number]
+            else:
+                name = _unquote(match.group(4) or 'Field{}'.format(number))
+            component.fields.append(Field(number, _unquote(match.group(2)), name))
+        elif line.startswith('\t'):
+            # The unit and position again, followed by the orientation matrix
+            if not position_read:
+                position_read = True
+            else:
+                component.matrix = _ints(tokens[:4])
+    raise ParseError('Unexpected end of file in component')
+
+def _parse_sheet(lines):
+    sheet = Sheet()
+    for line in lines:
+        if line.startswith('$EndSheet'):
+            return sheet
+        tokens = line.split()
+        if not tokens:
+            continue
+        if tokens[0] == 'S':
+            sheet.position = _ints(tokens[1:3])
+            sheet.size = _ints(tokens[3:5])
+        elif tokens[0] == 'U':
+            sheet.timestamp = tokens[1]
+        elif line.startswith('F'):
+            match = _SHEET_FIELD_RE.match(line)
+            if not match:
+                raise ParseError('Invalid sheet field: {}'.format(line))
+            number, text = int(match.group(1)), _unquote(match.group(2))
+            if number == 0:
+                sheet.name = text
+            elif number == 1:
+                sheet.file_name = text
+            else:
+                shape, side, x, y = match.group(3).split()[:4]
+                sheet.pins.append(SheetPin(text, shape, side, (int(x), int(y))))
+    raise ParseError('Unexpected end of file in sheet')
+
+def load_schematic(file_name):
+    """
+    Parse one .sch file, without following its sub sheets.
+    """
+    schematic = Schematic(file_name)
+    lines = _read_lines(file_name)
+    header = next(lines, '')
+    if not header.startswith('EESchema Schematic File'):
+        raise ParseError('{} is not a legacy eeschema file'.format(file_name))
+
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+        kind = tokens[0]
+        if kind == '$Comp':
+            schematic.components.append(_parse_component(lines))
+        elif kind == '$Sheet':
+            schematic.sheets.append(_parse_sheet(lines))
+        elif kind == '$Descr':
+            for line in lines:
+                if line.startswith('$EndDescr'):
+                    break
+                key, _, value = line.partition(' ')
+                schematic.title_block[key] = value.strip().strip('"')
+        elif kind == '$Bitmap':
+            for line in lines:
+                if line.startswith('$EndBitmap'):
+                    break
+        elif kind in ('Wire', 'Entry'):
+            coordinates = _ints(next(lines).split()[:4])
+            schematic.wires.append(Wire(tokens[1].lower(), coordinates[0:2], coordinates[2:4]))
+        elif kind == 'Connection':
+            schematic.junctions.append(_ints(tokens[2:4]))
+        elif kind == 'NoConn':
+            schematic.no_connects.append(_ints(tokens[2:4]))
+        elif kind == 'Text':
+            text = next(lines)
+            shape = tokens[6] if tokens[1] in ('GLabel', 'HLabel') else None
+            schematic.labels.append(Label(tokens[1].lower(), text.replace('\\n', '\n'),
+                _ints(tokens[2:4]), int(tokens[4]), shape))
+    return schematic
+
+SheetInstance = namedtuple('SheetInstance', ['path', 'name_path', 'schematic', 'sheet'])
+
+def walk_hierarchy(root_file):
+    """
+    Yields a SheetInstance for the root sheet and every (nested) sub sheet,
+    depth first. The path of sheet timestamps identifies the instance, '/'
+    for the root sheet. name_path is the same path with sheet names, as
+    shown by eeschema. Files that are used by several sheets are parsed once.
+    """
+    root_dir = os.path.dirname(os.path.abspath(root_file))
+    schematics = {}
+
+    def load(file_name):
+        file_name = os.path.abspath(file_name)
+        if file_name not in schematics:
+            schematics[file_name] = load_schematic(file_name)
+        return schematics[file_name]
+
+    stack = [SheetInstance('/', '/', load(root_file), None)]
+    while stack:
+        instance = stack.pop()
+        yield instance
+        children = []
+        for sheet in instance.schematic.sheets:
+            path = instance.path + sheet.timestamp + '/'
+            if path.count('/') > 64:
+                raise ParseError('Sheet recursion in {}'.format(sheet.file_name))
+            # Sub sheet file names are relative to the project directory
+            sheet_file = os.path.join(root_dir, sheet.file_name)
+            if not os.path.isfile(sheet_file):
+                logger.warning('Sheet file {} not found'.format(sheet_file))
+                continue
+            children.append(SheetInstance(path, instance.name_path + sheet.name + '/', load(sheet_file), sheet))
+        stack.extend(reversed(children))
+
+def load_library(file_name):
+    """
+    Parse a legacy symbol library, like the project's -cache.lib. Returns a
+    dict of symbol name to LibSymbol, aliases included.
+    """
+    symbols = {}
+    lines = _read_lines(file_name)
+    header = next(lines, '')
+    if not header.startswith('EESchema-LIBRARY'):
+        raise ParseError('{} is not a legacy symbol library'.format(file_name))
+
+    symbol = None
+    in_fplist = False
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+        kind = tokens[0]
+        if kind == 'DEF':
+            # DEF name reference unused text_offset draw_nums draw_names unit_count locked power
+            name = tokens[1].lstrip('~')
+            symbol = LibSymbol(name, tokens[2], int(tokens[7]), tokens[9] == 'P' if len(tokens) > 9 else False)
+            symbols[name] = symbol
+        elif symbol is None:
+            continue
+        elif kind == 'ENDDEF':
+            symbol = None
+        elif kind == 'ALIAS':
+            symbol.aliases.extend(tokens[1:])
+            for alias in tokens[1:]:
+                symbols.setdefault(alias, symbol)
+        elif kind == '$FPLIST':
+            in_fplist = True
+        elif kind == '$ENDFPLIST':
+            in_fplist = False
+        elif in_fplist:
+            symbol.footprint_filters.append(tokens[0])
+        elif kind == 'X':
+            # X name number x y length orientation number_size name_size unit convert type [shape]
+            symbol.pins.append(LibPin(tokens[1], tokens[2], _ints(tokens[3:5]), int(tokens[5]), tokens[6],
+                int(tokens[9]), int(tokens[10]), tokens[11], tokens[12] if len(tokens) > 12 else ''))
+    return symbols
+
+def cache_library_file(schematic_file):
+    return os.path.splitext(schematic_file)[0] + '-cache.lib'
+
+def lib_symbol(library, lib_id):
+    """
+    Look up the symbol of a component in the cache library, where the
+    library nickname and symbol name are joined with an underscore.
+    """
+    return library.get(lib_id.replace(':', '_')) or library.get(lib_id.split(':')[-1])
+
+ComponentInstance = namedtuple('ComponentInstance', ['reference', 'unit', 'sheet_path', 'component'])
+
+def component_instances(root_file):
+    """
+    Yields a ComponentInstance for every placed symbol unit in the whole
+    hierarchy, with its annotation in that sheet instance.
+    """
+    for sheet in walk_hierarchy(root_file):
+        for component in sheet.schematic.components:
+            reference, unit = component.instance(sheet.path)
+            yield ComponentInstance(reference, unit, sheet.path, component)
@@ -15,6 +15,7 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import io
 import logging
 import os
 import subprocess
@@ -24,21 +25,31 @@ import re
 import argparse
 
 from contextlib import contextmanager
-from junit_xml import TestSuite, TestCase
 
 eeschema_dir = os.path.dirname(os.path.abspath(__file__))
 repo_root = os.path.dirname(eeschema_dir)
 
 sys.path.append(repo_root)
 
+from eeschema import erc_precheck
+from eeschema.erc_report import ErcReport, fingerprint
+from eeschema.export_bom import export_bom, BOM_FORMATS
 from util import file_util
+from util import trace
+from util.baseline import Baseline, BaselineDiff
+from util.output_cache import OutputCache, kicad_version
+from util.report_writers import JunitXmlWriter, JsonReportWriter
 from util.ui_automation import (
     PopenContext,
     xdotool,
     wait_for_window,
-    recorded_xvfb,
+    virtual_display,
+    add_record_arguments,
+    record_mode_from_args,
+    RECORD_OFF,
     clipboard_store,
-    clipboard_retrieve
+    clipboard_retrieve,
+    report_wait_times
 )
 
 logging.basicConfig(level=logging.DEBUG)
@@ -68,14 +79,18 @@ def dismiss_newer_version():
     except RuntimeError:
         pass
 
-def eeschema_plot_schematic(output_directory, file_format, all_pages):
+# Order of the formats in the plot dialog's format radio box
+PLOT_FORMATS = ['ps', 'pdf', 'svg', 'dxf', 'hpgl']
+
+def eeschema_plot_schematic(output_directory, file_format, all_pages, current_format='hpgl'):
+    """
+    Plot from a running eeschema instance. current_format is the format that
+    is selected when the plot dialog opens, see set_default_plot_option().
+    """
     if file_format not in ('pdf', 'svg'):
         raise ValueError("file_format should be 'pdf' or 'svg'")
 
-    clipboard_store(output_dir)
-
-    dismiss_library_warning()
-    # dismiss_newer_version()
+    clipboard_store(output_directory)
 
     wait_for_window('eeschema', '\[')
 
@@ -88,21 +103,13 @@ def eeschema_plot_schematic(output_directory, file_format, all_pages):
     wait_for_window('plot', 'Plot')
 
     logger.info('Paste output directory')
-    xdotool(['key', 'ctrl+v'])
+    xdotool(['key', 'ctrl+a', 'ctrl+v'])
 
-    command_list = ['key',
-        'Tab',
-        'Tab',
-        'space'
-    ]
-    if file_format == 'pdf':
-        logger.info('Select PDF plot format')
-        for i in range(3):
-            command_list.insert(3, 'Up')
-    else:
-        logger.info('Select SVG plot format')
-        for i in range(2):
-            command_list.insert(3, 'Up')
+    logger.info('Select {} plot format'.format(file_format.upper()))
+    steps = PLOT_FORMATS.index(file_format) - PLOT_FORMATS.index(current_format)
+    command_list = ['key', 'Tab', 'Tab']
+    command_list.extend(['Down' if steps > 0 else 'Up'] * abs(steps))
+    command_list.append('space')
 
     if not all_pages:   # all pages is default option
         command_list.extend(['Tab', 'Tab', 'Tab', 'Tab', 'Tab'])
@@ -111,6 +118,11 @@ def eeschema_plot_schematic(output_directory, file_format, all_pages):
     logger.info('Plot')
     xdotool(['key', 'Return'])
 
+def close_dialog(name, window_regex):
+    wait_for_window(name, window_regex)
+    logger.info('Close %s window', name)
+    xdotool(['key', 'Escape'])
+
 def set_default_plot_option():
     # eeschema saves the latest plot format, this is problematic because
     # plot_schematic() does not know which option is set (it assumes HPGL)
@@ -131,144 +143,338 @@ def set_default_plot_option():
         os.remove(in_p)
         os.rename(out_p, in_p)
 
-def eeschema_export_schematic(schematic, output_dir, file_format="svg", all_pages=False):
-    screencast_output_file = os.path.join(output_dir, 'export_schematic_screencast.ogv')
-    file_format = file_format.lower()
+def plot_output_file(schematic, output_dir, file_format):
     output_file = os.path.join(output_dir, os.path.splitext(os.path.basename(schematic))[0]+'.'+file_format)
     if os.path.exists(output_file):
         logging.info('Removing old file')
         os.remove(output_file)
+    return output_file
+
+def schematic_input_files(schematic):
+    """
+    Returns the files a schematic's output depends on: the schematic, its sub
+    sheets and the project's symbol cache, project file and symbol library table.
+    """
+    project_dir = os.path.dirname(schematic)
+    project_base = os.path.splitext(schematic)[0]
+
+    sheets = [schematic]
+    i = 0
+    while i < len(sheets):
+        with open(sheets[i]) as f:
+            in_sheet = False
+            for line in f:
+                if line.startswith('$Sheet'):
+                    in_sheet = True
+                elif line.startswith('$EndSheet'):
+                    in_sheet = False
+                elif in_sheet and line.startswith('F1 '):
+                    m = re.search(r'^F1 "(.*)" ', line)
+                    sheet = os.path.join(project_dir, m.group(1))
+                    if sheet not in sheets and os.path.isfile(sheet):
+                        sheets.append(sheet)
+        i += 1
+
+    project_files = [project_base + '-cache.lib', project_base + '.pro',
+        os.path.join(project_dir, 'sym-lib-table')]
+    return sheets + [path for path in project_files if os.path.isfile(path)]
+
+def export_cacheable(file_format, all_pages):
+    """
+    Only the file of the root sheet is cached, an SVG export of all pages
+    writes a file per sheet.
+    """
+    return not (file_format == 'svg' and all_pages)
+
+def export_cache_key(cache, schematic, file_format, all_pages):
+    return cache.key(schematic_input_files(schematic),
+        command='export',
+        file_format=file_format,
+        all_pages=all_pages,
+        kicad_version=kicad_version())
+
+def eeschema_export_schematic(schematic, output_dir, file_format="svg", all_pages=False,
+        session=None, record=RECORD_OFF, cache=None):
+    screencast_output_file = os.path.join(output_dir, 'export_schematic_screencast.ogv')
+    file_format = file_format.lower()
+
+    if not export_cacheable(file_format, all_pages):
+        cache = None
+    if cache is not None:
+        cache_key = export_cache_key(cache, schematic, file_format, all_pages)
+        cached_files = cache.fetch(cache_key, output_dir)
+        if cached_files:
+            return cached_files[0]
+
+    output_file = plot_output_file(schematic, output_dir, file_format)
 
     set_default_plot_option()
-    os.path.basename('/root/dir/sub/file.ext')
 
-    with recorded_xvfb(screencast_output_file, width=800, height=600, colordepth=24):
+    with virtual_display(screencast_output_file, session, record, width=800, height=600, colordepth=24):
         with PopenContext(['eeschema', schematic], close_fds=True) as eeschema_proc:
+            dismiss_library_warning()
+            # dismiss_newer_version()
+
             eeschema_plot_schematic(output_dir, file_format, all_pages)
             file_util.wait_for_file_created_by_process(eeschema_proc.pid, output_file)
             eeschema_proc.terminate()
 
+    if cache is not None:
+        cache.store(cache_key, [output_file])
     return output_file
 
-def eeschema_parse_erc(erc_file, warning_as_error=False, generate_junit_xml=False):
-    with open(erc_file, 'r') as f:
-        lines = f.read().splitlines()
-        last_line = lines[-1]
+def _write_erc_violations(erc_file, junit, json_writer, baseline_diff):
+    with io.open(erc_file, encoding='utf-8', errors='replace') as f:
+        report = ErcReport(f, erc_file)
+        sheet = None
+        sheets_with_violations = set()
+        for violation in report:
+            logger.debug('{} {}'.format(violation.message, violation.location))
+            if baseline_diff is not None and not baseline_diff.check(fingerprint(violation)):
+                continue
+            if junit is not None:
+                # Multiple test failures per test case are not supported by
+                # junit XML, so every violation is a test case
+                if violation.sheet != sheet:
+                    sheet = violation.sheet
+                    sheets_with_violations.add(sheet)
+                    junit.start_suite('ERC {}'.format(sheet))
+                junit.add_case('ERC rule {}'.format(violation.rule), sheet,
+                    failure_message=violation.message + ' ' + violation.location,
+                    failure_type=str(violation.rule))
+            if json_writer is not None:
+                json_writer.add(violation._asdict())
+
+    if junit is not None:
+        # Sheets without violations get an empty test suite
+        for sheet in report.sheets:
+            if sheet not in sheets_with_violations:
+                junit.start_suite('ERC {}'.format(sheet))
+    return report
+
+def eeschema_parse_erc(erc_file, warning_as_error=False, generate_junit_xml=False, generate_json=False,
+        baseline_diff=None):
+    """
+    Returns the number of ERC errors in the report. The violations can be
+    written to junit.xml, with a test suite per sheet, and to erc.json in the
+    directory of the report. The report is parsed while it is read.
+
+    With a BaselineDiff only the violations that are not in its baseline are
+    written to the reports, and their number is returned. The report does not
+    tell errors and warnings apart, so new warnings are counted too. A
+    BaselineDiff without baseline only collects the violations to write a
+    baseline, the errors are counted as usual.
+    """
+    output_dir = os.path.dirname(erc_file)
+    junit = JunitXmlWriter(os.path.join(output_dir, 'junit.xml')) if generate_junit_xml else None
+    json_writer = JsonReportWriter(os.path.join(output_dir, 'erc.json')) if generate_json else None
+
+    try:
+        report = _write_erc_violations(erc_file, junit, json_writer, baseline_diff)
+    except:
+        # Don't leave incomplete reports behind
+        for writer in (junit, json_writer):
+            if writer is not None:
+                writer.close()
+                os.remove(writer.output.name)
+        raise
+
+    if junit is not None:
+        junit.close()
+    if json_writer is not None:
+        summary = report.summary()
+        if baseline_diff is not None and baseline_diff.baseline is not None:
+            summary['baseline'] = baseline_diff.summary()
+        json_writer.close(summary)
+
+    logger.debug('ERC messages: {} errors: {} warnings: {}'.format(report.messages, report.errors, report.warnings))
+    if baseline_diff is not None and baseline_diff.baseline is not None:
+        baseline_diff.log('ERC')
+        return len(baseline_diff.new)
+    return report.error_count(warning_as_error)
+
+def eeschema_erc(eeschema_proc, output_dir):
+    """
+    Run ERC from a running eeschema instance, returns the path of the report.
+    """
+    logger.info('Focus main eeschema window')
+    wait_for_window('eeschema', '\[')
 
-    if generate_junit_xml:
-        # Build test suite per sheet. Multiple test failures per test case are
-        # not supported bu junit XML.
-        test_suites = []
-        test_cases = []
+    logger.info('Inspect->Electrical Rules Checker')
+    xdotool(['key',
+        'alt+i',
+        'c'
+    ])
 
-        sheet = None
+    # Do this now since we have to wait for KiCad anyway
+    clipboard_store(output_dir)
+
+    logger.info('Focus Electrical Rules Checker window')
+    wait_for_window('Electrical Rules Checker', 'Electrical Rules Checker')
+    xdotool(['key',
+        'Tab',
+        'Tab',
+        'Tab',
+        'Tab',
+        'space',
+        'Return'
+    ])
 
-        for i in range(0, len(lines)):
-            line = lines[i]
-            logger.debug(line)
-            if line.startswith('***** Sheet'):
-                if sheet is not None:
-                    # Build test suite for previous sheet
-                    logger.debug('Adding test suite for {}'.format(sheet))
-                    test_suites.append(TestSuite('ERC {}'.format(sheet), test_cases))
+    wait_for_window('ERC File save dialog', 'ERC File')
+    xdotool(['key', 'Home'])
+    logger.info('Pasting output dir')
+    xdotool(['key', 'ctrl+v'])
+    logger.info('Copy full file path')
+    xdotool(['key',
+        'ctrl+a',
+        'ctrl+c'
+    ])
 
-                m = re.search('^\*\*\*\*\* Sheet (.+)$', line)
-                sheet = m.group(1)
-                test_cases = []
+    erc_file = clipboard_retrieve()
+    if os.path.exists(erc_file):
+        os.remove(erc_file)
+
+    logger.info('Run ERC')
+    xdotool(['key', 'Return'])
+
+    logger.info('Wait for ERC file creation')
+    file_util.wait_for_file_created_by_process(eeschema_proc.pid, erc_file)
+
+    return erc_file
+
+def erc_cache_key(cache, schematic):
+    return cache.key(schematic_input_files(schematic),
+        command='run_erc',
+        kicad_version=kicad_version())
+
+def eeschema_erc_without_gui(schematic, output_dir, warning_as_error, generate_junit_xml=False,
+        cache=None, precheck=False, generate_json=False, baseline_diff=None):
+    """
+    Try to get the ERC result without running eeschema: from the report of an
+    earlier ERC of the same schematic in cache, or with precheck from the
+    pre-ERC checks when they find errors. Returns the number of errors, or
+    None if eeschema has to run the ERC. A baseline is compared with the full
+    eeschema report, so the pre-ERC checks are skipped then.
+    """
+    if cache is not None:
+        cached_files = cache.fetch(erc_cache_key(cache, schematic), output_dir)
+        if cached_files:
+            logger.info('Using cached ERC report')
+            return eeschema_parse_erc(cached_files[0], warning_as_error, generate_junit_xml, generate_json,
+                baseline_diff)
+
+    if precheck and baseline_diff is not None:
+        logger.info('Not running the pre-ERC checks, the baseline is compared with the eeschema ERC report')
+    elif precheck:
+        errors = erc_precheck.run_precheck(schematic, output_dir, warning_as_error, generate_junit_xml,
+            generate_json)
+        if errors > 0:
+            logger.info('Pre-ERC checks failed, not running eeschema ERC')
+            return errors
+    return None
+
+def eeschema_run_erc(schematic, output_dir, warning_as_error, generate_junit_xml=False,
+        session=None, record=RECORD_OFF, cache=None, precheck=False, generate_json=False,
+        baseline_diff=None):
+    errors = eeschema_erc_without_gui(schematic, output_dir, warning_as_error, generate_junit_xml,
+        cache, precheck, generate_json, baseline_diff)
+    if errors is not None:
+        return errors
 
-            else:
-                if line.startswith('ErrType'):
-                    m = re.search('^ErrType\(([0-9]+)\): (.+)$', line)
-                    error_type = m.group(1)
-                    message = m.group(2)
-                else:
-                    continue
-                i += 1;
-                line = lines[i]
-
-                if not line.startswith('    @'):
-                    logger.error('Did not find location on line {}: {}'.format(i, line))
-                    continue
-
-                test_case = TestCase('ERC rule {}'.format(error_type), sheet)
-                test_case.add_failure_info(message + ' '+line.strip(), failure_type=error_type)
-                test_cases.append(test_case)
-        if sheet is not None:
-            # Add last sheet
-            logger.debug('Adding final test suite for {}'.format(sheet))
-            test_suites.append(TestSuite('ERC {}'.format(sheet), test_cases))
-
-        output_dir = os.path.dirname(erc_file)
-        with open(output_dir+'/junit.xml', 'w') as f:
-            TestSuite.to_file(f, test_suites, prettyprint=False)
-
-
-    logging.debug('Last line: '+last_line)
-    m = re.search('^ \*\* ERC messages: ([0-9]+) +Errors ([0-9]+) +Warnings ([0-9]+)+$', last_line)
-    messages = m.group(1)
-    errors = m.group(2)
-    warnings = m.group(3)
-
-    if warning_as_error:
-        return int(errors) + int(warnings)
-    return int(errors)
-
-def eeschema_run_erc(schematic, output_dir, warning_as_error, generate_junit_xml=False):
     os.environ['EDITOR'] = '/bin/cat'
 
     screencast_output_file = os.path.join(output_dir, 'run_erc_schematic_screencast.ogv')
 
-    with recorded_xvfb(screencast_output_file, width=800, height=600, colordepth=24):
+    with virtual_display(screencast_output_file, session, record, width=800, height=600, colordepth=24):
+        with PopenContext(['eeschema', schematic], close_fds=True) as eeschema_proc:
+            dismiss_library_warning()
+            # dismiss_newer_version()
+
+            erc_file = eeschema_erc(eeschema_proc, output_dir)
+
+            eeschema_proc.terminate()
+
+    if cache is not None:
+        cache.store(erc_cache_key(cache, schematic), [erc_file])
+    return eeschema_parse_erc(erc_file, warning_as_error, generate_junit_xml, generate_json, baseline_diff)
+
+PIPELINE_ACTIONS = ['run_erc', 'export_pdf', 'export_svg', 'bom']
+
+def eeschema_pipeline(schematic, output_dir, actions, warning_as_error=False,
+        generate_junit_xml=False, all_pages=False, session=None, record=RECORD_OFF, cache=None,
+        precheck=False, generate_json=False, baseline_diff=None):
+    """
+    Run a list of PIPELINE_ACTIONS on a schematic with a single eeschema
+    instance, so the schematic and its libraries are only loaded once.
+    Returns a dict with the number of ERC errors for run_erc and the output
+    file for the exports. Exports found in cache are not run again, the BOM
+    is read from the schematic files without eeschema. The ERC is skipped
+    like in eeschema_run_erc when its result is known without eeschema.
+    """
+    for action in actions:
+        if action not in PIPELINE_ACTIONS:
+            raise ValueError('Unknown pipeline action {}'.format(action))
+
+    results = {}
+    if 'bom' in actions:
+        results['bom'] = export_bom(schematic, output_dir)
+    if 'run_erc' in actions:
+        errors = eeschema_erc_without_gui(schematic, output_dir, warning_as_error, generate_junit_xml,
+            cache, precheck, generate_json, baseline_diff)
+        if errors is not None:
+            results['run_erc'] = errors
+    actions = [action for action in actions if action not in results]
+    if not actions:
+        return results
+
+    cache_keys = {}
+    if cache is not None:
+        for action in actions:
+            if action.startswith('export_') and export_cacheable(action.split('_', 1)[1], all_pages):
+                cache_keys[action] = export_cache_key(cache, schematic, action.split('_', 1)[1], all_pages)
+                cached_files = cache.fetch(cache_keys[action], output_dir)
+                if cached_files:
+                    results[action] = cached_files[0]
+        actions = [action for action in actions if action not in results]
+        if not actions:
+            return results
+
+    os.environ['EDITOR'] = '/bin/cat'
+    set_default_plot_option()
+    plot_format = 'hpgl'
+
+    screencast_output_file = os.path.join(output_dir, 'pipeline_screencast.ogv')
+
+    with virtual_display(screencast_output_file, session, record, width=800, height=600, colordepth=24):
         with PopenContext(['eeschema', schematic], close_fds=True) as eeschema_proc:
             dismiss_library_warning()
             # dismiss_newer_version()
 
-            logger.info('Focus main eeschema window')
-            wait_for_window('eeschema', '\[')
-
-            logger.info('Inspect->Electrical Rules Checker')
-            xdotool(['key',
-                'alt+i',
-                'c'
-            ])
-
-            # Do this now since we have to wait for KiCad anyway
-            clipboard_store(output_dir)
-
-            logger.info('Focus Electrical Rules Checker window')
-            wait_for_window('Electrical Rules Checker', 'Electrical Rules Checker')
-            xdotool(['key',
-                'Tab',
-                'Tab',
-                'Tab',
-                'Tab',
-                'space',
-                'Return'
-            ])
-
-            wait_for_window('ERC File save dialog', 'ERC File')
-            xdotool(['key', 'Home'])
-            logger.info('Pasting output dir')
-            xdotool(['key', 'ctrl+v'])
-            logger.info('Copy full file path')
-            xdotool(['key',
-                'ctrl+a',
-                'ctrl+c'
-            ])
-
-            erc_file = clipboard_retrieve()
-            if os.path.exists(erc_file):
-                os.remove(erc_file)
-
-            logger.info('Run ERC')
-            xdotool(['key', 'Return'])
-
-            logger.info('Wait for ERC file creation')
-            file_util.wait_for_file_created_by_process(eeschema_proc.pid, erc_file)
+            for action in actions:
+                logger.info('Pipeline action {}'.format(action))
+                if action == 'run_erc':
+                    results[action] = eeschema_erc(eeschema_proc, output_dir)
+                    close_dialog('Electrical Rules Checker', 'Electrical Rules Checker')
+                    if cache is not None:
+                        cache.store(erc_cache_key(cache, schematic), [results[action]])
+                else:
+                    file_format = action.split('_', 1)[1]
+                    output_file = plot_output_file(schematic, output_dir, file_format)
+                    eeschema_plot_schematic(output_dir, file_format, all_pages, plot_format)
+                    # The plot dialog remembers the last used format
+                    plot_format = file_format
+                    file_util.wait_for_file_created_by_process(eeschema_proc.pid, output_file)
+                    close_dialog('plot', 'Plot')
+                    results[action] = output_file
+                    if action in cache_keys:
+                        cache.store(cache_keys[action], [output_file])
 
             eeschema_proc.terminate()
 
-    return eeschema_parse_erc(erc_file, warning_as_error, generate_junit_xml)
+    if 'run_erc' in actions:
+        results['run_erc'] = eeschema_parse_erc(results['run_erc'], warning_as_error, generate_junit_xml,
+            generate_json, baseline_diff)
+    return results
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='KiCad schematic automation')
@@ -276,6 +482,16 @@ if __name__ == '__main__':
 
     parser.add_argument('schematic', help='KiCad schematic file')
     parser.add_argument('output_dir', help='output directory')
+    parser.add_argument('--report_wait_times', help='Log how long each wait for a window took',
+        action='store_true'
+    )
+    parser.add_argument('--trace', help='Write a Chrome trace of the run to this JSON file, and a summary next to it')
+    add_record_arguments(parser)
+    parser.add_argument('--cache_dir', help='Reuse exports of unchanged schematics stored in this directory')
+    parser.add_argument('--cache_size', help='Maximum size of the cache in MB (default: 1024)',
+        type=int,
+        default=1024
+    )
 
     export_parser = subparsers.add_parser('export', help='Export a schematic')
     export_parser.add_argument('--file_format', '-f', help='Export file format',
@@ -293,8 +509,54 @@ if __name__ == '__main__':
     erc_parser.add_argument('--junit_xml', '-x', help='Generate junit XML report',
         action='store_true'
     )
+    erc_parser.add_argument('--json', help='Write the ERC violations to erc.json',
+        action='store_true'
+    )
+    erc_parser.add_argument('--precheck', help='Check the schematic files first, skip the eeschema ERC when they fail',
+        action='store_true'
+    )
+    erc_parser.add_argument('--baseline', help='Only fail on violations that are not in this baseline file')
+    erc_parser.add_argument('--write_baseline', help='Write the violations to this baseline file')
+
+    bom_parser = subparsers.add_parser('bom', help='Export the bill of materials, without eeschema')
+    bom_parser.add_argument('--file_format', '-f', help='BOM file format',
+        choices=BOM_FORMATS,
+        default='csv'
+    )
+
+    pipeline_parser = subparsers.add_parser('pipeline',
+        help='Run several actions on a schematic with a single eeschema instance')
+    pipeline_parser.add_argument('--action', '-a', help='Action to run, can be given multiple times',
+        choices=PIPELINE_ACTIONS,
+        action='append',
+        dest='actions',
+        required=True
+    )
+    pipeline_parser.add_argument('--all_pages', help='Plot all schematic pages in one file',
+        action='store_true'
+    )
+    pipeline_parser.add_argument('--warnings_as_errors', '-w', help='Treat warnings as errors',
+        action='store_true'
+    )
+    pipeline_parser.add_argument('--junit_xml', '-x', help='Generate junit XML report',
+        action='store_true'
+    )
+    pipeline_parser.add_argument('--json', help='Write the ERC violations to erc.json',
+        action='store_true'
+    )
+    pipeline_parser.add_argument('--precheck', help='Check the schematic files first, skip the eeschema ERC when they fail',
+        action='store_true'
+    )
+    pipeline_parser.add_argument('--baseline', help='Only fail on ERC violations that are not in this baseline file')
+    pipeline_parser.add_argument('--write_baseline', help='Write the ERC violations to this baseline file')
 
     args = parser.parse_args()
+    record_mode = record_mode_from_args(parser, args)
+
+    if args.report_wait_times:
+        report_wait_times()
+    if args.trace:
+        trace.enable(os.path.abspath(args.trace))
 
     schematic = os.path.abspath(args.schematic)
     if not os.path.isfile(schematic):
@@ -304,11 +566,40 @@ if __name__ == '__main__':
     output_dir = os.path.abspath(args.output_dir)+'/'
     file_util.mkdir_p(output_dir)
 
+    cache = None
+    if args.cache_dir:
+        cache = OutputCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
     if args.command == 'export':
-        eeschema_export_schematic(schematic, output_dir, args.file_format, args.all_pages)
+        eeschema_export_schematic(schematic, output_dir, args.file_format, args.all_pages,
+            record=record_mode, cache=cache)
         exit(0)
+    baseline_diff = None
+    if getattr(args, 'baseline', None) or getattr(args, 'write_baseline', None):
+        if args.precheck:
+            parser.error('--precheck does not work with --baseline or --write_baseline')
+        baseline_diff = BaselineDiff(Baseline.load(args.baseline) if args.baseline else None)
+
     if args.command == 'run_erc':
-        errors = eeschema_run_erc(schematic, output_dir, args.warnings_as_errors, args.junit_xml)
+        errors = eeschema_run_erc(schematic, output_dir, args.warnings_as_errors, args.junit_xml,
+            record=record_mode, cache=cache, precheck=args.precheck, generate_json=args.json,
+            baseline_diff=baseline_diff)
+        if args.write_baseline:
+            baseline_diff.current.save(args.write_baseline)
+        if errors > 0:
+            logging.error('{} ERC errors detected'.format(errors))
+            exit(errors)
+        exit(0)
+    if args.command == 'bom':
+        export_bom(schematic, output_dir, args.file_format)
+        exit(0)
+    if args.command == 'pipeline':
+        results = eeschema_pipeline(schematic, output_dir, args.actions,
+            args.warnings_as_errors, args.junit_xml, args.all_pages, record=record_mode, cache=cache,
+            precheck=args.precheck, generate_json=args.json, baseline_diff=baseline_diff)
+        if args.write_baseline and 'run_erc' in results:
+            baseline_diff.current.save(args.write_baseline)
+        errors = results.get('run_erc', 0)
         if errors > 0:
             logging.error('{} ERC errors detected'.format(errors))
             exit(errors)
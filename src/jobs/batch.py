@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+# Runs automation tasks on many KiCad projects in parallel. Every worker
+# process owns its own Xvfb display, so the UI automation of concurrent jobs
+# (and their clipboards) can't interfere with each other.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from junit_xml import TestSuite, TestCase
+from multiprocessing.util import Finalize
+
+jobs_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(jobs_dir)
+
+sys.path.append(repo_root)
+
+from jobs import tasks as job_tasks
+from util import file_util
+from util.session_pool import SessionPool
+from util.ui_automation import add_record_arguments, record_mode_from_args
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Session pool of the current worker process, None if no display is needed
+_worker_sessions = None
+
+def _init_worker(needs_display):
+    global _worker_sessions
+    if needs_display:
+        _worker_sessions = SessionPool(1)
+        _worker_sessions.start()
+        # Stop Xvfb when the worker exits
+        Finalize(_worker_sessions, _worker_sessions.stop, exitpriority=10)
+
+def _run_job(job):
+    project, tasks, output_dir, options = job
+    logger.info('Running {} on {}'.format(', '.join(tasks), project.name))
+    if _worker_sessions is None:
+        return project, job_tasks.run_project_tasks(project, tasks, output_dir, None, options)
+    with _worker_sessions.session() as session:
+        return project, job_tasks.run_project_tasks(project, tasks, output_dir, session, options)
+
+def _project_output_dirs(projects, output_dir):
+    # Projects in different directories can have the same name
+    output_dirs = []
+    used = set()
+    for project in projects:
+        name = project.name
+        i = 1
+        while name in used:
+            i += 1
+            name = '{}-{}'.format(project.name, i)
+        used.add(name)
+        output_dirs.append(os.path.join(output_dir, name))
+    return output_dirs
+
+def run_batch(projects, tasks, output_dir, jobs=None, options=None):
+    """
+    Run tasks on all projects using a pool of jobs worker processes (one per
+    CPU by default). Returns the aggregate report, which is also written to
+    output_dir as batch_report.json and junit.xml.
+    """
+    file_util.mkdir_p(output_dir)
+    needs_display = any(task in job_tasks.GUI_TASKS for task in tasks)
+    job_list = [(project, tasks, project_output_dir, options)
+        for project, project_output_dir in zip(projects, _project_output_dirs(projects, output_dir))]
+
+    start = time.time()
+    project_results = []
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(needs_display,))
+    try:
+        for i, (project, results) in enumerate(pool.imap_unordered(_run_job, job_list)):
+            logger.info('Finished {} ({}/{})'.format(project.name, i + 1, len(job_list)))
+            project_results.append((project, results))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    report = build_report(project_results, time.time() - start)
+    write_report(report, output_dir)
+    return report
+
+def build_report(project_results, duration):
+    report = {
+        'duration': duration,
+        'totals': {},
+        'projects': [],
+    }
+    totals = report['totals']
+    for project, results in sorted(project_results, key=lambda r: r[0].name):
+        report['projects'].append({
+            'name': project.name,
+            'schematic': project.schematic,
+            'layout': project.layout,
+            'tasks': results,
+        })
+        for result in results:
+            totals[result['status']] = totals.get(result['status'], 0) + 1
+    return report
+
+def write_report(report, output_dir):
+    with open(os.path.join(output_dir, 'batch_report.json'), 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    test_suites = []
+    for project in report['projects']:
+        test_cases = []
+        for result in project['tasks']:
+            test_case = TestCase(result['task'], project['name'], result['duration'])
+            if result['status'] == 'failed':
+                test_case.add_failure_info('{} violations'.format(result['violations']))
+            elif result['status'] == 'error':
+                test_case.add_error_info(result['message'])
+            elif result['status'] == 'skipped':
+                test_case.add_skipped_info(result['message'])
+            test_cases.append(test_case)
+        test_suites.append(TestSuite(project['name'], test_cases))
+
+    with open(os.path.join(output_dir, 'junit.xml'), 'w') as f:
+        TestSuite.to_file(f, test_suites, prettyprint=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run KiCad automation tasks on many projects in parallel')
+
+    parser.add_argument('output_dir', help='Output directory, results of each project go into a sub directory')
+    parser.add_argument('projects', nargs='+',
+        help='Project directories, .pro, .sch or .kicad_pcb files or glob patterns matching them'
+    )
+    parser.add_argument('--task', '-t', help='Task to run, can be given multiple times (default: run_erc and run_drc)',
+        choices=job_tasks.TASKS,
+        action='append',
+        dest='tasks'
+    )
+    parser.add_argument('--jobs', '-j', help='Number of worker processes (default: number of CPUs)',
+        type=int
+    )
+    parser.add_argument('--warnings_as_errors', '-w', help='Treat ERC warnings as errors',
+        action='store_true'
+    )
+    parser.add_argument('--ignore_unconnected', '-i', help='Ignore unconnected pads in DRC',
+        action='store_true'
+    )
+    parser.add_argument('--precheck', help='Check the schematic files first, skip the eeschema ERC when they fail',
+        action='store_true'
+    )
+    parser.add_argument('--validate', help='Check the plotted gerber and drill files',
+        action='store_true'
+    )
+    add_record_arguments(parser)
+    parser.add_argument('--trace', help='Write a Chrome trace and a summary of the tasks of every project to {} in its output directory'.format(job_tasks.TRACE_FILE),
+        action='store_true'
+    )
+
+    args = parser.parse_args()
+
+    projects = job_tasks.find_projects(args.projects)
+    if not projects:
+        logger.error('No projects found')
+        exit(-1)
+
+    report = run_batch(projects, args.tasks or ['run_erc', 'run_drc'], os.path.abspath(args.output_dir),
+        args.jobs, {
+            'warnings_as_errors': args.warnings_as_errors,
+            'ignore_unconnected': args.ignore_unconnected,
+            'record': record_mode_from_args(parser, args),
+            'precheck': args.precheck,
+            'validate': args.validate,
+            'trace': args.trace,
+        })
+
+    logger.info('Batch finished in {:.1f} s: {}'.format(report['duration'], report['totals']))
+    failures = report['totals'].get('failed', 0) + report['totals'].get('error', 0)
+    exit(failures)
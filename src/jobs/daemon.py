@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+#
+# Long running automation daemon. Its worker processes keep the automation
+# modules and pcbnew imported and an Xvfb display started between jobs, so a
+# job doesn't pay for starting Python, importing pcbnew and starting Xvfb.
+# Jobs are submitted over a Unix socket, one JSON object per line, and run in
+# the order they were submitted. Their progress and results are streamed back
+# as JSON lines too:
+#
+#   daemon.py serve -j 4
+#   daemon.py submit -t run_erc -t plot_gerbers /kicad-project /tmp/output
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import errno
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from multiprocessing.util import Finalize
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+jobs_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(jobs_dir)
+
+sys.path.append(repo_root)
+
+from jobs import tasks as job_tasks
+from util import file_util
+from util.session_pool import SessionPool
+from util.ui_automation import add_record_arguments, record_mode_from_args
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'kicad-automation.sock')
+DEFAULT_OUTPUT_DIR = os.path.join(tempfile.gettempdir(), 'kicad-automation-jobs')
+
+DEFAULT_TASKS = ['run_erc', 'run_drc']
+
+# Options of a job, passed on to jobs.tasks.run_project_tasks
+JOB_OPTIONS = ('warnings_as_errors', 'ignore_unconnected', 'all_pages', 'record', 'precheck', 'validate',
+    'trace')
+
+# Events that end the response to a request
+FINAL_EVENTS = ('finished', 'error', 'status')
+
+# Seconds between checks that the workers of the running jobs are alive
+WORKER_CHECK_INTERVAL = 1.0
+
+# Session pool and event queue of the current worker process
+_worker_sessions = None
+_worker_events = None
+
+class _EventChannel(object):
+    """
+    Carries (job id, event) pairs from the workers to the daemon. Unlike a
+    multiprocessing.Queue it sends from the calling thread instead of a
+    feeder thread, so a worker that crashes in pcbnew has sent all its
+    events and doesn't leave the lock that all workers write with held.
+    """
+
+    def __init__(self):
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._lock = multiprocessing.Lock()
+
+    def put(self, item):
+        with self._lock:
+            self._writer.send(item)
+
+    def get(self, timeout):
+        """
+        The next item, raises queue.Empty when there is none within timeout
+        seconds. Only the daemon reads from the channel.
+        """
+        if not self._reader.poll(timeout):
+            raise queue.Empty()
+        return self._reader.recv()
+
+def _stop_worker(signum, frame):
+    # Stopping Xvfb ends the KiCad instance of a running job too. Exit right
+    # away instead of raising SystemExit, which could happen while the
+    # worker holds a lock of the pool, or get lost in code that ignores
+    # exceptions.
+    if _worker_sessions is not None:
+        _worker_sessions.stop()
+    os._exit(0)
+
+def _init_worker(events, needs_display):
+    global _worker_sessions, _worker_events
+    _worker_events = events
+    # Stopping the daemon terminates the workers, they stop their Xvfb
+    # display first
+    signal.signal(signal.SIGTERM, _stop_worker)
+    if needs_display:
+        _worker_sessions = SessionPool(1)
+        _worker_sessions.start()
+        # Stop Xvfb when the worker exits
+        Finalize(_worker_sessions, _worker_sessions.stop, exitpriority=10)
+
+    # Import the automation modules, and pcbnew with them, once instead of
+    # in every job
+    from eeschema import schematic
+    try:
+        from pcbnew_automation import plot, run_drc
+    except ImportError as e:
+        logger.warning('Layout tasks will fail, pcbnew can not be imported: %s', e)
+
+def _failures(results):
+    return len([result for result in results if result['status'] in ('failed', 'error')])
+
+def _run_job(job):
+    job_id, project, tasks, output_dir, options = job
+    start = time.time()
+    _worker_events.put((job_id, {'event': 'started', 'worker': os.getpid()}))
+
+    def on_result(result):
+        event = dict(result)
+        event['event'] = 'result'
+        _worker_events.put((job_id, event))
+
+    try:
+        if _worker_sessions is None:
+            results = job_tasks.run_project_tasks(project, tasks, output_dir, None, options, on_result)
+        else:
+            with _worker_sessions.session() as session:
+                results = job_tasks.run_project_tasks(project, tasks, output_dir, session, options, on_result)
+    except Exception as e:
+        logger.exception('Job {} on {} failed'.format(job_id, project.name))
+        _worker_events.put((job_id, {'event': 'error', 'message': str(e)}))
+        return
+
+    # Sent over the same queue as the results, so it arrives after them
+    _worker_events.put((job_id, {
+        'event': 'finished',
+        'duration': time.time() - start,
+        'failures': _failures(results),
+        'results': results,
+    }))
+
+class AutomationDaemon(object):
+    """
+    Runs jobs on a pool of worker processes that each own an Xvfb display,
+    in the order they were submitted. The events of a job are sent from the
+    worker to the daemon, which hands them to whoever submitted the job.
+    """
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, jobs=None, display=True, job_timeout=None):
+        self.output_dir = output_dir
+        self.workers = jobs or multiprocessing.cpu_count()
+        self.display = display
+        self.job_timeout = job_timeout
+
+        self._lock = threading.Lock()
+        self._next_job = 1
+        # Ids of the jobs that have not started yet, and the running jobs
+        # with the pid of their worker
+        self._queued = set()
+        self._running = {}
+        # Job id to the queue its events are handed out on
+        self._listeners = {}
+        # Job id to the pool result of the jobs the pool may still be busy with
+        self._results = {}
+
+        self._events = _EventChannel()
+        self._closed = threading.Event()
+        self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+            initargs=(self._events, display))
+        self._dispatcher = threading.Thread(target=self._dispatch, name='EventDispatcher')
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def close(self):
+        # Workers hand the result of a job to the pool after its final event,
+        # terminating them while they do leaves a lock of the pool held
+        with self._lock:
+            ended = [result for job_id, result in self._results.items()
+                if job_id not in self._queued and job_id not in self._running]
+        for result in ended:
+            result.wait(WORKER_CHECK_INTERVAL)
+        self._pool.terminate()
+        self._pool.join()
+        self._closed.set()
+        self._dispatcher.join()
+
+    def submit(self, request):
+        """
+        Queue the job of a request. Returns the job id and a queue on which
+        its events are handed out, the last one is a finished or error event.
+        Raises ValueError for invalid requests.
+        """
+        project = self._project(request.get('project'))
+        tasks = request.get('tasks') or DEFAULT_TASKS
+        unknown_tasks = [task for task in tasks if task not in job_tasks.TASKS]
+        if unknown_tasks:
+            raise ValueError('Unknown tasks {}, use {}'.format(', '.join(unknown_tasks), ', '.join(job_tasks.TASKS)))
+        if not self.display and any(task in job_tasks.GUI_TASKS for task in tasks):
+            raise ValueError('The daemon runs without display, {} are not available'.format(
+                ', '.join(job_tasks.GUI_TASKS)))
+        options = request.get('options') or {}
+        unknown_options = [option for option in options if option not in JOB_OPTIONS]
+        if unknown_options:
+            raise ValueError('Unknown options {}'.format(', '.join(unknown_options)))
+
+        with self._lock:
+            job_id = self._next_job
+            self._next_job += 1
+            position = len(self._queued)
+            self._queued.add(job_id)
+            events = queue.Queue()
+            self._listeners[job_id] = events
+
+        output_dir = os.path.abspath(request.get('output_dir') or
+            os.path.join(self.output_dir, '{}-{}'.format(job_id, project.name)))
+        events.put({
+            'event': 'queued',
+            'job': job_id,
+            'project': project.name,
+            'tasks': tasks,
+            'output_dir': output_dir,
+            'position': position,
+        })
+        logger.info('Queued job {}: {} on {}'.format(job_id, ', '.join(tasks), project.name))
+        result = self._pool.apply_async(_run_job, [(job_id, project, tasks, output_dir, options)])
+        with self._lock:
+            self._results = dict((job, pending) for job, pending in self._results.items() if not pending.ready())
+            self._results[job_id] = result
+        return job_id, events
+
+    def forget(self, job_id):
+        """
+        Stop handing out the events of a job, which keeps running and still
+        counts as running in status().
+        """
+        with self._lock:
+            self._listeners.pop(job_id, None)
+
+    def status(self):
+        with self._lock:
+            return {
+                'event': 'status',
+                'workers': self.workers,
+                'display': self.display,
+                'queued': len(self._queued),
+                'running': len(self._running),
+            }
+
+    def _project(self, path):
+        projects = job_tasks.find_projects([os.path.abspath(path)]) if path else []
+        if len(projects) != 1:
+            raise ValueError('{} is not a single KiCad project'.format(path))
+        return projects[0]
+
+    def _dispatch(self):
+        last_check = time.time()
+        while not self._closed.is_set():
+            try:
+                self._handle_event(*self._events.get(timeout=WORKER_CHECK_INTERVAL))
+            except queue.Empty:
+                pass
+            if time.time() - last_check >= WORKER_CHECK_INTERVAL:
+                self._check_workers()
+                last_check = time.time()
+
+    def _handle_event(self, job_id, event):
+        event['job'] = job_id
+        with self._lock:
+            if event['event'] == 'started':
+                self._queued.discard(job_id)
+                self._running[job_id] = event['worker']
+            listener = self._listeners.get(job_id)
+            if event['event'] in FINAL_EVENTS:
+                self._running.pop(job_id, None)
+                self._listeners.pop(job_id, None)
+        if event['event'] in FINAL_EVENTS:
+            logger.info('Job {} {}'.format(job_id, event['event']))
+        if listener is not None:
+            listener.put(event)
+
+    def _check_workers(self):
+        """
+        End the jobs of workers that died, e.g. on a crash in pcbnew. They
+        don't send a finished or error event, and the pool replaces them
+        without telling.
+        """
+        with self._lock:
+            running = list(self._running.items())
+        for job_id, worker in running:
+            if _is_alive(worker):
+                continue
+            logger.error('Worker {} of job {} died'.format(worker, job_id))
+            with self._lock:
+                # Its result never arrives
+                self._results.pop(job_id, None)
+            self._handle_event(job_id, {'event': 'error', 'message': 'Worker {} died'.format(worker)})
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError('a request must be a JSON object')
+            except ValueError as e:
+                self._send({'event': 'error', 'message': 'Invalid request: {}'.format(e)})
+                continue
+
+            try:
+                if request.get('command') == 'status':
+                    self._send(self.server.automation_daemon.status())
+                else:
+                    self._run_job(request)
+            except socket.error:
+                logger.info('Client disconnected')
+                return
+
+    def _run_job(self, request):
+        automation_daemon = self.server.automation_daemon
+        try:
+            job_id, events = automation_daemon.submit(request)
+        except ValueError as e:
+            self._send({'event': 'error', 'message': str(e)})
+            return
+
+        try:
+            # The job timeout starts when the job does, for jobs that hang. A
+            # job that timed out is not stopped, it keeps its worker until it
+            # ends.
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(0, deadline - time.time())
+                try:
+                    event = events.get(timeout=timeout)
+                except queue.Empty:
+                    self._send({'event': 'error', 'job': job_id,
+                        'message': 'Timed out after {} s'.format(automation_daemon.job_timeout)})
+                    return
+                if event['event'] == 'started' and automation_daemon.job_timeout is not None:
+                    deadline = time.time() + automation_daemon.job_timeout
+                self._send(event)
+                if event['event'] in FINAL_EVENTS:
+                    return
+        finally:
+            automation_daemon.forget(job_id)
+
+    def _send(self, event):
+        self.wfile.write((json.dumps(event, sort_keys=True) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def _is_listening(socket_path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        client.close()
+
+def serve(automation_daemon, socket_path=DEFAULT_SOCKET):
+    """
+    Accept requests on socket_path until the process is stopped.
+    """
+    if os.path.exists(socket_path):
+        if _is_listening(socket_path):
+            raise RuntimeError('A daemon is already listening on {}'.format(socket_path))
+        # Left behind by a daemon that was killed
+        os.unlink(socket_path)
+
+    server = _Server(socket_path, _RequestHandler)
+    server.automation_daemon = automation_daemon
+    logger.info('Listening on {} with {} workers'.format(socket_path, automation_daemon.workers))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+def send_request(request, socket_path=DEFAULT_SOCKET):
+    """
+    Send a request to the daemon, yielding the events of the response as
+    they arrive.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    try:
+        client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        response = client.makefile('rb')
+        try:
+            for line in iter(response.readline, b''):
+                event = json.loads(line.decode('utf-8'))
+                yield event
+                if event['event'] in FINAL_EVENTS:
+                    return
+        finally:
+            response.close()
+    finally:
+        client.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run KiCad automation jobs submitted over a Unix socket')
+    parser.add_argument('--socket', help='Unix socket of the daemon (default: {})'.format(DEFAULT_SOCKET),
+        default=DEFAULT_SOCKET
+    )
+    subparsers = parser.add_subparsers(help='Command:', dest='command')
+
+    serve_parser = subparsers.add_parser('serve', help='Start the daemon')
+    serve_parser.add_argument('--jobs', '-j', help='Number of worker processes (default: number of CPUs)',
+        type=int
+    )
+    serve_parser.add_argument('--output_dir', help='Output directory of jobs that do not set one (default: {})'.format(DEFAULT_OUTPUT_DIR),
+        default=DEFAULT_OUTPUT_DIR
+    )
+    serve_parser.add_argument('--no_display', help='Do not start Xvfb displays, only the tasks without KiCad UI can run',
+        action='store_true'
+    )
+    serve_parser.add_argument('--job_timeout', help='Seconds a job can run before its client gets an error, the job is not stopped',
+        type=float
+    )
+
+    submit_parser = subparsers.add_parser('submit', help='Run tasks on a project and print the events of the job as JSON lines')
+    submit_parser.add_argument('project', help='Project directory, .pro, .sch or .kicad_pcb file')
+    submit_parser.add_argument('output_dir', help='Output directory (default: chosen by the daemon)',
+        nargs='?'
+    )
+    submit_parser.add_argument('--task', '-t', help='Task to run, can be given multiple times (default: run_erc and run_drc)',
+        choices=job_tasks.TASKS,
+        action='append',
+        dest='tasks'
+    )
+    submit_parser.add_argument('--warnings_as_errors', '-w', help='Treat ERC warnings as errors',
+        action='store_true'
+    )
+    submit_parser.add_argument('--ignore_unconnected', '-i', help='Ignore unconnected pads in DRC',
+        action='store_true'
+    )
+    submit_parser.add_argument('--precheck', help='Check the schematic files first, skip the eeschema ERC when they fail',
+        action='store_true'
+    )
+    submit_parser.add_argument('--validate', help='Check the plotted gerber and drill files',
+        action='store_true'
+    )
+    add_record_arguments(submit_parser)
+    submit_parser.add_argument('--trace', help='Write a Chrome trace and a summary of the tasks to {} in the output directory'.format(job_tasks.TRACE_FILE),
+        action='store_true'
+    )
+
+    subparsers.add_parser('status', help='Print the number of queued and running jobs')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        file_util.mkdir_p(args.output_dir)
+        automation_daemon = AutomationDaemon(os.path.abspath(args.output_dir), args.jobs, not args.no_display,
+            args.job_timeout)
+        # Stop the workers, and the displays and KiCad instances they run
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            serve(automation_daemon, args.socket)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Already stopping
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            automation_daemon.close()
+
+    elif args.command == 'submit':
+        request = {
+            'project': os.path.abspath(args.project),
+            'tasks': args.tasks or DEFAULT_TASKS,
+            'options': {
+                'warnings_as_errors': args.warnings_as_errors,
+                'ignore_unconnected': args.ignore_unconnected,
+                'record': record_mode_from_args(submit_parser, args),
+                'precheck': args.precheck,
+                'validate': args.validate,
+                'trace': args.trace,
+            },
+        }
+        if args.output_dir:
+            request['output_dir'] = os.path.abspath(args.output_dir)
+
+        event = None
+        for event in send_request(request, args.socket):
+            print(json.dumps(event, sort_keys=True))
+            sys.stdout.flush()
+        if event is None or event['event'] != 'finished':
+            exit(-1)
+        exit(event['failures'])
+
+    elif args.command == 'status':
+        for event in send_request({'command': 'status'}, args.socket):
+            print(json.dumps(event, sort_keys=True))
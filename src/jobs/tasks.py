@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+#
+# Runs the automation tasks (ERC, DRC, exports and plots) on KiCad projects.
+# Shared by the batch runner and other job front ends.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import glob
+import logging
+import os
+import sys
+import time
+
+from collections import namedtuple
+
+jobs_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(jobs_dir)
+
+sys.path.append(repo_root)
+
+from util import file_util
+from util import trace
+from util.ui_automation import RECORD_OFF
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Schematic tasks map on eeschema pipeline actions
+SCHEMATIC_TASKS = ['run_erc', 'export_pdf', 'export_svg', 'bom']
+LAYOUT_TASKS = ['run_drc', 'plot_gerbers', 'plot_pdf']
+TASKS = SCHEMATIC_TASKS + LAYOUT_TASKS
+
+# Tasks that drive the KiCad UI and need an X display
+GUI_TASKS = ['run_erc', 'export_pdf', 'export_svg', 'run_drc']
+
+PROJECT_EXTENSIONS = ('.pro', '.sch', '.kicad_pcb')
+
+# Trace of a project written with the trace option, the summary is written
+# next to it
+TRACE_FILE = 'trace.json'
+
+Project = namedtuple('Project', ['name', 'schematic', 'layout'])
+
+def find_projects(patterns):
+    """
+    Returns the projects matching a list of paths or glob patterns. Paths can
+    point to a project directory or to a .pro, .sch or .kicad_pcb file.
+    """
+    projects = []
+    seen = set()
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            logger.warning('No projects found for {}'.format(pattern))
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                bases = [os.path.splitext(p)[0] for p in glob.glob(os.path.join(path, '*.pro'))]
+            elif path.endswith(PROJECT_EXTENSIONS):
+                bases = [os.path.splitext(path)[0]]
+            else:
+                logger.warning('{} is not a KiCad project'.format(path))
+                continue
+
+            for base in sorted(bases):
+                if base in seen:
+                    continue
+                seen.add(base)
+                schematic = base + '.sch'
+                layout = base + '.kicad_pcb'
+                projects.append(Project(
+                    os.path.basename(base),
+                    schematic if os.path.isfile(schematic) else None,
+                    layout if os.path.isfile(layout) else None
+                ))
+    return projects
+
+def task_result(task, status, violations=0, outputs=None, message=None, duration=0):
+    return {
+        'task': task,
+        'status': status,
+        'violations': violations,
+        'outputs': outputs or [],
+        'message': message,
+        'duration': duration,
+    }
+
+def run_project_tasks(project, tasks, output_dir, session=None, options=None, on_result=None):
+    """
+    Run tasks on a project, writing the output to output_dir. Returns a
+    result dict per task, a failing task does not stop the others. on_result
+    is called with every result as soon as it is known. With the trace option
+    a trace of the tasks is written to TRACE_FILE in output_dir.
+    """
+    options = options or {}
+    file_util.mkdir_p(output_dir)
+    if not options.get('trace', False):
+        return _run_project_tasks(project, tasks, output_dir, session, options, on_result)
+
+    with trace.tracing() as tracer:
+        results = _run_project_tasks(project, tasks, output_dir, session, options, on_result)
+    tracer.write(os.path.join(output_dir, TRACE_FILE))
+    return results
+
+def _run_project_tasks(project, tasks, output_dir, session, options, on_result):
+    results = []
+
+    def add_result(result):
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    schematic_tasks = [task for task in tasks if task in SCHEMATIC_TASKS]
+    if schematic_tasks:
+        for result in _run_schematic_tasks(project, schematic_tasks, output_dir, session, options):
+            add_result(result)
+
+    for task in tasks:
+        if task not in LAYOUT_TASKS:
+            continue
+        if project.layout is None:
+            add_result(task_result(task, 'skipped', message='No layout file'))
+            continue
+
+        start = time.time()
+        try:
+            with trace.span('task ' + task, 'task', project=project.name):
+                if task == 'run_drc':
+                    result = _run_drc(project, output_dir, session, options)
+                else:
+                    result = _plot(project, task, output_dir, options)
+        except Exception as e:
+            logger.exception('{} failed on {}'.format(task, project.name))
+            result = task_result(task, 'error', message=str(e))
+        result['duration'] = time.time() - start
+        add_result(result)
+
+    return results
+
+def _run_schematic_tasks(project, tasks, output_dir, session, options):
+    if project.schematic is None:
+        return [task_result(task, 'skipped', message='No schematic file') for task in tasks]
+
+    from eeschema import schematic
+
+    start = time.time()
+    try:
+        with trace.span('task ' + '+'.join(tasks), 'task', project=project.name):
+            pipeline_results = schematic.eeschema_pipeline(project.schematic, output_dir, tasks,
+                warning_as_error=options.get('warnings_as_errors', False),
+                generate_junit_xml=True,
+                all_pages=options.get('all_pages', True),
+                session=session,
+                record=options.get('record', RECORD_OFF),
+                precheck=options.get('precheck', False))
+    except Exception as e:
+        logger.exception('Schematic tasks failed on {}'.format(project.name))
+        return [task_result(task, 'error', message=str(e)) for task in tasks]
+    # The tasks share a single eeschema instance
+    duration = (time.time() - start) / len(tasks)
+
+    results = []
+    for task in tasks:
+        if task == 'run_erc':
+            errors = pipeline_results[task]
+            results.append(task_result(task, 'failed' if errors else 'passed',
+                violations=errors,
+                outputs=[os.path.join(output_dir, 'junit.xml')],
+                duration=duration))
+        else:
+            results.append(task_result(task, 'passed',
+                outputs=[pipeline_results[task]],
+                duration=duration))
+    return results
+
+def _run_drc(project, output_dir, session, options):
+    from pcbnew_automation import run_drc
+
+    drc_file = run_drc.run_drc(project.layout, output_dir, options.get('record', RECORD_OFF), session)
+    # junit.xml in the project output dir is written by the ERC
+    drc_result = run_drc.parse_drc(drc_file,
+        ignore_unconnected=options.get('ignore_unconnected', False),
+        generate_json=True)
+    violations = drc_result['violations']
+    return task_result('run_drc', 'failed' if violations else 'passed',
+        violations=violations,
+        outputs=[drc_file, os.path.join(output_dir, 'drc.json')])
+
+def _plot(project, task, output_dir, options):
+    from pcbnew_automation import gerber_check, pcb_util, plot
+
+    pcb = pcb_util.PCB(project.layout)
+    layers = pcb.get_plot_enabled_layers()
+    if task == 'plot_gerbers':
+        validate = options.get('validate', False)
+        output_file = os.path.join(output_dir, '{}_gerbers.zip'.format(pcb.name))
+        outputs = [output_file]
+        if validate:
+            outputs.append(plot.gerber_check_file(pcb, output_dir))
+        try:
+            plot.plot(pcb, 'zip_gerbers', layers, output_dir, validate=validate)
+        except gerber_check.GerberCheckError as e:
+            return task_result(task, 'failed', outputs=outputs, message=str(e))
+        return task_result(task, 'passed', outputs=outputs)
+    else:
+        plot.plot(pcb, 'pdf', layers, output_dir)
+        output_file = os.path.join(output_dir, '{}.pdf'.format(pcb.name))
+    return task_result(task, 'passed', outputs=[output_file])
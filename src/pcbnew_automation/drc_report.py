@@ -0,0 +1,153 @@
+#
+# Streaming parser for the DRC report written by pcbnew:
+#
+#   ** Found 1 DRC errors **
+#   ErrType(3): Track too close to pad
+#       @(146.100 mm, 109.200 mm): Track 0.250 mm on F.Cu, length: 2.175 mm
+#       @(147.362 mm, 108.400 mm): Pad 2 of D1 on F.Cu and others
+#
+#   ** Found 1 unconnected pads **
+#   ErrType(1): Unconnected items
+#       @(142.200 mm, 105.860 mm): Pad 1 of J1 on All copper layers
+#       @(146.100 mm, 107.025 mm): Pad 2 of R1 on F.Cu
+#
+#   ** End of Report **
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import re
+
+from collections import namedtuple
+
+from util import baseline
+
+logger = logging.getLogger(__name__)
+
+class DrcReportError(Exception):
+    pass
+
+SECTION_DRC = 'drc'
+SECTION_UNCONNECTED = 'unconnected'
+SECTION_FOOTPRINTS = 'footprints'
+
+_SECTION_RE = re.compile(r'^\*\* Found ([0-9]+) (DRC errors|unconnected pads|Footprint errors) \*\*$')
+_SECTIONS = {
+    'DRC errors': SECTION_DRC,
+    'unconnected pads': SECTION_UNCONNECTED,
+    'Footprint errors': SECTION_FOOTPRINTS,
+}
+_ERROR_RE = re.compile(r'^ErrType\(([0-9]+)\): (.+)$')
+_LOCATION_RE = re.compile(r'^\s+@\(\s*(-?[0-9.]+) *(\w*), *(-?[0-9.]+) *(\w*)\): *(.*)$')
+_LAYER_RE = re.compile(r'\bon (All copper layers|[\w.]+)')
+_LENGTH_RE = re.compile(r',? length:? -?[0-9.]+ *\w*')
+
+DrcItem = namedtuple('DrcItem', ['position', 'description', 'layer'])
+DrcViolation = namedtuple('DrcViolation', ['section', 'rule', 'message', 'items', 'layer'])
+
+def _violation(section, rule, message, items):
+    return DrcViolation(section, rule, message, items, items[0].layer if items else None)
+
+def fingerprint(violation):
+    """
+    Baseline fingerprint of a violation: the positions and track lengths are
+    left out, they change when the items are moved.
+    """
+    return baseline.fingerprint('drc', violation.section, violation.rule, violation.message,
+        *sorted(_LENGTH_RE.sub('', item.description) for item in violation.items))
+
+class DrcReport(object):
+    """
+    Iterate over a DrcReport to get the violations of a report, as
+    DrcViolation records, while the file is read. The counts are available
+    once the iteration is done:
+
+        report = DrcReport(f)
+        for violation in report:
+            ...
+        report.drc_errors
+    """
+
+    def __init__(self, lines, name='DRC report'):
+        self.lines = lines
+        self.name = name
+        # Counts from the section headers
+        self.drc_errors = None
+        self.unconnected_pads = None
+        self.footprint_errors = 0
+        self.rule_counts = {}
+
+    def __iter__(self):
+        section = None
+        error = None
+        line_number = 0
+        for line_number, line in enumerate(self.lines, 1):
+            line = line.rstrip('\r\n')
+            match = _LOCATION_RE.match(line)
+            if match:
+                if error is None:
+                    logger.error('Location without error on line {}: {}'.format(line_number, line))
+                    continue
+                description = match.group(5)
+                layer = _LAYER_RE.search(description)
+                error[2].append(DrcItem((float(match.group(1)), float(match.group(3))),
+                    description, layer.group(1) if layer else None))
+                continue
+
+            if error is not None:
+                yield self._count(_violation(section, *error))
+                error = None
+
+            if line.startswith('ErrType'):
+                match = _ERROR_RE.match(line)
+                if match:
+                    error = (int(match.group(1)), match.group(2), [])
+            elif line.startswith('** Found'):
+                match = _SECTION_RE.match(line)
+                if match:
+                    section = _SECTIONS[match.group(2)]
+                    count = int(match.group(1))
+                    if section == SECTION_DRC:
+                        self.drc_errors = count
+                    elif section == SECTION_UNCONNECTED:
+                        self.unconnected_pads = count
+                    else:
+                        self.footprint_errors = count
+
+        if error is not None:
+            yield self._count(_violation(section, *error))
+
+        if line_number == 0:
+            raise DrcReportError('{} is empty'.format(self.name))
+        if self.drc_errors is None or self.unconnected_pads is None:
+            raise DrcReportError('No DRC error or unconnected pad count found in {}'.format(self.name))
+
+    def _count(self, violation):
+        key = (violation.section, violation.rule)
+        self.rule_counts[key] = self.rule_counts.get(key, 0) + 1
+        return violation
+
+    def error_count(self, ignore_unconnected=False):
+        if ignore_unconnected:
+            return self.drc_errors + self.footprint_errors
+        return self.drc_errors + self.unconnected_pads + self.footprint_errors
+
+    def summary(self):
+        return {
+            'drc_errors': self.drc_errors,
+            'unconnected_pads': self.unconnected_pads,
+            'footprint_errors': self.footprint_errors,
+            'rules': dict(('{}:{}'.format(*key), count) for key, count in self.rule_counts.items()),
+        }
@@ -0,0 +1,653 @@
+#!/usr/bin/env python
+#
+# Checks the Gerber and Excellon files of a plot before they go to the fab.
+# Every file is read once, in chunks that are matched with a single regex and
+# turned into NumPy arrays, so the modal coordinates, apertures and
+# interpolation modes are resolved for a whole chunk at a time. Per layer the
+# bounding box, primitive counts and a checksum of the geometry (independent
+# of the coordinate format) are reported, and a plot fails on empty copper
+# layers and on geometry outside the board outline.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class GerberCheckError(Exception):
+    pass
+
+GERBER = 'gerber'
+EXCELLON = 'excellon'
+
+FUNCTION_COPPER = 'Copper'
+FUNCTION_PROFILE = 'Profile'
+FUNCTION_DRILL = 'Drill'
+
+# Primitive kinds
+LINE = 1
+ARC = 2
+FLASH = 3
+REGION_EDGE = 4
+
+NM_PER_MM = 1e6
+NM_PER_INCH = 25.4e6
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Geometry may stick out of the board outline by this much, in mm
+DEFAULT_TOLERANCE = 0.01
+
+_FS_RE = re.compile(r'^FS[LTD]?[AI]?X\d(\d)Y\d(\d)')
+_AD_RE = re.compile(r'^ADD(\d+)([^,]+),?(.*)$')
+
+# Groups: 0 tool number, 1 tool diameter, 2 units, 3-4 position, 5-6 slot end
+_EXCELLON_RE = re.compile(
+    br'^(?:T(\d+)(?:C([-+]?[\d.]+))?[^\n]*'
+    br'|(METRIC|INCH)[^\n]*'
+    br'|(?=[XY])(?:X([-+]?[\d.]+))?(?:Y([-+]?[\d.]+))?(?:G85(?:X([-+]?[\d.]+))?(?:Y([-+]?[\d.]+))?)?\r?)$',
+    re.M)
+
+# Layer functions from KiCad's file names, when a file has no
+# TF.FileFunction attribute
+_NAME_FUNCTIONS = [
+    (re.compile(r'[-_](F|B|In\d+)[._]Cu\.|\.(gtl|gbl|g\d+)$', re.I), FUNCTION_COPPER),
+    (re.compile(r'[-_]Edge[._]Cuts\.|\.(gm1|gko)$', re.I), FUNCTION_PROFILE),
+]
+
+def _text(value):
+    return value.decode('ascii', 'replace')
+
+def _chunks(f, terminator):
+    """
+    Yields the content of f in chunks that end at a statement boundary.
+    """
+    rest = b''
+    while True:
+        data = f.read(CHUNK_SIZE)
+        if not data:
+            if rest:
+                yield rest
+            return
+        data = rest + data
+        end = data.rfind(terminator) + 1
+        # Don't split an extended command, it holds statements too
+        if terminator == b'*' and data.count(b'%', 0, end) % 2:
+            end = data.rfind(b'%', 0, end)
+        if end <= 0:
+            rest = data
+            continue
+        yield data[:end]
+        rest = data[end:]
+
+def _fill(values, is_set, initial):
+    """
+    Forward fill: every element gets the value of the last element where
+    is_set is True, or initial before the first one.
+    """
+    if not len(values):
+        return values
+    index = np.where(is_set, np.arange(len(values)), -1)
+    index = np.maximum.accumulate(index)
+    return np.where(index >= 0, values[np.maximum(index, 0)], initial)
+
+_GERBER_LETTERS = b'XYIJDGM'
+
+# Extended commands and comments, they are not made of words
+_GERBER_TEXT_RE = re.compile(br'%([^%]*)%|G0*4(?![0-9])([^*]*)\*')
+
+def _translation(keep, replacement=None):
+    """
+    A bytes.translate table and delete argument that keep the bytes in keep,
+    and delete all others or replace them with replacement.
+    """
+    others = bytes(bytearray(c for c in range(256) if c not in bytearray(keep)))
+    if replacement is None:
+        return None, others
+    table = bytearray(range(256))
+    for c in bytearray(others):
+        table[c] = ord(replacement)
+    return bytes(table), b''
+
+_WORD_LETTERS = _translation(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ*')
+_WORD_NUMBERS = _translation(b'0123456789-+', b' ')
+
+class _Statements(object):
+    """
+    The statements of a chunk of a Gerber file: for every letter of
+    _GERBER_LETTERS an array with its value per statement and an array
+    telling whether the statement has it, plus the texts of the extended
+    commands and comments.
+    """
+
+    def __init__(self, count):
+        self.values = {}
+        self.has = {}
+        self.extended = []
+        self.comments = []
+        for letter in bytearray(_GERBER_LETTERS):
+            self.values[letter] = np.zeros(count, np.int64)
+            self.has[letter] = np.zeros(count, bool)
+
+def _gerber_statements(chunk):
+    """
+    Split a chunk of a Gerber file into statements and their letter/number
+    words. Without the extended commands and comments every word is a letter
+    and a number, so the letters and the numbers are extracted separately
+    with bytes.translate and parsed in bulk by NumPy.
+    """
+    extended = []
+    comments = []
+    def text(match):
+        if match.group(1) is not None:
+            extended.append(match.group(1))
+        else:
+            comments.append(match.group(2))
+        return b'*'
+    words = _GERBER_TEXT_RE.sub(text, chunk)
+
+    letters = np.frombuffer(words.translate(*_WORD_LETTERS), np.uint8)
+    is_star = letters == ord('*')
+    statement_of = np.cumsum(is_star) - is_star
+    statements = _Statements(int(np.count_nonzero(is_star)) + 1)
+    statements.extended = extended
+    statements.comments = comments
+
+    is_letter = ~is_star
+    letters = letters[is_letter]
+    statement_of = statement_of[is_letter]
+    if not len(letters):
+        return statements
+    values = np.array(words.translate(*_WORD_NUMBERS).split(), dtype='S').astype(np.int64)
+    if len(values) != len(letters):
+        raise GerberCheckError('Words without a number')
+    for letter in bytearray(_GERBER_LETTERS):
+        selected = letters == letter
+        statements.values[letter][statement_of[selected]] = values[selected]
+        statements.has[letter][statement_of[selected]] = True
+    return statements
+
+def _column(rows, column, dtype):
+    """
+    The values of a column of matched rows and where they are set.
+    """
+    strings = rows[:, column]
+    is_set = strings != b''
+    values = np.zeros(len(rows), dtype)
+    values[is_set] = strings[is_set].astype(dtype)
+    return values, is_set
+
+def _point_keys(x, y):
+    x = np.rint(x).astype(np.int64)
+    y = np.rint(y).astype(np.int64)
+    return x * np.int64(73856093) ^ y * np.int64(19349663)
+
+class LayerReport(object):
+    """
+    The result of checking a Gerber or Excellon file. Coordinates are in nm,
+    the bounding box is (min x, min y, max x, max y) or None when the file
+    has no geometry.
+    """
+
+    def __init__(self, filename, kind):
+        self.filename = filename
+        self.kind = kind
+        self.function = None
+        self.bbox = None
+        self.counts = {}
+        self._digest = hashlib.sha256()
+        self._edge_keys = []
+        self._end_keys = []
+
+    @property
+    def name(self):
+        return os.path.basename(self.filename)
+
+    @property
+    def checksum(self):
+        return self._digest.hexdigest()
+
+    def _extend_bbox(self, x, y, pad=0):
+        if not len(x):
+            return
+        bbox = (np.min(x - pad), np.min(y - pad), np.max(x + pad), np.max(y + pad))
+        if self.bbox is None:
+            self.bbox = bbox
+        else:
+            self.bbox = (min(self.bbox[0], bbox[0]), min(self.bbox[1], bbox[1]),
+                max(self.bbox[2], bbox[2]), max(self.bbox[3], bbox[3]))
+
+    def _count(self, name, count):
+        self.counts[name] = self.counts.get(name, 0) + int(count)
+
+    def edge_keys(self):
+        """
+        Keys of the lines and arcs, the same for a line in either direction.
+        """
+        return np.concatenate(self._edge_keys) if self._edge_keys else np.zeros(0, np.int64)
+
+    def is_closed(self):
+        """
+        Whether the lines and arcs form closed contours: every end point is
+        shared by an even number of them.
+        """
+        if not self._end_keys:
+            return False
+        _, counts = np.unique(np.concatenate(self._end_keys), return_counts=True)
+        return not np.any(counts % 2)
+
+    def primitives(self):
+        return sum(self.counts.get(name, 0) for name in ('lines', 'arcs', 'flashes', 'regions', 'hits', 'slots'))
+
+    def to_dict(self):
+        return {
+            'file': self.name,
+            'kind': self.kind,
+            'function': self.function,
+            'bbox': [round(value / NM_PER_MM, 4) for value in self.bbox] if self.bbox is not None else None,
+            'counts': self.counts,
+            'checksum': self.checksum,
+        }
+
+class GerberGeometry(object):
+    """
+    The primitives of a Gerber file as arrays, collected while it is checked:
+    kind, start and end points and arc center offsets in nm, the
+    interpolation mode (1 linear, 2 clockwise, 3 counterclockwise) and the
+    aperture code. apertures maps aperture codes to
+    (template, width, height), with the sizes in nm.
+    """
+
+    def __init__(self):
+        self.apertures = {}
+        self._parts = []
+        self.kind = self.x_start = self.y_start = self.x_end = self.y_end = None
+        self.i = self.j = self.interpolation = self.aperture = None
+
+    def _append(self, columns):
+        self._parts.append(columns)
+
+    def _finish(self):
+        if self._parts:
+            columns = np.concatenate(self._parts)
+        else:
+            columns = np.zeros((0, 9))
+        self._parts = []
+        self.kind = columns[:, 0].astype(np.int64)
+        self.x_start, self.y_start, self.x_end, self.y_end = (columns[:, c] for c in range(1, 5))
+        self.i, self.j = columns[:, 5], columns[:, 6]
+        self.interpolation = columns[:, 7].astype(np.int64)
+        self.aperture = columns[:, 8].astype(np.int64)
+
+    def __len__(self):
+        return len(self.kind) if self.kind is not None else sum(len(part) for part in self._parts)
+
+class _GerberParser(object):
+    def __init__(self, report, geometry=None):
+        self.report = report
+        self.geometry = geometry
+        self.unit = NM_PER_MM
+        self.decimals = (6, 6)
+        self._update_scale()
+        self.apertures = {}
+        self.aperture_sizes = None
+        self.x = 0.0
+        self.y = 0.0
+        self.interpolation = 1
+        self.region = False
+        self.aperture = -1
+
+    def _update_scale(self):
+        # nm per coordinate unit
+        self.x_scale = self.unit / 10 ** self.decimals[0]
+        self.y_scale = self.unit / 10 ** self.decimals[1]
+
+    def _statement(self, statement):
+        report = self.report
+        if statement.startswith('FS'):
+            match = _FS_RE.match(statement)
+            if match is None:
+                raise GerberCheckError('Unsupported format {} in {}'.format(statement, report.name))
+            self.decimals = (int(match.group(1)), int(match.group(2)))
+            self._update_scale()
+        elif statement.startswith('MO'):
+            self.unit = NM_PER_INCH if statement == 'MOIN' else NM_PER_MM
+            self._update_scale()
+        elif statement.startswith('AD'):
+            match = _AD_RE.match(statement)
+            if match is None:
+                return
+            code, template = int(match.group(1)), match.group(2)
+            try:
+                parameters = [float(p) for p in match.group(3).split('X') if p]
+            except ValueError:
+                parameters = []
+            size = 0.0
+            if parameters and template in ('C', 'P'):
+                size = parameters[0]
+            elif parameters and template in ('R', 'O'):
+                size = max(parameters[:2])
+            self.apertures[code] = size * self.unit
+            if self.geometry is not None:
+                width = height = 0.0
+                if parameters and template in ('C', 'P'):
+                    width = height = parameters[0]
+                elif parameters and template in ('R', 'O'):
+                    width, height = parameters[0], parameters[1] if len(parameters) > 1 else parameters[0]
+                self.geometry.apertures[code] = (template, width * self.unit, height * self.unit)
+            self.aperture_sizes = None
+            report._digest.update('{} {} {}\n'.format(code, template, size * self.unit).encode('ascii'))
+        elif statement.startswith('TF.FileFunction,'):
+            report.function = statement.split(',')[1]
+
+    def _aperture_sizes(self, codes):
+        """
+        Sizes of the apertures with codes, 0 for undefined ones.
+        """
+        if self.aperture_sizes is None:
+            self.aperture_sizes = np.zeros(max(self.apertures) + 1 if self.apertures else 1)
+            for code, size in self.apertures.items():
+                self.aperture_sizes[code] = size
+        defined = (codes >= 0) & (codes < len(self.aperture_sizes))
+        return np.where(defined, self.aperture_sizes[np.where(defined, codes, 0)], 0.0)
+
+    def parse(self, chunk):
+        statements = _gerber_statements(chunk)
+        report = self.report
+
+        # Extended commands and attributes in comments are handled first,
+        # they define the format and apertures used by the operations
+        for text in statements.extended:
+            for statement in _text(text).split('*'):
+                self._statement(statement.strip())
+        for text in statements.comments:
+            text = _text(text).strip()
+            if text.startswith('#@!'):
+                self._statement(text[3:].strip())
+
+        codes = statements.values[ord('G')]
+        has_g = statements.has[ord('G')]
+        d_codes = statements.values[ord('D')]
+        has_d = statements.has[ord('D')]
+
+        interpolation_set = has_g & (codes >= 1) & (codes <= 3)
+        interpolation = _fill(codes, interpolation_set, self.interpolation)
+        region_set = has_g & ((codes == 36) | (codes == 37))
+        region = _fill(codes == 36, region_set, self.region)
+        has_aperture = has_d & (d_codes >= 10)
+        aperture = _fill(d_codes, has_aperture, self.aperture)
+        if len(codes):
+            self.interpolation, self.region, self.aperture = int(interpolation[-1]), bool(region[-1]), int(aperture[-1])
+        report._count('regions', np.count_nonzero(has_g & (codes == 36)))
+
+        is_operation = has_d & (d_codes >= 1) & (d_codes <= 3)
+        if not np.any(is_operation):
+            return
+        codes = d_codes[is_operation]
+        interpolation = interpolation[is_operation]
+        region = region[is_operation]
+        aperture = aperture[is_operation]
+
+        x = statements.values[ord('X')][is_operation]
+        y = statements.values[ord('Y')][is_operation]
+        i = statements.values[ord('I')][is_operation].astype(np.float64)
+        j = statements.values[ord('J')][is_operation].astype(np.float64)
+        x_end = _fill(x * self.x_scale, statements.has[ord('X')][is_operation], self.x)
+        y_end = _fill(y * self.y_scale, statements.has[ord('Y')][is_operation], self.y)
+        i *= self.x_scale
+        j *= self.y_scale
+        x_start = np.concatenate(([self.x], x_end[:-1]))
+        y_start = np.concatenate(([self.y], y_end[:-1]))
+        self.x, self.y = float(x_end[-1]), float(y_end[-1])
+
+        draw = codes == 1
+        arc = draw & (interpolation > 1)
+        kind = np.zeros(len(codes), np.int64)
+        kind[draw & ~region & ~arc] = LINE
+        kind[draw & ~region & arc] = ARC
+        kind[draw & region] = REGION_EDGE
+        kind[codes == 3] = FLASH
+        report._count('lines', np.count_nonzero(kind == LINE))
+        report._count('arcs', np.count_nonzero(kind == ARC))
+        report._count('flashes', np.count_nonzero(kind == FLASH))
+
+        primitive = kind != 0
+        pad = np.where(kind == REGION_EDGE, 0.0, self._aperture_sizes(aperture) / 2)
+        report._extend_bbox(x_end[primitive], y_end[primitive], pad[primitive])
+        drawn = draw & primitive
+        report._extend_bbox(x_start[drawn], y_start[drawn], pad[drawn])
+        if np.any(arc):
+            self._arc_extremes(x_start[arc], y_start[arc], x_end[arc], y_end[arc],
+                i[arc], j[arc], interpolation[arc] == 3, pad[arc])
+
+        edges = (kind == LINE) | (kind == ARC)
+        start_keys = _point_keys(x_start[edges], y_start[edges])
+        end_keys = _point_keys(x_end[edges], y_end[edges])
+        report._edge_keys.append(start_keys + end_keys)
+        report._end_keys.append(np.concatenate((start_keys, end_keys)))
+
+        geometry = np.column_stack((kind, x_start, y_start, x_end, y_end, i, j, aperture))[primitive]
+        report._digest.update(np.rint(geometry).astype('<i8').tobytes())
+        if self.geometry is not None:
+            self.geometry._append(np.column_stack((kind, x_start, y_start, x_end, y_end, i, j,
+                interpolation, aperture))[primitive])
+
+    def _arc_extremes(self, x_start, y_start, x_end, y_end, i, j, ccw, pad):
+        """
+        Extend the bounding box with the points where arcs cross the axes
+        through their center (multi quadrant mode).
+        """
+        cx = x_start + i
+        cy = y_start + j
+        radius = np.hypot(i, j)
+        a0 = np.arctan2(y_start - cy, x_start - cx)
+        a1 = np.arctan2(y_end - cy, x_end - cx)
+        sweep = np.where(ccw, a1 - a0, a0 - a1) % (2 * math.pi)
+        # An arc that ends where it starts is a full circle
+        sweep[sweep == 0] = 2 * math.pi
+        for angle in (0, math.pi / 2, math.pi, 3 * math.pi / 2):
+            offset = np.where(ccw, angle - a0, a0 - angle) % (2 * math.pi)
+            inside = offset <= sweep
+            self.report._extend_bbox(cx[inside] + radius[inside] * math.cos(angle),
+                cy[inside] + radius[inside] * math.sin(angle), pad[inside])
+
+def _function_from_name(filename):
+    for pattern, function in _NAME_FUNCTIONS:
+        if pattern.search(os.path.basename(filename)):
+            return function
+    return None
+
+def check_gerber(filename, geometry=None):
+    """
+    Read a Gerber file, returns a LayerReport. The primitives are collected
+    in geometry when a GerberGeometry is given.
+    """
+    report = LayerReport(filename, GERBER)
+    parser = _GerberParser(report, geometry)
+    with open(filename, 'rb') as f:
+        for chunk in _chunks(f, b'*'):
+            parser.parse(chunk)
+    if geometry is not None:
+        geometry._finish()
+    if report.function is None:
+        report.function = _function_from_name(filename)
+    return report
+
+def _excellon_numbers(strings, unit):
+    """
+    Excellon coordinates in nm. KiCad writes decimal numbers, numbers
+    without a decimal point are read with 3 decimals (metric, trailing zeros)
+    or 4 decimals (inch).
+    """
+    decimals = 3 if unit == NM_PER_MM else 4
+    has_point = np.char.find(strings, b'.') >= 0
+    values = np.zeros(len(strings))
+    values[has_point] = strings[has_point].astype(np.float64)
+    values[~has_point] = strings[~has_point].astype(np.float64) / 10 ** decimals
+    return values * unit
+
+def check_excellon(filename):
+    """
+    Read an Excellon drill file, returns a LayerReport.
+    """
+    report = LayerReport(filename, EXCELLON)
+    report.function = FUNCTION_DRILL
+    unit = NM_PER_MM
+    diameters = {}
+    x = y = 0.0
+    tool = -1
+    report.counts = {'tools': 0, 'hits': 0, 'slots': 0}
+    with open(filename, 'rb') as f:
+        for chunk in _chunks(f, b'\n'):
+            matches = _EXCELLON_RE.findall(chunk)
+            if not matches:
+                continue
+            rows = np.array(matches, dtype='S')
+
+            for tool_number, diameter, units in rows[(rows[:, 1] != b'') | (rows[:, 2] != b''), :3]:
+                if units:
+                    unit = NM_PER_INCH if units == b'INCH' else NM_PER_MM
+                else:
+                    diameters[int(tool_number)] = float(diameter) * unit
+                    report._digest.update('T{} {}\n'.format(int(tool_number), float(diameter) * unit).encode('ascii'))
+            report.counts['tools'] = len(diameters)
+
+            # T0 unloads the tool
+            tools, has_tool = _column(rows, 0, np.int64)
+            selected = _fill(tools, has_tool & (rows[:, 1] == b''), tool)
+            tool = int(selected[-1])
+
+            is_hit = (rows[:, 3] != b'') | (rows[:, 4] != b'')
+            hits = rows[is_hit]
+            if not len(hits):
+                continue
+            selected = selected[is_hit]
+            has_x = hits[:, 3] != b''
+            has_y = hits[:, 4] != b''
+            x_values = np.zeros(len(hits))
+            y_values = np.zeros(len(hits))
+            x_values[has_x] = _excellon_numbers(hits[has_x, 3], unit)
+            y_values[has_y] = _excellon_numbers(hits[has_y, 4], unit)
+            x_hits = _fill(x_values, has_x, x)
+            y_hits = _fill(y_values, has_y, y)
+
+            # Slots end at the coordinates after G85, those that are not
+            # given are the same as the start
+            is_slot = (hits[:, 5] != b'') | (hits[:, 6] != b'')
+            x_slot_ends = x_hits.copy()
+            y_slot_ends = y_hits.copy()
+            has_x_end = hits[:, 5] != b''
+            has_y_end = hits[:, 6] != b''
+            x_slot_ends[has_x_end] = _excellon_numbers(hits[has_x_end, 5], unit)
+            y_slot_ends[has_y_end] = _excellon_numbers(hits[has_y_end, 6], unit)
+            x, y = float(x_slot_ends[-1]), float(y_slot_ends[-1])
+
+            sizes = np.array([diameters.get(t, 0.0) for t in range(max(diameters) + 1)]) \
+                if diameters else np.zeros(1)
+            pad = np.where((selected >= 0) & (selected < len(sizes)),
+                sizes[np.clip(selected, 0, len(sizes) - 1)], 0.0) / 2
+            report._extend_bbox(x_hits, y_hits, pad)
+            report._extend_bbox(x_slot_ends[is_slot], y_slot_ends[is_slot], pad[is_slot])
+            report.counts['hits'] += int(np.count_nonzero(~is_slot))
+            report.counts['slots'] += int(np.count_nonzero(is_slot))
+
+            geometry = np.column_stack((selected, x_hits, y_hits, x_slot_ends, y_slot_ends))
+            report._digest.update(np.rint(geometry).astype('<i8').tobytes())
+    return report
+
+def check_file(filename):
+    if os.path.splitext(filename)[1].lower() in ('.drl', '.xln', '.exc'):
+        return check_excellon(filename)
+    return check_gerber(filename)
+
+def _inside(bbox, outer, tolerance):
+    return bbox[0] >= outer[0] - tolerance and bbox[1] >= outer[1] - tolerance \
+        and bbox[2] <= outer[2] + tolerance and bbox[3] <= outer[3] + tolerance
+
+def validate(reports, tolerance=DEFAULT_TOLERANCE, allow_empty=()):
+    """
+    Returns a list of problems found in the LayerReports of a plot: empty
+    copper layers, an open or empty board outline and copper or drills
+    outside the outline. The outline is only checked when it was plotted.
+    When the outline is plotted on the other layers too, it does not count
+    as copper. Copper layers named in allow_empty may be empty, e.g. the
+    layers without items on the board.
+    """
+    problems = []
+    tolerance *= NM_PER_MM
+    outline = None
+    for report in reports:
+        if report.function == FUNCTION_PROFILE:
+            outline = report
+    outline_keys = outline.edge_keys() if outline is not None else None
+
+    for report in reports:
+        if report.function != FUNCTION_COPPER or report.name in allow_empty:
+            continue
+        primitives = report.primitives()
+        if outline_keys is not None and len(outline_keys):
+            primitives -= int(np.count_nonzero(np.isin(report.edge_keys(), outline_keys)))
+        if primitives <= 0:
+            problems.append('{} is an empty copper layer'.format(report.name))
+
+    if outline is not None:
+        if outline.bbox is None:
+            problems.append('The board outline {} is empty'.format(outline.name))
+            return problems
+        if not outline.is_closed():
+            problems.append('The board outline {} is not closed'.format(outline.name))
+        for report in reports:
+            if report.function not in (FUNCTION_COPPER, FUNCTION_DRILL) or report.bbox is None:
+                continue
+            if not _inside(report.bbox, outline.bbox, tolerance):
+                problems.append('{} extends outside the board outline {}'.format(report.name, outline.name))
+    return problems
+
+def write_report(reports, problems, filename):
+    with open(filename, 'w') as f:
+        json.dump({
+            'layers': [report.to_dict() for report in reports],
+            'problems': problems,
+        }, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check Gerber and Excellon files')
+
+    parser.add_argument('files', nargs='+', help='Gerber and Excellon (.drl) files of a plot')
+    parser.add_argument('--report', help='Write the results to this JSON file')
+    parser.add_argument('--allow_empty_copper', help='Don\'t fail on empty copper layers',
+        action='store_true', default=False)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    reports = [check_file(filename) for filename in args.files]
+    allow_empty = [report.name for report in reports] if args.allow_empty_copper else ()
+    problems = validate(reports, allow_empty=allow_empty)
+    for report in reports:
+        logger.info('{}: {}'.format(report.name, json.dumps(report.to_dict(), sort_keys=True)))
+    for problem in problems:
+        logger.error(problem)
+    if args.report:
+        write_report(reports, problems, args.report)
+    exit(1 if problems else 0)
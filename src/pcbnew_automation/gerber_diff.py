@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+#
+# Visual diff of the Gerber files of two revisions of a layer. Both files are
+# rasterized on the same pixel grid into NumPy bitmaps and compared, giving an
+# image with the added and removed copper and the changed area. Rendering is
+# vectorized: strokes and rectangular flashes become quadrilaterals, which are
+# filled like the regions by counting edge crossings per pixel row, and round
+# ends and flashes are stamped as batches of disks. The bitmaps are
+# rendered in bands of rows, so memory use does not grow with the board size.
+#
+# Polarity (LPD/LPC) and aperture macros are not supported, KiCad does not
+# use them for tracks, pads and zones. Both revisions are rendered the same
+# way, so approximations like arcs drawn as short lines don't show up as
+# changes.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+
+import numpy as np
+
+pcbnew_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(pcbnew_dir)
+
+sys.path.append(repo_root)
+
+from pcbnew_automation import gerber_check
+from pcbnew_automation.gerber_check import ARC, FLASH, LINE, NM_PER_MM, REGION_EDGE
+from util.png import write_png, COLOR_TYPE_RGB
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DPI = 300
+BAND_HEIGHT = 256
+
+# Arcs are drawn as lines of at most this many pixels
+ARC_SEGMENT_LENGTH = 2.0
+
+# Number of pixels or edge crossings handled in one NumPy operation
+_BATCH_SIZE = 1 << 20
+
+# Colors of the diff image
+BACKGROUND_COLOR = (255, 255, 255)
+UNCHANGED_COLOR = (200, 200, 200)
+REMOVED_COLOR = (220, 0, 0)
+ADDED_COLOR = (0, 160, 0)
+
+# Aperture shapes, polygons are drawn as disks
+_DISK = 1
+_RECTANGLE = 2
+_OBROUND = 3
+_SHAPES = {'C': _DISK, 'P': _DISK, 'R': _RECTANGLE, 'O': _OBROUND}
+
+class Grid(object):
+    """
+    The pixels covering a bounding box (in nm), with the origin at the top
+    left corner. Rows go down, as in images, while Gerber y coordinates go up.
+    """
+
+    def __init__(self, bbox, dpi=DEFAULT_DPI, band_height=BAND_HEIGHT):
+        self.pixel_size = 25.4e6 / dpi
+        # A pixel of margin, so nothing is clipped at the edges
+        self.x_min = bbox[0] - self.pixel_size
+        self.y_max = bbox[3] + self.pixel_size
+        self.width = int(math.ceil((bbox[2] - bbox[0]) / self.pixel_size)) + 2
+        self.height = int(math.ceil((bbox[3] - bbox[1]) / self.pixel_size)) + 2
+        self.band_height = band_height
+
+    @property
+    def bands(self):
+        return (self.height + self.band_height - 1) // self.band_height
+
+    def band_rows(self, band):
+        first = band * self.band_height
+        return first, min(first + self.band_height, self.height)
+
+    def columns(self, x):
+        return (x - self.x_min) / self.pixel_size
+
+    def rows(self, y):
+        return (self.y_max - y) / self.pixel_size
+
+    def pixel_area(self):
+        """
+        Area of a pixel in mm2.
+        """
+        return (self.pixel_size / NM_PER_MM) ** 2
+
+    def bbox_mm(self, first_row, first_column, last_row, last_column):
+        """
+        Bounding box in mm of an inclusive range of pixels.
+        """
+        size = self.pixel_size / NM_PER_MM
+        return [round(self.x_min / NM_PER_MM + first_column * size, 4),
+            round(self.y_max / NM_PER_MM - (last_row + 1) * size, 4),
+            round(self.x_min / NM_PER_MM + (last_column + 1) * size, 4),
+            round(self.y_max / NM_PER_MM - first_row * size, 4)]
+
+def _ranges(starts, counts):
+    """
+    The index of the range and the position in the range of every element of
+    the ranges [start, start + count).
+    """
+    index = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return index, starts[index] + offsets
+
+class _BandIndex(object):
+    """
+    The items that touch each band, from the first and last (exclusive) rows
+    they cover.
+    """
+
+    def __init__(self, first_rows, last_rows, grid):
+        first_rows = np.clip(first_rows, 0, grid.height)
+        last_rows = np.clip(last_rows, 0, grid.height)
+        used = last_rows > first_rows
+        first_bands = first_rows // grid.band_height
+        counts = np.where(used, (last_rows - 1) // grid.band_height - first_bands + 1, 0)
+        items, bands = _ranges(first_bands, counts)
+        order = np.argsort(bands, kind='mergesort')
+        self.items = items[order]
+        self.starts = np.searchsorted(bands[order], np.arange(grid.bands + 1))
+
+    def select(self, band):
+        return self.items[self.starts[band]:self.starts[band + 1]]
+
+def _arc_segments(x_start, y_start, x_end, y_end, i, j, ccw, segment_length):
+    """
+    Split arcs into lines of at most segment_length. Returns the lines and
+    the index of the arc of each line.
+    """
+    cx = x_start + i
+    cy = y_start + j
+    radius = np.hypot(i, j)
+    a0 = np.arctan2(y_start - cy, x_start - cx)
+    a1 = np.arctan2(y_end - cy, x_end - cx)
+    sweep = np.where(ccw, a1 - a0, a0 - a1) % (2 * math.pi)
+    # An arc that ends where it starts is a full circle
+    sweep[sweep == 0] = 2 * math.pi
+    counts = np.clip(np.ceil(sweep * radius / segment_length), 1, 1024).astype(np.int64)
+    arc, step = _ranges(np.zeros(len(counts), np.int64), counts)
+    angle_step = np.where(ccw, sweep, -sweep)[arc] / counts[arc]
+    angles0 = a0[arc] + angle_step * step
+    angles1 = angles0 + angle_step
+    x0 = cx[arc] + radius[arc] * np.cos(angles0)
+    y0 = cy[arc] + radius[arc] * np.sin(angles0)
+    x1 = cx[arc] + radius[arc] * np.cos(angles1)
+    y1 = cy[arc] + radius[arc] * np.sin(angles1)
+    # Arcs end exactly at their end point, so region contours stay closed
+    last = step == counts[arc] - 1
+    x1[last] = x_end[arc][last]
+    y1[last] = y_end[arc][last]
+    return x0, y0, x1, y1, arc
+
+def _fill_edges(x0, y0, x1, y1, first_row, rows, width):
+    """
+    Fill the polygons made of edges (in pixel coordinates) in a band of rows
+    with the nonzero winding rule: the winding number of every pixel is the
+    sum of the directions of the edges crossing its row left of its center.
+    """
+    winding = np.zeros(rows * (width + 1))
+    y_low = np.minimum(y0, y1)
+    y_high = np.maximum(y0, y1)
+    # The rows with their center in [y_low, y_high)
+    starts = np.maximum(np.ceil(y_low - 0.5), first_row).astype(np.int64)
+    ends = np.minimum(np.ceil(y_high - 0.5), first_row + rows).astype(np.int64)
+    counts = np.maximum(ends - starts, 0)
+    totals = np.cumsum(counts)
+    batch_start = 0
+    while batch_start < len(counts):
+        batch_end = int(np.searchsorted(totals, (totals[batch_start - 1] if batch_start else 0) + _BATCH_SIZE,
+            side='right'))
+        batch_end = max(batch_end, batch_start + 1)
+        batch = slice(batch_start, batch_end)
+        edge, row = _ranges(starts[batch], counts[batch])
+        edge += batch_start
+        center = row + 0.5
+        x = x0[edge] + (center - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+        column = np.clip(np.ceil(x - 0.5), 0, width).astype(np.int64)
+        direction = np.where(y1[edge] > y0[edge], 1.0, -1.0)
+        winding += np.bincount((row - first_row) * (width + 1) + column, direction,
+            minlength=len(winding))
+        batch_start = batch_end
+    return np.cumsum(winding.reshape(rows, width + 1), axis=1)[:, :width] != 0
+
+def _fill_disks(bitmap, cx, cy, radius, first_row):
+    """
+    Set the pixels of bitmap with their center in the disks (in pixel
+    coordinates). Disks are stamped in batches of the same size.
+    """
+    rows, width = bitmap.shape
+    # Disks with about the same radius share their pixel offsets
+    sizes = np.round(radius * 4) / 4
+    for size in np.unique(sizes):
+        selected = sizes == size
+        reach = int(math.ceil(size)) + 1
+        dy, dx = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+        dy = dy.ravel()
+        dx = dx.ravel()
+        x = cx[selected]
+        y = cy[selected]
+        batch = max(1, _BATCH_SIZE // len(dx))
+        for start in range(0, len(x), batch):
+            xs = x[start:start + batch, None]
+            ys = y[start:start + batch, None]
+            column = np.floor(xs).astype(np.int64) + dx
+            row = np.floor(ys).astype(np.int64) + dy
+            inside = (column + 0.5 - xs) ** 2 + (row + 0.5 - ys) ** 2 <= size * size
+            inside &= (row >= first_row) & (row < first_row + rows) & (column >= 0) & (column < width)
+            bitmap[row[inside] - first_row, column[inside]] = True
+
+def _quads(x0, y0, x1, y1, half_width):
+    """
+    The four edges of the rectangles around lines, all with the same
+    orientation, as arrays of edge start and end points.
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    length = np.hypot(dx, dy)
+    length[length == 0] = 1
+    nx = -dy / length * half_width
+    ny = dx / length * half_width
+    corners_x = (x0 + nx, x1 + nx, x1 - nx, x0 - nx)
+    corners_y = (y0 + ny, y1 + ny, y1 - ny, y0 - ny)
+    start_x = np.concatenate(corners_x)
+    start_y = np.concatenate(corners_y)
+    end_x = np.concatenate(corners_x[1:] + corners_x[:1])
+    end_y = np.concatenate(corners_y[1:] + corners_y[:1])
+    return start_x, start_y, end_x, end_y
+
+class LayerRaster(object):
+    """
+    The primitives of a GerberGeometry converted to pixel coordinates of a
+    Grid, rendered a band at a time with band().
+    """
+
+    def __init__(self, geometry, grid):
+        self.grid = grid
+        # Features thinner than a pixel are drawn a pixel wide
+        min_half = 0.5
+
+        # Aperture shapes and sizes in pixels, indexed by aperture code
+        size = max(geometry.apertures) + 1 if geometry.apertures else 1
+        aperture_shapes = np.zeros(size, np.int64)
+        aperture_widths = np.zeros(size)
+        aperture_heights = np.zeros(size)
+        for code, (template, width, height) in geometry.apertures.items():
+            aperture_shapes[code] = _SHAPES.get(template, 0)
+            aperture_widths[code] = width / grid.pixel_size
+            aperture_heights[code] = height / grid.pixel_size
+        defined = (geometry.aperture >= 0) & (geometry.aperture < size)
+        codes = np.where(defined, geometry.aperture, 0)
+        shapes = np.where(defined, aperture_shapes[codes], 0)
+        widths = np.where(defined, aperture_widths[codes], 0.0)
+        heights = np.where(defined, aperture_heights[codes], 0.0)
+
+        kind = geometry.kind
+        xs = grid.columns(geometry.x_start)
+        ys = grid.rows(geometry.y_start)
+        xe = grid.columns(geometry.x_end)
+        ye = grid.rows(geometry.y_end)
+        # Rows go down, which mirrors the arcs
+        i = geometry.i / grid.pixel_size
+        j = -geometry.j / grid.pixel_size
+        ccw = geometry.interpolation != 3
+        curved = geometry.interpolation > 1
+
+        # Lines and arcs drawn with an aperture
+        stroke = (kind == LINE) | (kind == ARC)
+        lines = stroke & ~curved
+        arcs = stroke & curved
+        ax0, ay0, ax1, ay1, arc = _arc_segments(xs[arcs], ys[arcs], xe[arcs], ye[arcs], i[arcs], j[arcs],
+            ccw[arcs], ARC_SEGMENT_LENGTH)
+        sx0 = np.concatenate((xs[lines], ax0))
+        sy0 = np.concatenate((ys[lines], ay0))
+        sx1 = np.concatenate((xe[lines], ax1))
+        sy1 = np.concatenate((ye[lines], ay1))
+        stroke_half = np.maximum(np.concatenate((widths[lines], widths[arcs][arc])) / 2, min_half)
+
+        # Flashes: rectangles, obrounds as a line with round ends, other
+        # apertures as disks
+        flash = kind == FLASH
+        fx, fy, fw, fh, fs = xe[flash], ye[flash], widths[flash], heights[flash], shapes[flash]
+        rect = fs == _RECTANGLE
+        obround = fs == _OBROUND
+        disk = fs == _DISK
+        horizontal = fw[obround] >= fh[obround]
+        ow = fw[obround]
+        oh = fh[obround]
+        core = np.where(horizontal, ow - oh, oh - ow) / 2
+        ox0 = np.where(horizontal, fx[obround] - core, fx[obround])
+        ox1 = np.where(horizontal, fx[obround] + core, fx[obround])
+        oy0 = np.where(horizontal, fy[obround], fy[obround] - core)
+        oy1 = np.where(horizontal, fy[obround], fy[obround] + core)
+        ohalf = np.maximum(np.minimum(ow, oh) / 2, min_half)
+
+        quad_x0 = np.concatenate((sx0, fx[rect] - np.maximum(fw[rect] / 2, min_half), ox0))
+        quad_y0 = np.concatenate((sy0, fy[rect], oy0))
+        quad_x1 = np.concatenate((sx1, fx[rect] + np.maximum(fw[rect] / 2, min_half), ox1))
+        quad_y1 = np.concatenate((sy1, fy[rect], oy1))
+        quad_half = np.concatenate((stroke_half, np.maximum(fh[rect] / 2, min_half), ohalf))
+        self.strokes = _quads(quad_x0, quad_y0, quad_x1, quad_y1, quad_half)
+
+        self.disks = (
+            np.concatenate((sx0, sx1, fx[disk], ox0, ox1)),
+            np.concatenate((sy0, sy1, fy[disk], oy0, oy1)),
+            np.concatenate((stroke_half, stroke_half, np.maximum(fw[disk] / 2, min_half), ohalf, ohalf)),
+        )
+
+        # Region contours, with their arcs as lines too
+        region = kind == REGION_EDGE
+        region_lines = region & ~curved
+        region_arcs = region & curved
+        rx0, ry0, rx1, ry1, _ = _arc_segments(xs[region_arcs], ys[region_arcs], xe[region_arcs],
+            ye[region_arcs], i[region_arcs], j[region_arcs], ccw[region_arcs], ARC_SEGMENT_LENGTH)
+        self.regions = (
+            np.concatenate((xs[region_lines], rx0)),
+            np.concatenate((ys[region_lines], ry0)),
+            np.concatenate((xe[region_lines], rx1)),
+            np.concatenate((ye[region_lines], ry1)),
+        )
+
+        self._stroke_bands = self._edge_bands(self.strokes)
+        self._region_bands = self._edge_bands(self.regions)
+        cy, radius = self.disks[1], self.disks[2]
+        self._disk_bands = _BandIndex(np.floor(cy - radius).astype(np.int64),
+            np.ceil(cy + radius).astype(np.int64) + 1, grid)
+
+    def _edge_bands(self, edges):
+        y_low = np.minimum(edges[1], edges[3])
+        y_high = np.maximum(edges[1], edges[3])
+        return _BandIndex(np.ceil(y_low - 0.5).astype(np.int64), np.ceil(y_high - 0.5).astype(np.int64),
+            self.grid)
+
+    def band(self, band):
+        """
+        The bitmap of a band, a boolean array of rows by columns.
+        """
+        first_row, last_row = self.grid.band_rows(band)
+        rows = last_row - first_row
+        width = self.grid.width
+        selected = self._stroke_bands.select(band)
+        bitmap = _fill_edges(*[edge[selected] for edge in self.strokes],
+            first_row=first_row, rows=rows, width=width)
+        selected = self._region_bands.select(band)
+        if len(selected):
+            # Regions are filled on their own: their contours can have either
+            # orientation, which would cancel out overlapping strokes
+            bitmap |= _fill_edges(*[edge[selected] for edge in self.regions],
+                first_row=first_row, rows=rows, width=width)
+        selected = self._disk_bands.select(band)
+        if len(selected):
+            _fill_disks(bitmap, *[value[selected] for value in self.disks], first_row=first_row)
+        return bitmap
+
+def _bbox_union(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def _diff_rows(old, new):
+    """
+    The rows of the diff image of a band, as bytes.
+    """
+    image = np.empty(old.shape + (3,), np.uint8)
+    image[...] = BACKGROUND_COLOR
+    image[old & new] = UNCHANGED_COLOR
+    image[old & ~new] = REMOVED_COLOR
+    image[new & ~old] = ADDED_COLOR
+    for row in image:
+        yield row.tobytes()
+
+def _check_layer(filename, geometry):
+    if filename is None:
+        geometry._finish()
+        return gerber_check.LayerReport(None, gerber_check.GERBER)
+    return gerber_check.check_gerber(filename, geometry)
+
+def diff_files(old_file, new_file, image_file=None, dpi=DEFAULT_DPI, band_height=BAND_HEIGHT):
+    """
+    Compare two Gerber files of a layer. Returns the changed area in mm2 and
+    the bounding box of the changes in mm. Files with the same geometry
+    checksum are not rendered. With image_file the diff is written to a PNG
+    image: unchanged copper in gray, removed copper in red and added copper
+    in green. A file of None stands for a layer that is missing in that
+    revision, so the whole layer is added or removed.
+    """
+    old_geometry = gerber_check.GerberGeometry()
+    new_geometry = gerber_check.GerberGeometry()
+    old_report = _check_layer(old_file, old_geometry)
+    new_report = _check_layer(new_file, new_geometry)
+    result = {
+        'old': os.path.basename(old_file) if old_file is not None else None,
+        'new': os.path.basename(new_file) if new_file is not None else None,
+        'dpi': dpi,
+        'changed': False,
+        'added_mm2': 0.0,
+        'removed_mm2': 0.0,
+        'changed_bbox': None,
+        'image': None,
+    }
+    bbox = _bbox_union(old_report.bbox, new_report.bbox)
+    if old_report.checksum == new_report.checksum or bbox is None:
+        return result
+
+    grid = Grid(bbox, dpi, band_height)
+    logger.debug('rendering {} and {} at {}x{} pixels'.format(old_file, new_file, grid.width, grid.height))
+    old_raster = LayerRaster(old_geometry, grid)
+    new_raster = LayerRaster(new_geometry, grid)
+    del old_geometry, new_geometry
+
+    counts = {'added': 0, 'removed': 0}
+    changed = [None, None, None, None]
+    def rows():
+        for band in range(grid.bands):
+            old = old_raster.band(band)
+            new = new_raster.band(band)
+            added = new & ~old
+            removed = old & ~new
+            counts['added'] += int(np.count_nonzero(added))
+            counts['removed'] += int(np.count_nonzero(removed))
+            changed_rows, changed_columns = np.nonzero(added | removed)
+            if len(changed_rows):
+                first_row = grid.band_rows(band)[0]
+                if changed[0] is None:
+                    changed[0] = first_row + int(changed_rows[0])
+                changed[2] = first_row + int(changed_rows[-1])
+                changed[1] = min(int(changed_columns.min()), changed[1] if changed[1] is not None else grid.width)
+                changed[3] = max(int(changed_columns.max()), changed[3] if changed[3] is not None else 0)
+            if image_file is not None:
+                for row in _diff_rows(old, new):
+                    yield row
+
+    if image_file is not None:
+        write_png(image_file, grid.width, grid.height, rows(), COLOR_TYPE_RGB)
+        result['image'] = os.path.basename(image_file)
+    else:
+        for _ in rows():
+            pass
+
+    result['changed'] = counts['added'] > 0 or counts['removed'] > 0
+    result['added_mm2'] = round(counts['added'] * grid.pixel_area(), 4)
+    result['removed_mm2'] = round(counts['removed'] * grid.pixel_area(), 4)
+    if changed[0] is not None:
+        result['changed_bbox'] = grid.bbox_mm(*changed)
+    return result
+
+def write_diff(diffs, filename):
+    with open(filename, 'w') as f:
+        json.dump({
+            'layers': diffs,
+            'changed': [name for name, diff in sorted(diffs.items()) if diff['changed']],
+        }, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two Gerber files of a layer')
+
+    parser.add_argument('old_file', help='Gerber file of the old revision')
+    parser.add_argument('new_file', help='Gerber file of the new revision')
+    parser.add_argument('image_file', help='Write the differences to this PNG image')
+    parser.add_argument('--dpi', help='Resolution of the image (default: {})'.format(DEFAULT_DPI),
+        type=int,
+        default=DEFAULT_DPI
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    diff = diff_files(args.old_file, args.new_file, args.image_file, args.dpi)
+    logger.info(json.dumps(diff, sort_keys=True))
+    exit(1 if diff['changed'] else 0)
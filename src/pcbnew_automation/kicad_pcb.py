@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+#
+# Reads .kicad_pcb files without pcbnew. The file is tokenized while it is
+# read and the top level elements are turned into a compact board model one
+# at a time, so metadata queries (layers, plot settings, nets) are fast and
+# work on machines without KiCad.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import io
+import logging
+import os
+import re
+
+from array import array
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# KiCad 5 layer ids (PCB_LAYER_ID)
+F_Cu = 0
+B_Cu = 31
+INNER_LAYERS = range(1, 31)
+B_Adhes, F_Adhes, B_Paste, F_Paste, B_SilkS, F_SilkS, B_Mask, F_Mask = range(32, 40)
+Dwgs_User, Cmts_User, Eco1_User, Eco2_User, Edge_Cuts, Margin = range(40, 46)
+B_CrtYd, F_CrtYd, B_Fab, F_Fab = range(46, 50)
+
+# Layer order of the pcbnew UI and plot dialog (LSET::UIOrder)
+COPPER_LAYERS = [F_Cu] + list(INNER_LAYERS) + [B_Cu]
+
+UI_ORDER = [F_Cu] + list(INNER_LAYERS) + [B_Cu,
+    F_Adhes, B_Adhes, F_Paste, B_Paste, F_SilkS, B_SilkS, F_Mask, B_Mask,
+    Dwgs_User, Cmts_User, Eco1_User, Eco2_User, Edge_Cuts, Margin,
+    F_CrtYd, B_CrtYd, F_Fab, B_Fab]
+
+class ParseError(Exception):
+    pass
+
+# Parentheses are returned as these objects, to tell them apart from atoms
+OPEN = object()
+CLOSE = object()
+
+_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+_ESCAPE_RE = re.compile(r'\\(.)')
+_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t'}
+
+def _unescape(match):
+    return _ESCAPES.get(match.group(1), match.group(1))
+
+def tokenize(f, chunk_size=64 * 1024):
+    """
+    Yields the tokens read from file object f: OPEN, CLOSE or an atom
+    string. Quoted strings are unquoted.
+    """
+    buf = ''
+    eof = False
+    while not eof:
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf += chunk
+        pos = 0
+        while True:
+            match = _TOKEN_RE.match(buf, pos)
+            # A token at the end of the buffer could continue in the next chunk
+            if match is None or (match.end() == len(buf) and not eof):
+                break
+            pos = match.end()
+            if match.group(1):
+                yield OPEN
+            elif match.group(2):
+                yield CLOSE
+            elif match.group(3) is not None:
+                yield _ESCAPE_RE.sub(_unescape, match.group(3))
+            else:
+                yield match.group(4)
+        buf = buf[pos:]
+    if buf.strip():
+        raise ParseError('Unexpected data at end of file: {!r}'.format(buf[:40]))
+
+def read_list(tokens):
+    """
+    Reads the list that starts at the next token, returned as nested python
+    lists of atoms.
+    """
+    if next(tokens) is not OPEN:
+        raise ParseError('Expected (')
+    stack = [[]]
+    for token in tokens:
+        if token is OPEN:
+            stack.append([])
+        elif token is CLOSE:
+            finished = stack.pop()
+            if not stack:
+                return finished
+            stack[-1].append(finished)
+        else:
+            stack[-1].append(token)
+    raise ParseError('Unexpected end of file')
+
+def iter_children(tokens):
+    """
+    Reads the head of the root list, then yields its children one at a time.
+    Yields the name of the root list first.
+    """
+    if next(tokens, None) is not OPEN:
+        raise ParseError('Expected (')
+    yield next(tokens)
+    tokens = _Pushback(tokens)
+    for token in tokens:
+        if token is CLOSE:
+            return
+        tokens.push(token)
+        if token is OPEN:
+            yield read_list(tokens)
+        else:
+            yield next(tokens)
+    raise ParseError('Unexpected end of file')
+
+class _Pushback(object):
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.pushed = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pushed:
+            return self.pushed.pop()
+        return next(self.iterator)
+    next = __next__
+
+    def push(self, token):
+        self.pushed.append(token)
+
+def _find(node, name):
+    for child in node:
+        if isinstance(child, list) and child and child[0] == name:
+            return child
+    return None
+
+def _find_all(node, name):
+    return [child for child in node if isinstance(child, list) and child and child[0] == name]
+
+def _value(node, name, default=None):
+    child = _find(node, name)
+    if child is None or len(child) < 2:
+        return default
+    return child[1]
+
+def _floats(node, name):
+    child = _find(node, name)
+    if child is None:
+        return None
+    return tuple(float(v) for v in child[1:] if not isinstance(v, list))
+
+def _points(node):
+    """
+    Coordinates of a (pts (xy x y) ...) list, flattened into an array.
+    """
+    points = array('d')
+    pts = _find(node, 'pts')
+    for xy in pts[1:] if pts else []:
+        points.append(float(xy[1]))
+        points.append(float(xy[2]))
+    return points
+
+LayerInfo = namedtuple('LayerInfo', ['id', 'name', 'type', 'hidden'])
+Net = namedtuple('Net', ['number', 'name'])
+Pad = namedtuple('Pad', ['number', 'type', 'shape', 'position', 'size', 'drill', 'layers', 'net'])
+Track = namedtuple('Track', ['start', 'end', 'width', 'layer', 'net'])
+Via = namedtuple('Via', ['position', 'size', 'drill', 'layers', 'net'])
+
+# Footprint graphics, their layers are collected
+_FOOTPRINT_GRAPHICS = ('fp_text', 'fp_line', 'fp_arc', 'fp_circle', 'fp_poly', 'fp_curve')
+
+class Footprint(object):
+    __slots__ = ['lib_id', 'reference', 'value', 'layer', 'position', 'rotation', 'path', 'attributes', 'pads',
+        'graphic_layers']
+
+    def __init__(self, node):
+        self.lib_id = node[1]
+        self.layer = _value(node, 'layer')
+        at = _floats(node, 'at') or (0, 0)
+        self.position = at[:2]
+        self.rotation = at[2] if len(at) > 2 else 0
+        self.path = _value(node, 'path')
+        self.attributes = _find(node, 'attr')[1:] if _find(node, 'attr') else []
+        self.reference = None
+        self.value = None
+        for text in _find_all(node, 'fp_text'):
+            if text[1] == 'reference':
+                self.reference = text[2]
+            elif text[1] == 'value':
+                self.value = text[2]
+        self.pads = [self._pad(pad) for pad in _find_all(node, 'pad')]
+        self.graphic_layers = set(_value(child, 'layer') for child in node[1:]
+            if isinstance(child, list) and child and child[0] in _FOOTPRINT_GRAPHICS and 'hide' not in child)
+
+    @staticmethod
+    def _pad(node):
+        net = _find(node, 'net')
+        drill = _find(node, 'drill')
+        return Pad(node[1], node[2], node[3],
+            _floats(node, 'at'),
+            _floats(node, 'size'),
+            # Oval drills are written as (drill oval w h)
+            float(next(v for v in drill[1:] if v != 'oval')) if drill and len(drill) > 1 else None,
+            tuple(_find(node, 'layers')[1:]) if _find(node, 'layers') else (),
+            int(net[1]) if net else 0)
+
+    def __repr__(self):
+        return 'Footprint({}, {})'.format(self.reference, self.lib_id)
+
+class Zone(object):
+    __slots__ = ['net', 'net_name', 'layers', 'priority', 'outline', 'filled_polygons']
+
+    def __init__(self, node, layer_ids):
+        self.net = int(_value(node, 'net', 0))
+        self.net_name = _value(node, 'net_name')
+        layers = _find(node, 'layers') or _find(node, 'layer')
+        self.layers = [layer_ids.get(name) for name in layers[1:]] if layers else []
+        self.priority = int(_value(node, 'priority', 0))
+        polygon = _find(node, 'polygon')
+        self.outline = _points(polygon) if polygon else array('d')
+        self.filled_polygons = [_points(p) for p in _find_all(node, 'filled_polygon')]
+
+class Tracks(object):
+    """
+    Track segments in column arrays, a Track tuple is created on access.
+    """
+    __slots__ = ['coordinates', 'widths', 'layers', 'nets']
+
+    def __init__(self):
+        self.coordinates = array('d')  # start x, start y, end x, end y
+        self.widths = array('d')
+        self.layers = array('b')
+        self.nets = array('i')
+
+    def append(self, start, end, width, layer, net):
+        self.coordinates.extend((start[0], start[1], end[0], end[1]))
+        self.widths.append(width)
+        self.layers.append(layer)
+        self.nets.append(net)
+
+    def __len__(self):
+        return len(self.widths)
+
+    def __getitem__(self, i):
+        c = self.coordinates[i * 4:i * 4 + 4]
+        return Track((c[0], c[1]), (c[2], c[3]), self.widths[i], self.layers[i], self.nets[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def on_layer(self, layer):
+        return [self[i] for i, l in enumerate(self.layers) if l == layer]
+
+class Vias(object):
+    """
+    Vias in column arrays, a Via tuple is created on access.
+    """
+    __slots__ = ['coordinates', 'sizes', 'drills', 'layers', 'nets']
+
+    def __init__(self):
+        self.coordinates = array('d')
+        self.sizes = array('d')
+        self.drills = array('d')
+        self.layers = array('b')  # Pairs of start and end layer
+        self.nets = array('i')
+
+    def append(self, position, size, drill, layers, net):
+        self.coordinates.extend(position)
+        self.sizes.append(size)
+        self.drills.append(drill)
+        self.layers.extend(layers)
+        self.nets.append(net)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, i):
+        return Via(tuple(self.coordinates[i * 2:i * 2 + 2]), self.sizes[i], self.drills[i],
+            tuple(self.layers[i * 2:i * 2 + 2]), self.nets[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class Board(object):
+    def __init__(self, name):
+        self.name = name
+        self.version = None
+        self.layers = []
+        self.nets = []
+        self.footprints = []
+        self.zones = []
+        self.tracks = Tracks()
+        self.vias = Vias()
+        self.setup = {}
+        self.plot_params = {}
+        self.drawing_count = 0
+        self.drawing_layers = set()
+
+        self._layer_ids = {}
+        self._layers_by_id = {}
+        self._nets_by_name = {}
+        self._footprints_by_reference = {}
+
+    def layer_id(self, name):
+        return self._layer_ids[name]
+
+    def layer_name(self, layer_id):
+        return self._layers_by_id[layer_id].name
+
+    def net(self, name):
+        return self._nets_by_name[name]
+
+    def footprint(self, reference):
+        return self._footprints_by_reference[reference]
+
+    def enabled_layers(self):
+        """
+        Ids of the layers enabled in the board setup, in UI order.
+        """
+        return [layer_id for layer_id in UI_ORDER if layer_id in self._layers_by_id]
+
+    def plot_layer_selection(self):
+        """
+        Ids of the layers selected in the plot dialog, in UI order.
+        """
+        mask = int(self.plot_params.get('layerselection', '0').replace('_', ''), 16)
+        return [layer_id for layer_id in UI_ORDER if mask & (1 << layer_id)]
+
+    def plot_enabled_layers(self):
+        """
+        Ids of the layers that get plotted: selected and enabled.
+        """
+        return [layer_id for layer_id in self.plot_layer_selection() if layer_id in self._layers_by_id]
+
+    def copper_layers_with_items(self):
+        """
+        Ids of the enabled copper layers with tracks, vias, pads, filled zones
+        or drawings on them, in UI order. The others plot to empty files.
+        """
+        copper = [layer_id for layer_id in COPPER_LAYERS if layer_id in self._layers_by_id]
+        used = set(self.tracks.layers)
+        # Vias are on every copper layer between their start and end layer
+        for start, end in zip(self.vias.layers[::2], self.vias.layers[1::2]):
+            used.update(layer_id for layer_id in copper if min(start, end) <= layer_id <= max(start, end))
+        names = set(self.drawing_layers)
+        for footprint in self.footprints:
+            names.update(footprint.graphic_layers)
+            for pad in footprint.pads:
+                names.update(pad.layers)
+        for zone in self.zones:
+            if zone.filled_polygons:
+                used.update(zone.layers)
+
+        if '*.Cu' in names:
+            used.update(copper)
+        if 'F&B.Cu' in names:
+            used.update((F_Cu, B_Cu))
+        used.update(self._layer_ids[name] for name in names if name in self._layer_ids)
+        return [layer_id for layer_id in copper if layer_id in used]
+
+    def _add(self, node):
+        kind = node[0]
+        if kind == 'version':
+            self.version = node[1]
+        elif kind == 'layers':
+            for layer in node[1:]:
+                info = LayerInfo(int(layer[0]), layer[1], layer[2], 'hide' in layer[3:])
+                self.layers.append(info)
+                self._layer_ids[info.name] = info.id
+                self._layers_by_id[info.id] = info
+        elif kind == 'setup':
+            for child in node[1:]:
+                if child[0] == 'pcbplotparams':
+                    self.plot_params = dict((p[0], p[1] if len(p) > 1 else None) for p in child[1:])
+                else:
+                    self.setup[child[0]] = child[1] if len(child) == 2 else child[1:]
+        elif kind == 'net':
+            net = Net(int(node[1]), node[2])
+            self.nets.append(net)
+            self._nets_by_name[net.name] = net
+        elif kind in ('module', 'footprint'):
+            footprint = Footprint(node)
+            self.footprints.append(footprint)
+            if footprint.reference is not None:
+                self._footprints_by_reference[footprint.reference] = footprint
+        elif kind == 'segment':
+            self.tracks.append(_floats(node, 'start'), _floats(node, 'end'),
+                float(_value(node, 'width')),
+                self._layer_ids.get(_value(node, 'layer'), -1),
+                int(_value(node, 'net', 0)))
+        elif kind == 'via':
+            layers = _find(node, 'layers')
+            self.vias.append(_floats(node, 'at'), float(_value(node, 'size')),
+                float(_value(node, 'drill', 0)),
+                [self._layer_ids.get(name, -1) for name in layers[1:3]] if layers else [F_Cu, B_Cu],
+                int(_value(node, 'net', 0)))
+        elif kind == 'zone':
+            self.zones.append(Zone(node, self._layer_ids))
+        elif kind.startswith('gr_') or kind == 'dimension':
+            self.drawing_count += 1
+            layer = _value(node, 'layer')
+            if layer is not None:
+                self.drawing_layers.add(layer)
+
+def load(board_file):
+    """
+    Parse a .kicad_pcb file into a Board.
+    """
+    board = Board(os.path.splitext(os.path.basename(board_file))[0])
+    with io.open(board_file, encoding='utf-8') as f:
+        children = iter_children(tokenize(f))
+        root = next(children)
+        if root != 'kicad_pcb':
+            raise ParseError('{} is not a KiCad layout file'.format(board_file))
+        for node in children:
+            if isinstance(node, list) and node:
+                board._add(node)
+    return board
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show a summary of a KiCad layout without loading pcbnew')
+    parser.add_argument('pcb_file', help='The pcbnew layout (.kicad_pcb) file')
+    args = parser.parse_args()
+
+    board = load(args.pcb_file)
+    print('{} (version {})'.format(board.name, board.version))
+    print('Enabled layers: {}'.format(' '.join(board.layer_name(l) for l in board.enabled_layers())))
+    print('Plot layers: {}'.format(' '.join(board.layer_name(l) for l in board.plot_enabled_layers())))
+    print('Copper layers with items: {}'.format(' '.join(board.layer_name(l) for l in board.copper_layers_with_items())))
+    print('Nets: {}, footprints: {}, tracks: {}, vias: {}, zones: {}, drawings: {}'.format(
+        len(board.nets), len(board.footprints), len(board.tracks), len(board.vias),
+        len(board.zones), board.drawing_count))
@@ -21,6 +21,7 @@ import pcbnew
 import subprocess
 
 from contextlib import contextmanager
+from util import trace
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -41,16 +42,18 @@ class Layer(object):
         return self.pcb.get_layer_name(self.layer_id)
 
     def plot(self, plot_format):
-        plot_controller = self.pcb.plot_controller
-        plot_controller.SetLayer(self.layer_id)
-        plot_controller.OpenPlotfile(self.get_name(), plot_format , 'Plot')
-        output_filename = plot_controller.GetPlotFileName()
-        plot_controller.PlotLayer()
-        plot_controller.ClosePlot()
-        return output_filename
+        with trace.span('plot ' + self.get_name(), 'plot', format=plot_format):
+            plot_controller = self.pcb.plot_controller
+            plot_controller.SetLayer(self.layer_id)
+            plot_controller.OpenPlotfile(self.get_name(), plot_format , 'Plot')
+            output_filename = plot_controller.GetPlotFileName()
+            plot_controller.PlotLayer()
+            plot_controller.ClosePlot()
+            return output_filename
 
 class PCB(object):
     def __init__(self, board_file):
+        self.board_file = board_file
         self.name = os.path.splitext(os.path.basename(board_file))[0]
         self.board = pcbnew.LoadBoard(board_file)
         self.plot_controller = pcbnew.PLOT_CONTROLLER(self.board)
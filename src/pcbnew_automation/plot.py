@@ -17,29 +17,126 @@
 
 import argparse
 import logging
+import multiprocessing
 import os
 import pcbnew
 import shutil
-import zipfile
-from PyPDF2 import PdfFileMerger, PdfFileReader
+import sys
 from collections import namedtuple
 
-import pcb_util
+pcbnew_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(pcbnew_dir)
+
+sys.path.append(repo_root)
+
+from pcbnew_automation import gerber_check, gerber_diff, kicad_pcb, pcb_util
+from util import trace
+from util.output_cache import OutputCache
+from pcbnew_automation.svg_processor import StreamingSvgCompositor
+from util.pdf_merge import StreamingPdfMerger
+from util.zip_writer import BackgroundZipWriter, COMPRESSION_METHODS
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def plot(pcb, file_format, layers, plot_directory):
+# Layers are drawn on top of each other in the board SVG
+SVG_LAYER_OPACITY = 0.8
+
+# Bump when changes to the plot code change its output, invalidating caches
+PLOT_CACHE_VERSION = 1
+
+def plot(pcb, file_format, layers, plot_directory, jobs=1, compression='deflate', compression_level=None, manifest=False,
+        validate=False):
     
     temp_dir = os.path.join(plot_directory, 'temp')
     shutil.rmtree(temp_dir, ignore_errors=True)
     try:
         os.makedirs(temp_dir)
-        plot_to_directory(pcb, file_format, layers, plot_directory, temp_dir)
+        return plot_to_directory(pcb, file_format, layers, plot_directory, temp_dir, jobs,
+            compression, compression_level, manifest, validate)
     finally:
         shutil.rmtree(temp_dir, ignore_errors=True)
 
-def plot_to_directory(pcb, file_format, layers, plot_directory, temp_dir):
+def plot_cache_key(cache, board_file, file_format, layer_names, **options):
+    """
+    Cache key of a plot. layer_names is None when plotting the layers enabled
+    in the board's plot settings, which are part of the board file. options
+    are the other arguments of plot that change the output file.
+    """
+    return cache.key([board_file],
+        version=PLOT_CACHE_VERSION,
+        file_format=file_format,
+        layers=layer_names,
+        options=options,
+        kicad_version=pcbnew.GetBuildVersion())
+
+# Board loaded by a plot worker process
+_worker_pcb = None
+
+def _init_plot_worker(board_file, plot_directory, drill_marks_type):
+    global _worker_pcb
+    _worker_pcb = pcb_util.PCB(board_file)
+    _worker_pcb.set_plot_directory(plot_directory)
+    _worker_pcb.plot_options.SetDrillMarksType(drill_marks_type)
+
+def _plot_worker_layer(args):
+    layer_id, plot_format, traced = args
+    if not traced:
+        return pcb_util.Layer(_worker_pcb, layer_id).plot(plot_format), None
+    # The trace events are sent back to be added to the trace of the parent
+    with trace.tracing() as tracer:
+        output_file = pcb_util.Layer(_worker_pcb, layer_id).plot(plot_format)
+    return output_file, tracer.events
+
+def plot_layers(pcb, layers, plot_format, jobs=1):
+    """
+    Plot layers to the plot directory of pcb, yielding (layer, output file)
+    in the order of layers as the plots complete. With more than one job the
+    layers are spread over worker processes that each load the board once.
+    """
+    if jobs <= 1 or len(layers) <= 1:
+        for layer in layers:
+            logger.debug('plotting layer {} ({})'.format(layer.get_name(), layer.layer_id))
+            yield layer, layer.plot(plot_format)
+        return
+
+    jobs = min(jobs, len(layers))
+    logger.debug('plotting {} layers with {} processes'.format(len(layers), jobs))
+    pool = multiprocessing.Pool(jobs,
+        initializer=_init_plot_worker,
+        initargs=(pcb.board_file, pcb.plot_directory, pcb.plot_options.GetDrillMarksType()))
+    try:
+        results = pool.imap(_plot_worker_layer,
+            [(layer.layer_id, plot_format, trace.enabled()) for layer in layers])
+        for layer, (output_file, events) in zip(layers, results):
+            trace.add_events(events)
+            logger.debug('plotted layer {} ({})'.format(layer.get_name(), layer.layer_id))
+            yield layer, output_file
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def svg_layer_color(layer):
+    """
+    Color of a layer for SVG, from the RGBA value of the board's layer color.
+    """
+    rgba = layer.get_color()
+    return '#{:02x}{:02x}{:02x}'.format(rgba & 0xff, (rgba >> 8) & 0xff, (rgba >> 16) & 0xff)
+
+def gerber_check_file(pcb, plot_directory):
+    return os.path.join(plot_directory, '{}_gerber_check.json'.format(pcb.name))
+
+def plot_to_directory(pcb, file_format, layers, plot_directory, temp_dir, jobs=1,
+        compression='deflate', compression_level=None, manifest=False, validate=False):
+    """
+    With validate the gerber and drill files are checked with gerber_check
+    while they are zipped, the results are written next to the zip file and
+    a GerberCheckError is raised when problems are found. Copper layers
+    without items on the board may be empty.
+    """
     output_files = []
 
     pcb.set_plot_directory(temp_dir)
@@ -50,37 +147,148 @@ def plot_to_directory(pcb, file_format, layers, plot_directory, temp_dir):
         # In theory not needed since gerber does not support dril marks, but added just to be sure
         pcb.plot_options.SetDrillMarksType(pcbnew.PCB_PLOT_PARAMS.NO_DRILL_SHAPE)
 
-        for layer in layers:
-            logger.debug('plotting layer {} ({}) to Gerber'.format(layer.get_name(), layer.layer_id))
-            output_filename = layer.plot(pcbnew.PLOT_FORMAT_GERBER)
-            output_files.append(output_filename)
+        # Layers are compressed into the zip while the next ones are plotted
+        zip_file_name = os.path.join(plot_directory, '{}_gerbers.zip'.format(pcb.name))
+        reports = []
+        allow_empty = []
+        if validate:
+            copper_with_items = kicad_pcb.load(pcb.board_file).copper_layers_with_items()
+        with BackgroundZipWriter(zip_file_name, compression, compression_level, manifest) as z:
+            for layer, output_filename in plot_layers(pcb, layers, pcbnew.PLOT_FORMAT_GERBER, jobs):
+                z.add(output_filename, os.path.relpath(output_filename, plot_directory))
+                if validate:
+                    with trace.span('check gerber', 'check', file=os.path.basename(output_filename)):
+                        reports.append(gerber_check.check_gerber(output_filename))
+                    if layer.layer_id in kicad_pcb.COPPER_LAYERS and layer.layer_id not in copper_with_items:
+                        allow_empty.append(reports[-1].name)
 
-        drill_file = pcb.plot_drill()
-        if os.path.isfile(drill_file): # No drill file is generated if no holes exist
-            output_files.append(drill_file)
+            with trace.span('plot drill', 'plot'):
+                drill_file = pcb.plot_drill()
+            if os.path.isfile(drill_file): # No drill file is generated if no holes exist
+                z.add(drill_file, os.path.relpath(drill_file, plot_directory))
+                if validate:
+                    with trace.span('check drill', 'check', file=os.path.basename(drill_file)):
+                        reports.append(gerber_check.check_excellon(drill_file))
 
-        zip_file_name = os.path.join(plot_directory, '{}_gerbers.zip'.format(pcb.name))
-        with zipfile.ZipFile(zip_file_name, 'w') as z:
-            for f in output_files:
-                z.write(f, os.path.relpath(f, plot_directory))
+        if validate:
+            problems = gerber_check.validate(reports, allow_empty=allow_empty)
+            gerber_check.write_report(reports, problems, gerber_check_file(pcb, plot_directory))
+            if problems:
+                raise gerber_check.GerberCheckError('; '.join(problems))
+        return zip_file_name
 
     elif file_format == 'pdf':
         pcb.plot_options.SetDrillMarksType(pcbnew.PCB_PLOT_PARAMS.FULL_DRILL_SHAPE)
-        merger = PdfFileMerger()
-        for layer in layers:
-            logger.debug('plotting layer {} ({}) to PDF'.format(layer.get_name(), layer.layer_id))
-            output_filename = layer.plot(pcbnew.PLOT_FORMAT_PDF)
-            output_files.append(output_filename)
-            logger.debug(output_filename)
-            merger.append(PdfFileReader(file(output_filename, 'rb')), bookmark=layer.get_name())
+        pdf_file_name = plot_directory+'/{}.pdf'.format(pcb.name)
+        # Layers are merged as they are plotted, one input file open at a time
+        with StreamingPdfMerger(pdf_file_name) as merger:
+            for layer, output_filename in plot_layers(pcb, layers, pcbnew.PLOT_FORMAT_PDF, jobs):
+                output_files.append(output_filename)
+                logger.debug(output_filename)
+                merger.append(output_filename, bookmark=layer.get_name())
 
-        drill_map_file = pcb.plot_drill_map()
-        if os.path.isfile(drill_map_file): # No drill map file is generated if no holes exist
-            merger.append(PdfFileReader(file(drill_map_file, 'rb')), bookmark='Drill map')
+            with trace.span('plot drill map', 'plot'):
+                drill_map_file = pcb.plot_drill_map()
+            if os.path.isfile(drill_map_file): # No drill map file is generated if no holes exist
+                merger.append(drill_map_file, bookmark='Drill map')
+        return pdf_file_name
 
-        merger.write(plot_directory+'/{}.pdf'.format(pcb.name))
+    elif file_format == 'svg':
+        pcb.plot_options.SetDrillMarksType(pcbnew.PCB_PLOT_PARAMS.FULL_DRILL_SHAPE)
+        svg_file_name = os.path.join(plot_directory, '{}.svg'.format(pcb.name))
+        # Layers are composited as they are plotted, the last one plotted
+        # ends on top so they are plotted in reverse order
+        with StreamingSvgCompositor(svg_file_name) as compositor:
+            for layer, output_filename in plot_layers(pcb, list(reversed(layers)), pcbnew.PLOT_FORMAT_SVG, jobs):
+                logger.debug(output_filename)
+                color = svg_layer_color(layer)
+                compositor.append(output_filename,
+                    lambda value, color=color: value if value.strip() == 'none' else color,
+                    {'id': layer.get_name(), 'opacity': str(SVG_LAYER_OPACITY)})
+        return svg_file_name
 
-    
+def diff_file(pcb, plot_directory):
+    return os.path.join(plot_directory, '{}_diff.json'.format(pcb.name))
+
+def _enabled_layer(pcb, layer_name):
+    """
+    The layer named layer_name if it is enabled on pcb, else None.
+    """
+    layer_id = pcb.get_layer_id(layer_name)
+    if layer_id == pcbnew.UNDEFINED_LAYER:
+        return None
+    if layer_id not in [layer.layer_id for layer in pcb.get_enabled_layers()]:
+        return None
+    return pcb_util.Layer(pcb, layer_id)
+
+def plot_diff(pcb, old_pcb, layer_names, plot_directory, dpi=gerber_diff.DEFAULT_DPI, jobs=1):
+    """
+    Compare the layers of pcb with those of an older revision old_pcb. Both
+    are plotted to gerber files, which are compared with gerber_diff. The
+    changed layers get a <layer>_diff.png image in plot_directory, and the
+    changed area of every layer is written to <name>_diff.json. Without
+    layer_names the layers enabled in the plot menu of either revision are
+    compared. A layer that only exists in one revision is compared with an
+    empty layer. Returns the output files.
+    """
+    if not layer_names:
+        layer_names = [layer.get_name() for layer in pcb.get_plot_enabled_layers()]
+        layer_names += [layer.get_name() for layer in old_pcb.get_plot_enabled_layers()
+            if layer.get_name() not in layer_names]
+
+    old_layers = []
+    new_layers = []
+    for layer_name in layer_names:
+        old_layer = _enabled_layer(old_pcb, layer_name)
+        new_layer = _enabled_layer(pcb, layer_name)
+        if old_layer is None and new_layer is None:
+            logger.warning('Layer {} is not enabled in either revision'.format(layer_name))
+        if old_layer is not None:
+            old_layers.append(old_layer)
+        if new_layer is not None:
+            new_layers.append(new_layer)
+
+    temp_dir = os.path.join(plot_directory, 'temp')
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    try:
+        old_dir = os.path.join(temp_dir, 'old')
+        new_dir = os.path.join(temp_dir, 'new')
+        os.makedirs(old_dir)
+        os.makedirs(new_dir)
+        old_pcb.set_plot_directory(old_dir)
+        pcb.set_plot_directory(new_dir)
+        for board in (old_pcb, pcb):
+            board.plot_options.SetDrillMarksType(pcbnew.PCB_PLOT_PARAMS.NO_DRILL_SHAPE)
+
+        old_files = dict((layer.get_name(), output_filename)
+            for layer, output_filename in plot_layers(old_pcb, old_layers, pcbnew.PLOT_FORMAT_GERBER, jobs))
+        new_files = dict((layer.get_name(), output_filename)
+            for layer, output_filename in plot_layers(pcb, new_layers, pcbnew.PLOT_FORMAT_GERBER, jobs))
+
+        diffs = {}
+        output_files = []
+        for name in layer_names:
+            if name not in old_files and name not in new_files:
+                continue
+            image_file = os.path.join(plot_directory, '{}_diff.png'.format(name.replace('.', '_')))
+            diff = gerber_diff.diff_files(old_files.get(name), new_files.get(name), image_file, dpi)
+            if diff['image'] is not None:
+                output_files.append(image_file)
+            if name not in old_files:
+                status = 'new layer, '
+            elif name not in new_files:
+                status = 'removed layer, '
+            else:
+                status = ''
+            logger.info('{}: {}{}'.format(name, status, 'added {added_mm2} mm2, removed {removed_mm2} mm2'.format(**diff)
+                if diff['changed'] else 'unchanged'))
+            diffs[name] = diff
+
+        json_file = diff_file(pcb, plot_directory)
+        gerber_diff.write_diff(diffs, json_file)
+        return [json_file] + output_files
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser('Plot a KiCad PCB layout')
@@ -94,14 +302,73 @@ if __name__ == '__main__':
     )
 
     parser.add_argument('--file_format', '-f', help='Plot file format',
-        choices=['zip_gerbers', 'pdf'],
+        choices=['zip_gerbers', 'pdf', 'svg'],
         default='zip_gerbers'
     )
+    parser.add_argument('--jobs', '-j', help='Number of processes to plot layers with',
+        type=int,
+        default=1
+    )
+    parser.add_argument('--compression', help='Compression method of the gerber zip file',
+        choices=sorted(COMPRESSION_METHODS),
+        default='deflate'
+    )
+    parser.add_argument('--compression_level', help='Compression level, depends on the compression method',
+        type=int
+    )
+    parser.add_argument('--manifest', help='Add a manifest with the SHA-256 checksum of every file to the gerber zip file',
+        action='store_true'
+    )
+    parser.add_argument('--validate', help='Check the gerber and drill files, fail on empty copper layers or copper outside the board outline',
+        action='store_true'
+    )
+    parser.add_argument('--diff', help='Compare the layers with those of an older revision of the layout, writing images of the changes instead of plotting',
+        metavar='OLD_PCB_FILE'
+    )
+    parser.add_argument('--dpi', help='Resolution of the --diff images (default: {})'.format(gerber_diff.DEFAULT_DPI),
+        type=int,
+        default=gerber_diff.DEFAULT_DPI
+    )
+    parser.add_argument('--trace', help='Write a Chrome trace of the run to this JSON file, and a summary next to it')
+    parser.add_argument('--cache_dir', help='Reuse plots of unchanged layouts stored in this directory')
+    parser.add_argument('--cache_size', help='Maximum size of the cache in MB (default: 1024)',
+        type=int,
+        default=1024
+    )
 
     args = parser.parse_args()
+    output_dir = os.path.abspath(args.output_dir)
+
+    if args.trace:
+        trace.enable(os.path.abspath(args.trace))
+
+    if args.validate and args.file_format != 'zip_gerbers':
+        parser.error('--validate only works for zip_gerbers')
+    if args.diff and (args.validate or args.cache_dir):
+        parser.error('--diff does not work with --validate or --cache_dir')
+
+    zip_options = {}
+    if args.file_format == 'zip_gerbers':
+        zip_options = {
+            'compression': args.compression,
+            'compression_level': args.compression_level,
+            'manifest': args.manifest,
+            'validate': args.validate,
+        }
+
+    cache = None
+    if args.cache_dir:
+        cache = OutputCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        cache_key = plot_cache_key(cache, args.pcb_file, args.file_format, args.layers or None, **zip_options)
+        if cache.fetch(cache_key, output_dir):
+            exit(0)
 
     pcb = pcb_util.PCB(args.pcb_file)
 
+    if args.diff:
+        plot_diff(pcb, pcb_util.PCB(args.diff), args.layers, output_dir, args.dpi, args.jobs)
+        exit(0)
+
     if len(args.layers) > 0:
         layers = []
         for layer_name in args.layers:
@@ -110,4 +377,14 @@ if __name__ == '__main__':
         # TODO: figure out why this does not work
         layers = pcb.get_plot_enabled_layers()
 
-    plot(pcb, args.file_format, layers, os.path.abspath(args.output_dir))
+    try:
+        output_file = plot(pcb, args.file_format, layers, output_dir, args.jobs, **zip_options)
+    except gerber_check.GerberCheckError as e:
+        logger.error('Gerber check failed: {}'.format(e))
+        exit(1)
+
+    if cache is not None:
+        output_files = [output_file]
+        if args.validate:
+            output_files.append(gerber_check_file(pcb, output_dir))
+        cache.store(cache_key, output_files)
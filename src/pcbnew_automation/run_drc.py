@@ -20,9 +20,9 @@
 
 import sys
 import os
+import io
 import logging
 import argparse
-from xvfbwrapper import Xvfb
 
 pcbnew_dir = os.path.dirname(os.path.abspath(__file__))
 repo_root = os.path.dirname(pcbnew_dir)
@@ -30,47 +30,108 @@ repo_root = os.path.dirname(pcbnew_dir)
 sys.path.append(repo_root)
 
 from util import file_util
+from util import trace
+from util.report_writers import JunitXmlWriter, JsonReportWriter
+from util.baseline import Baseline, BaselineDiff
+from pcbnew_automation.drc_report import DrcReport, SECTION_UNCONNECTED, fingerprint
 from util.ui_automation import (
     PopenContext,
     xdotool,
     wait_for_window,
-    recorded_xvfb,
-    clipboard_store
+    virtual_display,
+    record_mode,
+    add_record_arguments,
+    record_mode_from_args,
+    RECORD_OFF,
+    clipboard_store,
+    report_wait_times
 )
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def parse_drc(drc_file):
-    from re import search as regex_search
-
-    with open(drc_file, 'r') as f:
-        lines = f.read().splitlines()
-
-    drc_errors = None
-    unconnected_pads = None
-
-    for line in lines:
-        if drc_errors != None and unconnected_pads != None:
-            break;
-        m = regex_search(
-            '^\*\* Found ([0-9]+) DRC errors \*\*$', line)
-        if m != None:
-            drc_errors = m.group(1);
-            continue
-        m = regex_search(
-            '^\*\* Found ([0-9]+) unconnected pads \*\*$', line)
-        if m != None:
-            unconnected_pads = m.group(1);
-            continue
-
+def _write_drc_violations(drc_file, junit, json_writer, ignore_unconnected, baseline_diff):
+    """
+    Returns the report and the number of violations written.
+    """
+    with io.open(drc_file, encoding='utf-8', errors='replace') as f:
+        report = DrcReport(f, drc_file)
+        section = None
+        reported = 0
+        for violation in report:
+            logger.debug('{} {}'.format(violation.message,
+                ' '.join(item.description for item in violation.items)))
+            if ignore_unconnected and violation.section == SECTION_UNCONNECTED:
+                continue
+            if baseline_diff is not None and not baseline_diff.check(fingerprint(violation)):
+                continue
+            reported += 1
+            if junit is not None:
+                if violation.section != section:
+                    section = violation.section
+                    junit.start_suite('DRC {}'.format(section))
+                junit.add_case('DRC rule {}'.format(violation.rule), section,
+                    failure_message=violation.message + ' ' + '; '.join(
+                        '@({:.3f} mm, {:.3f} mm): {}'.format(item.position[0], item.position[1], item.description)
+                        for item in violation.items),
+                    failure_type=str(violation.rule))
+            if json_writer is not None:
+                record = violation._asdict()
+                record['items'] = [item._asdict() for item in violation.items]
+                json_writer.add(record)
+    return report, reported
+
+def parse_drc(drc_file, ignore_unconnected=False, generate_junit_xml=False, generate_json=False,
+        baseline_diff=None):
+    """
+    Returns a dict with the number of DRC errors and unconnected pads in the
+    report, and the number of violations that fail the DRC. The violations
+    can be written to junit.xml, with a test suite per report section, and to
+    drc.json in the directory of the report. The report is parsed while it is
+    read.
+
+    With a BaselineDiff only the violations that are not in its baseline fail
+    the DRC and are written to the reports. Ignored unconnected pads are not
+    compared with the baseline, nor added to it. A BaselineDiff without
+    baseline only collects the violations to write a baseline.
+    """
+    output_dir = os.path.dirname(drc_file)
+    junit = JunitXmlWriter(os.path.join(output_dir, 'junit.xml')) if generate_junit_xml else None
+    json_writer = JsonReportWriter(os.path.join(output_dir, 'drc.json')) if generate_json else None
+    compare_baseline = baseline_diff is not None and baseline_diff.baseline is not None
+
+    try:
+        report, reported = _write_drc_violations(drc_file, junit, json_writer, ignore_unconnected,
+            baseline_diff)
+    except:
+        # Don't leave incomplete reports behind
+        for writer in (junit, json_writer):
+            if writer is not None:
+                writer.close()
+                os.remove(writer.output.name)
+        raise
+
+    if junit is not None:
+        if reported == 0:
+            junit.start_suite('DRC')
+        junit.close()
+    if json_writer is not None:
+        summary = report.summary()
+        if compare_baseline:
+            summary['baseline'] = baseline_diff.summary()
+        json_writer.close(summary)
+
+    if compare_baseline:
+        baseline_diff.log('DRC')
     return {
-        'drc_errors': int(drc_errors),
-        'unconnected_pads': int(unconnected_pads)
+        'drc_errors': report.drc_errors,
+        'unconnected_pads': report.unconnected_pads,
+        'footprint_errors': report.footprint_errors,
+        'violations': reported if compare_baseline else report.error_count(ignore_unconnected),
     }
 
 
-def run_drc(pcb_file, output_dir, record=True):
+def run_drc(pcb_file, output_dir, record=RECORD_OFF, session=None):
 
     file_util.mkdir_p(output_dir)
 
@@ -83,7 +144,7 @@ def run_drc(pcb_file, output_dir, record=True):
 	    'colordepth': 24,
     }
 
-    with recorded_xvfb(recording_file, **xvfb_kwargs) if record else Xvfb(**xvfb_kwargs):
+    with virtual_display(recording_file, session, record_mode(record), **xvfb_kwargs):
         with PopenContext(['pcbnew', pcb_file], close_fds=True) as pcbnew_proc:
             clipboard_store(drc_output_file)
 
@@ -134,22 +195,43 @@ if __name__ == '__main__':
     parser.add_argument('--ignore_unconnected', '-i', help='Ignore unconnected paths',
         action='store_true'
     )
-    parser.add_argument('--record', help='Record the UI automation',
+    parser.add_argument('--junit_xml', '-x', help='Generate junit XML report',
+        action='store_true'
+    )
+    parser.add_argument('--json', help='Write the DRC violations to drc.json',
+        action='store_true'
+    )
+    parser.add_argument('--baseline', help='Only fail on violations that are not in this baseline file')
+    parser.add_argument('--write_baseline', help='Write the violations to this baseline file')
+    add_record_arguments(parser)
+    parser.add_argument('--report_wait_times', help='Log how long each wait for a window took',
         action='store_true'
     )
+    parser.add_argument('--trace', help='Write a Chrome trace of the run to this JSON file, and a summary next to it')
 
     args = parser.parse_args()
 
-    drc_result = parse_drc(run_drc(args.kicad_pcb_file, args.output_dir, args.record))
+    if args.report_wait_times:
+        report_wait_times()
+    if args.trace:
+        trace.enable(os.path.abspath(args.trace))
 
-    logging.info(drc_result);
-    if drc_result['drc_errors'] == 0 and drc_result['unconnected_pads'] == 0:
+    baseline_diff = None
+    if args.baseline or args.write_baseline:
+        baseline_diff = BaselineDiff(Baseline.load(args.baseline) if args.baseline else None)
+
+    drc_result = parse_drc(run_drc(args.kicad_pcb_file, args.output_dir, record_mode_from_args(parser, args)),
+        args.ignore_unconnected, args.junit_xml, args.json, baseline_diff)
+
+    if args.write_baseline:
+        baseline_diff.current.save(args.write_baseline)
+
+    logging.info(drc_result)
+    if drc_result['violations'] == 0:
         exit(0)
     else:
-
         logger.error('Found {} DRC errors and {} unconnected pads'.format(
             drc_result['drc_errors'],
             drc_result['unconnected_pads']
         ))
-        exit(drc_result['drc_errors']+drc_result['unconnected_pads'])
-    
+        exit(drc_result['violations'])
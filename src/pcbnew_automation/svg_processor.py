@@ -13,65 +13,163 @@
 #   limitations under the License.
 
 import logging
-import re
 import xml
-from xml.dom import minidom
+import xml.sax
+from xml.sax.handler import ContentHandler, feature_external_ges, feature_external_pes
+from xml.sax.saxutils import XMLGenerator
+from xml.sax.xmlreader import AttributesImpl
 
 """
-Processes SVG files generated by pcbnew to colorize and merge
+Processes SVG files generated by pcbnew to colorize and merge.
+StreamingSvgCompositor merges SVGs while they are read, without loading
+them.
 """
 
 logger = logging.getLogger(__name__)
 
-class SvgProcessor(object):
-
-    def __init__(self, input_file):
-        self.dom = minidom.parse(input_file)
-        self.svg_node = self.dom.documentElement
-
-    def apply_color_transform(self, transform_function):
-        # Set fill and stroke on all groups
-        for group in self.svg_node.getElementsByTagName('g'):
-            SvgProcessor._apply_transform(group, {
-                'fill': transform_function,
-                'stroke': transform_function,
-            })
-
-    def import_groups(self, from_svg_processor):
-        for child in from_svg_processor.svg_node.childNodes:
-            if child.nodeType != child.ELEMENT_NODE or child.tagName != 'g':
-                continue
-            group = child
-            output_node = self.dom.importNode(group, True)
-            self.svg_node.appendChild(output_node)
-
-    def write(self, filename):
-        with open(filename, 'wb') as output_file:
-            self.svg_node.writexml(output_file)
-
-    def wrap_with_group(self, attrs):
-        parent = self.svg_node
-        wrapper = self.dom.createElement("g")
-        for k,v in attrs.items():
-            wrapper.setAttribute(k,v)
-
-        for child in parent.getElementsByTagName('g'):
-            parent.removeChild(child)
-            wrapper.appendChild(child)
-
-        parent.appendChild(wrapper)
-
-    @staticmethod
-    def _apply_transform(node, values):
-        original_style = node.attributes['style'].value
-        for (k,v) in values.items():
-            escaped_key = re.escape(k)
-            m = re.search(r'\b' + escaped_key + r':(?P<value>[^;]*);', original_style)
-            if m:
-                transformed_value = v(m.group('value'))
-                original_style = re.sub(
-                    r'\b' + escaped_key + r':[^;]*;',
-                    k + ':' + transformed_value + ';',
-                    original_style)
-        node.attributes['style'] = original_style
+def transform_style(style, transforms):
+    """
+    Apply transforms, a dict of property name to function mapping the old
+    value to the new one, to a style attribute in a single pass. Everything
+    else in the style is kept as it is.
+    """
+    declarations = style.split(';')
+    for i, declaration in enumerate(declarations):
+        name, colon, value = declaration.partition(':')
+        if colon:
+            transform = transforms.get(name.strip())
+            if transform is not None:
+                declarations[i] = name + ':' + transform(value)
+    return ';'.join(declarations)
 
+class _SvgLayerHandler(ContentHandler):
+    """
+    Copies the groups of an SVG to output, inside a wrapper group. For the
+    first SVG the root element and its other children are copied too.
+    """
+
+    def __init__(self, output, is_first, transforms, group_attrs):
+        ContentHandler.__init__(self)
+        self.output = output
+        self.is_first = is_first
+        self.transforms = transforms
+        self.group_attrs = group_attrs
+        self.root_name = None
+        self._depth = 0
+        self._skip_depth = None
+        self._wrapped = False
+        self._transformed_styles = {}
+
+    def _open_wrapper(self):
+        if self.group_attrs is not None and not self._wrapped:
+            self.output.startElement('g', AttributesImpl(self.group_attrs))
+            self._wrapped = True
+
+    def _close_wrapper(self):
+        if self._wrapped:
+            self.output.endElement('g')
+            self._wrapped = False
+
+    def _transform(self, attrs):
+        style = attrs.get('style')
+        if not style:
+            return attrs
+        transformed = self._transformed_styles.get(style)
+        if transformed is None:
+            transformed = self._transformed_styles[style] = transform_style(style, self.transforms)
+        attrs = dict(attrs.items())
+        attrs['style'] = transformed
+        return AttributesImpl(attrs)
+
+    def startElement(self, name, attrs):
+        self._depth += 1
+        if self._skip_depth is not None:
+            return
+        if self._depth == 1:
+            self.root_name = name
+            if self.is_first:
+                self.output.startElement(name, attrs)
+            return
+        if self._depth == 2:
+            if name == 'g':
+                self._open_wrapper()
+            elif self.is_first:
+                self._close_wrapper()
+            else:
+                self._skip_depth = self._depth
+                return
+        if name == 'g' and self.transforms:
+            attrs = self._transform(attrs)
+        self.output.startElement(name, attrs)
+
+    def endElement(self, name):
+        depth = self._depth
+        self._depth -= 1
+        if self._skip_depth is not None:
+            if depth == self._skip_depth:
+                self._skip_depth = None
+            return
+        if depth == 1:
+            # The root element is closed by the compositor
+            self._close_wrapper()
+            return
+        self.output.endElement(name)
+
+    def characters(self, content):
+        if self._skip_depth is None and (self._depth >= 2 or self.is_first):
+            self.output.characters(content)
+
+    ignorableWhitespace = characters
+
+class StreamingSvgCompositor(object):
+    """
+    Merges SVGs into one, later SVGs are drawn on top. The root element of
+    the first SVG is used for the output, of every SVG only the groups are
+    copied. Every SVG is read and written in a single pass, with its color
+    transform applied to the groups on the way, so memory use does not
+    depend on the size of the SVGs.
+
+        with StreamingSvgCompositor('board.svg') as compositor:
+            compositor.append('B_Cu.svg', color_transform, {'opacity': '0.8'})
+    """
+
+    def __init__(self, output_file):
+        self.output_file = open(output_file, 'wb')
+        self.output = XMLGenerator(self.output_file, 'utf-8')
+        self.output.startDocument()
+        self._root_name = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def append(self, svg_file, color_transform=None, group_attrs=None):
+        """
+        Add the groups of svg_file, inside a group with group_attrs if given.
+        color_transform maps the fill and stroke colors of the groups.
+        """
+        transforms = None
+        if color_transform is not None:
+            transforms = {
+                'fill': color_transform,
+                'stroke': color_transform,
+            }
+        handler = _SvgLayerHandler(self.output, self._root_name is None, transforms, group_attrs)
+        parser = xml.sax.make_parser()
+        # Don't fetch the SVG DTD
+        parser.setFeature(feature_external_ges, False)
+        parser.setFeature(feature_external_pes, False)
+        parser.setContentHandler(handler)
+        parser.parse(svg_file)
+        if self._root_name is None:
+            self._root_name = handler.root_name
+
+    def close(self):
+        if self.output_file.closed:
+            return
+        if self._root_name is not None:
+            self.output.endElement(self._root_name)
+        self.output.endDocument()
+        self.output_file.close()
@@ -0,0 +1,124 @@
+#
+# Baselines of known ERC and DRC violations, so checks can fail on new
+# violations only. A baseline file holds a fingerprint per violation, one per
+# line and sorted so baselines diff well. Fingerprints are the tab separated
+# fields of a violation, like the rule, message and items of a DRC error:
+#
+#   # kicad-automation baseline 1
+#   drc  drc  3  Track too close to pad  Pad 2 of D1 on F.Cu and others  Track 0.250 mm on F.Cu
+#
+# Fingerprints leave out what changes without the violation changing, like
+# positions and net numbers. Violations with the same fingerprint are counted,
+# so a baseline with two of them still finds a third one.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import logging
+import re
+
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+HEADER = u'# kicad-automation baseline 1'
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_NET_RE = re.compile(r'\(net [0-9]+\)')
+
+def normalize(text):
+    """
+    Collapse whitespace and drop net numbers, which change when unrelated
+    nets are added.
+    """
+    return _NET_RE.sub(u'(net)', _WHITESPACE_RE.sub(u' ', text).strip())
+
+def fingerprint(*parts):
+    return u'\t'.join(normalize(u'{}'.format(part)) for part in parts)
+
+class BaselineError(Exception):
+    pass
+
+class Baseline(object):
+    def __init__(self, fingerprints=()):
+        self.counts = Counter(fingerprints)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def add(self, fingerprint):
+        self.counts[fingerprint] += 1
+
+    @classmethod
+    def load(cls, filename):
+        baseline = cls()
+        with io.open(filename, encoding='utf-8') as f:
+            if f.readline().rstrip(u'\r\n') != HEADER:
+                raise BaselineError('{} is not a baseline file'.format(filename))
+            for line in f:
+                line = line.rstrip(u'\r\n')
+                if line:
+                    baseline.add(line)
+        return baseline
+
+    def save(self, filename):
+        with io.open(filename, 'w', encoding='utf-8') as f:
+            f.write(HEADER + u'\n')
+            for fingerprint in sorted(self.counts):
+                f.write((fingerprint + u'\n') * self.counts[fingerprint])
+
+class BaselineDiff(object):
+    """
+    Compares violations with a baseline while a report is read. check() is
+    called for every violation of the report and returns True for new ones.
+    The violations of the report are collected in current, to write a new
+    baseline. Without a baseline all violations are new.
+    """
+
+    def __init__(self, baseline=None):
+        self.baseline = baseline
+        self._remaining = Counter(baseline.counts) if baseline is not None else Counter()
+        self.current = Baseline()
+        self.new = []
+
+    def check(self, fingerprint):
+        self.current.add(fingerprint)
+        if self._remaining[fingerprint] > 0:
+            self._remaining[fingerprint] -= 1
+            return False
+        self.new.append(fingerprint)
+        return True
+
+    def resolved(self):
+        """
+        The violations of the baseline that were not in the report.
+        """
+        return sorted(self._remaining.elements())
+
+    def log(self, name):
+        if self.baseline is None:
+            return
+        for fingerprint in self.new:
+            logger.error('New {} violation: {}'.format(name, fingerprint.replace(u'\t', u' | ')))
+        resolved = self.resolved()
+        for fingerprint in resolved:
+            logger.info('Resolved {} violation: {}'.format(name, fingerprint.replace(u'\t', u' | ')))
+        logger.info('{} violations: {} new, {} resolved'.format(name, len(self.new), len(resolved)))
+
+    def summary(self):
+        return {
+            'new': len(self.new),
+            'resolved': len(self.resolved()),
+        }
@@ -6,6 +6,9 @@ import logging
 import time
 import psutil
 
+from util import inotify
+from util import trace
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
@@ -19,24 +22,81 @@ def mkdir_p(path):
             raise
 
 def wait_for_file_created_by_process(pid, file, timeout=5):
+    """
+    Wait until the process with the given pid created file and closed it.
+    The timeout is restarted every time the file is written to, so big files
+    that take long to write don't time out.
+    """
+    # Open files of the process are reported with absolute paths
+    file = os.path.abspath(file)
+    with trace.span('wait for file', 'wait', file=os.path.basename(file)):
+        try:
+            watcher = _watch_directory(os.path.dirname(file))
+        except OSError as e:
+            logger.debug('Can not watch for %s with inotify (%s), polling', file, e)
+            _poll_for_file_created_by_process(pid, file, timeout)
+            return
+
+        with watcher:
+            _watch_for_file_created_by_process(watcher, pid, file, timeout)
+
+def _watch_directory(directory):
+    watcher = inotify.Inotify()
+    try:
+        watcher.add_watch(directory,
+            inotify.IN_CREATE | inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO)
+    except OSError:
+        watcher.close()
+        raise
+    return watcher
+
+def _watch_for_file_created_by_process(watcher, pid, file, timeout):
+    process = psutil.Process(pid)
+    file_name = os.path.basename(file)
+
+    # The file might have been written before the watch was in place
+    if os.path.isfile(file) and not _process_has_file_open(process, file):
+        return
+
+    logger.debug('Waiting for process to create and close file')
+    deadline = time.time() + timeout
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        for event in watcher.read_events(remaining):
+            if event.name != file_name:
+                continue
+            if event.mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO):
+                return
+            # Still being written
+            deadline = time.time() + timeout
+
+    raise RuntimeError('Timed out waiting for creation of %s' % file)
+
+def _poll_for_file_created_by_process(pid, file, timeout):
     process = psutil.Process(pid)
 
     DELAY = 0.01
-    for i in range(int(timeout/DELAY)):
-        open_files = process.open_files()
-        logger.debug(open_files)
+    deadline = time.time() + timeout
+    last_size = None
+    while time.time() < deadline:
         if os.path.isfile(file):
-            file_open = False
-            for open_file in open_files:
-                if open_file.path == file:
-                    file_open = True
-            
-            if file_open:
-                logger.debug('Waiting for process to close file')
-            else:
+            if not _process_has_file_open(process, file):
                 return
-        else:
-            logger.debug('Waiting for process to create file')
+
+            size = os.path.getsize(file)
+            if size != last_size:
+                logger.debug('Waiting for process to close file')
+                # Still being written
+                deadline = time.time() + timeout
+                last_size = size
         time.sleep(DELAY)
 
     raise RuntimeError('Timed out waiting for creation of %s' % file)
+
+def _process_has_file_open(process, file):
+    for open_file in process.open_files():
+        if open_file.path == file:
+            return True
+    return False
@@ -0,0 +1,164 @@
+#
+# Content addressed cache for generated files. Entries are keyed on a hash of
+# the input files and the parameters that influence the output, so unchanged
+# designs don't get plotted or exported again. The cache is bounded in size,
+# least recently used entries are evicted first.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from util import file_util
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+MANIFEST = 'manifest.json'
+
+def file_digest(path, algorithm='sha256'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def kicad_version():
+    """
+    Version of the installed KiCad, outputs can change between versions.
+    """
+    try:
+        import pcbnew
+        return pcbnew.GetBuildVersion()
+    except (ImportError, AttributeError):
+        return 'unknown'
+
+class OutputCache(object):
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        file_util.mkdir_p(self.cache_dir)
+
+    def key(self, input_files, **params):
+        """
+        Hash the content of input_files together with params, which must be
+        JSON serializable. The order of input_files matters.
+        """
+        digest = hashlib.sha256()
+        for input_file in input_files:
+            digest.update(os.path.basename(input_file).encode('utf-8'))
+            digest.update(file_digest(input_file).encode('ascii'))
+        digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, output_dir):
+        """
+        Copy the files stored for key to output_dir. Returns the list of
+        copied files, or None on a cache miss.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            logger.debug('Cache miss for %s', key)
+            return None
+
+        file_util.mkdir_p(output_dir)
+        output_files = []
+        try:
+            for name in manifest['files']:
+                output_file = os.path.join(output_dir, name)
+                output_files.append(output_file)
+                shutil.copyfile(os.path.join(entry_dir, name), output_file)
+
+            # Mark as recently used for the LRU eviction
+            os.utime(entry_dir, None)
+        except (IOError, OSError) as e:
+            # Evicted by a concurrent job while it was copied
+            logger.debug('Cache miss for %s, failed to copy it: %s', key, e)
+            for output_file in output_files:
+                if os.path.isfile(output_file):
+                    os.remove(output_file)
+            return None
+
+        logger.info('Cache hit for %s', key)
+        return output_files
+
+    def store(self, key, files, metadata=None):
+        """
+        Store copies of files under key. Only the file names are kept, so
+        they have to be unique.
+        """
+        temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            size = 0
+            for path in files:
+                shutil.copyfile(path, os.path.join(temp_dir, os.path.basename(path)))
+                size += os.path.getsize(path)
+            with open(os.path.join(temp_dir, MANIFEST), 'w') as f:
+                json.dump({
+                    'files': [os.path.basename(path) for path in files],
+                    'size': size,
+                    'created': time.time(),
+                    'metadata': metadata,
+                }, f)
+
+            try:
+                os.rename(temp_dir, self._entry_dir(key))
+            except OSError:
+                # Stored concurrently by another job, which is just as good
+                logger.debug('Cache entry %s already exists', key)
+                return
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        logger.info('Stored %d files in cache as %s', len(files), key)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits max_size.
+        """
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.tmp-'):
+                continue  # Still being stored
+            entry_dir = os.path.join(self.cache_dir, name)
+            try:
+                with open(os.path.join(entry_dir, MANIFEST)) as f:
+                    size = json.load(f)['size']
+                last_used = os.path.getmtime(entry_dir)
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, size, entry_dir))
+            total_size += size
+
+        entries.sort()
+        while total_size > self.max_size and entries:
+            last_used, size, entry_dir = entries.pop(0)
+            logger.debug('Evicting cache entry %s', entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
@@ -0,0 +1,245 @@
+#
+# Merges PDF files into one, writing the objects of every input file to the
+# output as soon as they are read. Only one input file is open at a time, so
+# memory use does not grow with the number of merged files. Objects that are
+# identical across the input files (fonts, images) are written only once.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import logging
+import os
+
+from io import BytesIO
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject,
+    NullObject, NumberObject, StreamObject, createStringObject)
+from util import trace
+
+logger = logging.getLogger(__name__)
+
+PDF_HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+
+class StreamingPdfMerger(object):
+    """
+    Usage:
+
+        with StreamingPdfMerger('merged.pdf') as merger:
+            merger.append('a.pdf', bookmark='A')
+            merger.append('b.pdf')
+    """
+
+    def __init__(self, filename):
+        self.output = open(filename, 'wb')
+        self.output.write(PDF_HEADER)
+        # Offset of every written object, None for reserved numbers
+        self._offsets = [None]
+        self._free_numbers = []
+        # Content hash to object number, to write identical objects once
+        self._digests = {}
+        self._page_numbers = []
+        self._bookmarks = []
+        self._pages_number = self._reserve()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.output.close()
+
+    def append(self, filename, bookmark=None):
+        """
+        Append all pages of filename, adding a bookmark to the first one.
+        """
+        with trace.span('pdf merge', 'merge', file=os.path.basename(filename)), open(filename, 'rb') as f:
+            reader = PdfFileReader(f, strict=False)
+            pages = [reader.getPage(i) for i in range(reader.getNumPages())]
+            # Pages can also be reached from other objects, e.g. annotations.
+            # Use the flattened pages, which include the inherited attributes.
+            self._pages = dict(((page.indirectRef.idnum, page.indirectRef.generation), page)
+                for page in pages)
+            # Input object (number, generation) to output object number
+            self._object_map = {}
+            self._in_progress = set()
+            self._cyclic = set()
+
+            first_page = len(self._page_numbers)
+            for page in pages:
+                self._page_numbers.append(self._copy_reference(page.indirectRef))
+
+            self._pages = self._object_map = None
+        logger.debug('Merged %d pages of %s', len(pages), filename)
+
+        if bookmark is not None and pages:
+            self._bookmarks.append((bookmark, self._page_numbers[first_page]))
+
+    def close(self):
+        with trace.span('pdf merge close', 'merge', pages=len(self._page_numbers)):
+            self._close()
+
+    def _close(self):
+        self._write_object(self._pages_number, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(self._reference(n) for n in self._page_numbers),
+            NameObject('/Count'): NumberObject(len(self._page_numbers)),
+        }))
+
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): self._reference(self._pages_number),
+        })
+        if self._bookmarks:
+            catalog[NameObject('/Outlines')] = self._reference(self._write_outlines())
+            catalog[NameObject('/PageMode')] = NameObject('/UseOutlines')
+        catalog_number = self._reserve()
+        self._write_object(catalog_number, catalog)
+
+        self._write_trailer(catalog_number)
+        self.output.close()
+
+    def _reserve(self):
+        if self._free_numbers:
+            return self._free_numbers.pop()
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _reference(self, number):
+        return IndirectObject(number, 0, None)
+
+    def _copy_reference(self, reference):
+        """
+        Copy the object reference points to, and all objects it refers to.
+        Returns the number of the object in the output file.
+        """
+        key = (reference.idnum, reference.generation)
+        if key in self._object_map:
+            if key in self._in_progress:
+                self._cyclic.add(key)
+            return self._object_map[key]
+
+        number = self._reserve()
+        self._object_map[key] = number
+        self._in_progress.add(key)
+        obj = self._pages.get(key)
+        is_page = obj is not None
+        if not is_page:
+            obj = reference.getObject()
+        data = self._serialize(self._copy_value(obj, is_page))
+        self._in_progress.discard(key)
+
+        # Objects that are part of a reference cycle were already referred to
+        # by their number. Pages can't be shared, they only have one parent.
+        if not is_page and key not in self._cyclic:
+            digest = hashlib.sha256(data).digest()
+            existing = self._digests.get(digest)
+            if existing is not None:
+                self._object_map[key] = existing
+                self._free_numbers.append(number)
+                return existing
+            self._digests[digest] = number
+
+        self._write_data(number, data)
+        return number
+
+    def _copy_value(self, value, is_page=False):
+        """
+        Copy of a direct object, with references renumbered.
+        """
+        if isinstance(value, IndirectObject):
+            return self._reference(self._copy_reference(value))
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self._copy_value(v) for v in value)
+        if isinstance(value, DictionaryObject):
+            if isinstance(value, StreamObject):
+                copy = value.__class__()
+                copy._data = value._data
+            else:
+                copy = DictionaryObject()
+            for k, v in value.items():
+                if k == '/Length' and isinstance(value, StreamObject):
+                    continue  # Written by the stream itself
+                if k == '/Parent' and is_page:
+                    # Following it would copy the page tree of the input file
+                    copy[NameObject(k)] = self._reference(self._pages_number)
+                    continue
+                copy[NameObject(k)] = self._copy_value(v)
+            return copy
+        if value is None:
+            return NullObject()
+        return value
+
+    def _serialize(self, obj):
+        buf = BytesIO()
+        obj.writeToStream(buf, None)
+        return buf.getvalue()
+
+    def _write_data(self, number, data):
+        self._offsets[number] = self.output.tell()
+        self.output.write('{} 0 obj\n'.format(number).encode('ascii'))
+        self.output.write(data)
+        self.output.write(b'\nendobj\n')
+
+    def _write_object(self, number, obj):
+        self._write_data(number, self._serialize(obj))
+
+    def _write_outlines(self):
+        outlines_number = self._reserve()
+        item_numbers = [self._reserve() for _ in self._bookmarks]
+        for i, (title, page_number) in enumerate(self._bookmarks):
+            item = DictionaryObject({
+                NameObject('/Title'): createStringObject(title),
+                NameObject('/Parent'): self._reference(outlines_number),
+                NameObject('/Dest'): ArrayObject([self._reference(page_number), NameObject('/Fit')]),
+            })
+            if i > 0:
+                item[NameObject('/Prev')] = self._reference(item_numbers[i - 1])
+            if i < len(item_numbers) - 1:
+                item[NameObject('/Next')] = self._reference(item_numbers[i + 1])
+            self._write_object(item_numbers[i], item)
+
+        self._write_object(outlines_number, DictionaryObject({
+            NameObject('/Type'): NameObject('/Outlines'),
+            NameObject('/First'): self._reference(item_numbers[0]),
+            NameObject('/Last'): self._reference(item_numbers[-1]),
+            NameObject('/Count'): NumberObject(len(item_numbers)),
+        }))
+        return outlines_number
+
+    def _write_trailer(self, catalog_number):
+        # Numbers freed by deduplication and not reused are listed as free
+        # entries, linked to each other starting from object 0
+        free = sorted(n for n, offset in enumerate(self._offsets) if offset is None and n > 0)
+        next_free = dict(zip([0] + free, free + [0]))
+
+        xref_offset = self.output.tell()
+        lines = ['xref\n0 {}\n'.format(len(self._offsets))]
+        for number, offset in enumerate(self._offsets):
+            if number == 0:
+                lines.append('{:010d} 65535 f \n'.format(next_free[0]))
+            elif offset is None:
+                lines.append('{:010d} 00001 f \n'.format(next_free[number]))
+            else:
+                lines.append('{:010d} 00000 n \n'.format(offset))
+        self.output.write(''.join(lines).encode('ascii'))
+
+        self.output.write(b'trailer\n')
+        self.output.write(self._serialize(DictionaryObject({
+            NameObject('/Size'): NumberObject(len(self._offsets)),
+            NameObject('/Root'): self._reference(catalog_number),
+        })))
+        self.output.write('\nstartxref\n{}\n%%EOF\n'.format(xref_offset).encode('ascii'))
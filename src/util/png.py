@@ -0,0 +1,54 @@
+#
+# Minimal PNG writer, so screenshots and diff images can be saved without
+# depending on an imaging library.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import struct
+import zlib
+
+COLOR_TYPE_GRAY = 0
+COLOR_TYPE_RGB = 2
+
+_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def _chunk(chunk_type, data):
+    checksum = zlib.crc32(chunk_type + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', checksum)
+
+def write_png(filename, width, height, rows, color_type=COLOR_TYPE_RGB, compression_level=6):
+    """
+    Write an 8 bit per channel PNG. rows is an iterable of height rows of raw
+    pixel bytes, it is consumed one row at a time.
+    """
+    compressor = zlib.compressobj(compression_level)
+    with open(filename, 'wb') as f:
+        f.write(_SIGNATURE)
+        f.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)))
+        data = []
+        size = 0
+        for row in rows:
+            if not isinstance(row, bytes):
+                row = bytes(bytearray(row))
+            # Filter type 0 (None) for every scanline
+            data.append(compressor.compress(b'\x00' + row))
+            size += len(data[-1])
+            if size > 1024 * 1024:
+                f.write(_chunk(b'IDAT', b''.join(data)))
+                data = []
+                size = 0
+        data.append(compressor.flush())
+        f.write(_chunk(b'IDAT', b''.join(data)))
+        f.write(_chunk(b'IEND', b''))
@@ -0,0 +1,105 @@
+#
+# Writers for test reports that write every record as it is added, so reports
+# with many violations don't have to be built in memory first.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import json
+
+from xml.sax.saxutils import quoteattr
+
+def _attributes(**attributes):
+    return ''.join(' {}={}'.format(name, quoteattr(u'{}'.format(value)))
+        for name, value in sorted(attributes.items()) if value is not None)
+
+class JunitXmlWriter(object):
+    """
+    Writes a junit XML file with the same structure as junit_xml. Test cases
+    are written to a suite as they are added, the suite's element is written
+    when it is closed, as it holds the counts. So only the test cases of the
+    open suite are in memory.
+
+        with JunitXmlWriter('junit.xml') as junit:
+            junit.start_suite('ERC /')
+            junit.add_case('ERC rule 2', '/', failure_message='...', failure_type='2')
+    """
+
+    def __init__(self, filename):
+        self.output = io.open(filename, 'w', encoding='utf-8')
+        self.output.write(u'<?xml version="1.0" encoding="utf-8"?>\n<testsuites>')
+        self._suite_name = None
+        self._cases = []
+        self._failures = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def start_suite(self, name):
+        self.end_suite()
+        self._suite_name = name
+
+    def add_case(self, name, classname, failure_message=None, failure_type=None):
+        case = u'<testcase{}'.format(_attributes(name=name, classname=classname))
+        if failure_message is None:
+            case += u'/>'
+        else:
+            self._failures += 1
+            case += u'><failure{}/></testcase>'.format(
+                _attributes(type=failure_type, message=failure_message))
+        self._cases.append(case)
+
+    def end_suite(self):
+        if self._suite_name is None:
+            return
+        self.output.write(u'<testsuite{}>'.format(_attributes(name=self._suite_name,
+            tests=len(self._cases), failures=self._failures, errors=0, skipped=0)))
+        self.output.write(u''.join(self._cases))
+        self.output.write(u'</testsuite>')
+        self._suite_name = None
+        self._cases = []
+        self._failures = 0
+
+    def close(self):
+        if self.output.closed:
+            return
+        self.end_suite()
+        self.output.write(u'</testsuites>\n')
+        self.output.close()
+
+class JsonReportWriter(object):
+    """
+    Writes {"violations": [...], "summary": {...}} with the violations
+    written as they are added.
+    """
+
+    def __init__(self, filename):
+        self.output = open(filename, 'w')
+        self.output.write('{"violations": [')
+        self._count = 0
+
+    def add(self, record):
+        if self._count:
+            self.output.write(',')
+        self.output.write('\n  ')
+        self.output.write(json.dumps(record, sort_keys=True))
+        self._count += 1
+
+    def close(self, summary=None):
+        self.output.write('\n], "summary": {}}}\n'.format(json.dumps(summary or {}, sort_keys=True)))
+        self.output.close()
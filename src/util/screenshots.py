@@ -0,0 +1,136 @@
+#
+# Cheap alternative to recording a video of every UI automation run: keep the
+# last screenshots of the display in memory and only write them out when the
+# automation fails.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import os
+import threading
+import time
+import zlib
+
+from collections import deque
+from Xlib import X
+from Xlib import display as xdisplay
+from Xlib.error import ConnectionClosedError, XError
+
+from util import png
+
+logger = logging.getLogger(__name__)
+
+CONTACT_SHEET_COLUMNS = 4
+# Screenshots are scaled down by this factor on the contact sheet
+CONTACT_SHEET_SCALE = 2
+CONTACT_SHEET_BORDER = 4
+
+class ScreenshotRingBuffer(threading.Thread):
+    """
+    Takes a screenshot of the display every interval seconds, keeping the
+    last max_frames of them (zlib compressed) in memory.
+    """
+
+    def __init__(self, display_name, interval=0.5, max_frames=16):
+        super(ScreenshotRingBuffer, self).__init__(name='ScreenshotRingBuffer')
+        self.daemon = True
+        self.display_name = display_name
+        self.interval = interval
+        self.frames = deque(maxlen=max_frames)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        try:
+            display = xdisplay.Display(self.display_name)
+        except Exception as e:
+            logger.warning('Not taking screenshots: %s', e)
+            return
+
+        screen = display.screen()
+        self.width = screen.width_in_pixels
+        self.height = screen.height_in_pixels
+        try:
+            while not self._stop_event.is_set():
+                self._capture(screen.root)
+                self._stop_event.wait(self.interval)
+            # Make sure the state at the moment of failure is in there
+            self._capture(screen.root)
+        except (ConnectionClosedError, XError) as e:
+            logger.debug('Stopped taking screenshots: %s', e)
+        finally:
+            display.close()
+
+    def _capture(self, root):
+        image = root.get_image(0, 0, self.width, self.height, X.ZPixmap, 0xffffffff)
+        # Mostly empty screens compress very well, even at the fastest level
+        self.frames.append((time.time(), zlib.compress(image.data, 1)))
+
+    def _rgb_rows(self, frame, scale=1):
+        """
+        Yields the rows of a frame as RGB, skipping pixels to scale it down.
+        Frames are stored as 32 bit BGRX pixels.
+        """
+        data = zlib.decompress(frame)
+        stride = self.width * 4
+        for y in range(0, self.height, scale):
+            row = data[y * stride:(y + 1) * stride]
+            yield b''.join(row[x:x + 3][::-1] for x in range(0, stride, 4 * scale))
+
+    def write_last_frame(self, filename):
+        if not self.frames:
+            return False
+        png.write_png(filename, self.width, self.height, self._rgb_rows(self.frames[-1][1]))
+        return True
+
+    def write_contact_sheet(self, filename):
+        """
+        Write all buffered screenshots, oldest first, in a grid to one PNG.
+        """
+        if not self.frames:
+            return False
+
+        frames = list(self.frames)
+        tile_width = len(range(0, self.width, CONTACT_SHEET_SCALE))
+        tile_height = len(range(0, self.height, CONTACT_SHEET_SCALE))
+        columns = min(CONTACT_SHEET_COLUMNS, len(frames))
+        rows = (len(frames) + columns - 1) // columns
+        width = columns * (tile_width + CONTACT_SHEET_BORDER) + CONTACT_SHEET_BORDER
+        height = rows * (tile_height + CONTACT_SHEET_BORDER) + CONTACT_SHEET_BORDER
+
+        def sheet_rows():
+            border_row = b'\x40' * (width * 3)
+            border = b'\x40' * (CONTACT_SHEET_BORDER * 3)
+            empty_tile = b'\x40' * (tile_width * 3)
+            for row in range(rows):
+                for i in range(CONTACT_SHEET_BORDER):
+                    yield border_row
+                tiles = [self._rgb_rows(frame, CONTACT_SHEET_SCALE)
+                    for _, frame in frames[row * columns:(row + 1) * columns]]
+                for y in range(tile_height):
+                    parts = [border]
+                    for column in range(columns):
+                        parts.append(next(tiles[column]) if column < len(tiles) else empty_tile)
+                        parts.append(border)
+                    yield b''.join(parts)
+            for i in range(CONTACT_SHEET_BORDER):
+                yield border_row
+
+        png.write_png(filename, width, height, sheet_rows())
+        logger.info('Wrote %d screenshots to %s', len(frames), filename)
+        return True
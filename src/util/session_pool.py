@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# Pool of pre-started Xvfb displays, so repeated ERC/DRC/export jobs don't
+# each pay for starting a new X server. A session is handed out to one job at
+# a time and cleaned up before it is reused:
+#
+#     with SessionPool(2) as pool:
+#         with pool.session() as session:
+#             eeschema_run_erc(schematic, output_dir, False, session=session)
+#
+# The display in use is selected through $DISPLAY, so sessions of a single
+# pool should be used from one thread at a time. Use one pool per process to
+# run jobs in parallel.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import os
+
+from contextlib import contextmanager
+from xvfbwrapper import Xvfb
+from Xlib import display as xdisplay
+from Xlib.error import ConnectionClosedError, DisplayError, XError
+
+from util import x11
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class Session(object):
+    def __init__(self, **xvfb_args):
+        self.xvfb_args = xvfb_args
+        self.xvfb = None
+        self.display = None
+        self.uses = 0
+
+    def start(self):
+        # Xvfb changes $DISPLAY, the pool decides which display is active
+        original_display = os.environ.get('DISPLAY')
+        self.xvfb = Xvfb(**self.xvfb_args)
+        self.xvfb.start()
+        self.display = ':{}'.format(self.xvfb.new_display)
+        _restore_display(original_display)
+        logger.debug('Started session on display %s', self.display)
+
+    def stop(self):
+        if self.xvfb is None:
+            return
+        original_display = os.environ.get('DISPLAY')
+        self.xvfb.stop()
+        _restore_display(original_display)
+        self.xvfb = None
+        logger.debug('Stopped session on display %s', self.display)
+
+    def is_running(self):
+        return self.xvfb is not None and self.xvfb.proc.poll() is None
+
+    def reset(self):
+        """
+        Close every window left behind by the previous job and drop the
+        clipboard content. Returns False when the display can't be reset.
+        """
+        if not self.is_running():
+            return False
+
+        # Also stops serving our clipboard content
+        x11.close_connection(self.display)
+
+        try:
+            display = xdisplay.Display(self.display)
+        except (DisplayError, ConnectionClosedError) as e:
+            logger.warning('Failed to connect to %s: %s', self.display, e)
+            return False
+        try:
+            root = display.screen().root
+            # The server drops selections owned by the windows of killed clients
+            for window in root.query_tree().children:
+                logger.debug('Killing client of left over window %s', window.id)
+                window.kill_client()
+            display.sync()
+        except (XError, ConnectionClosedError) as e:
+            logger.warning('Failed to reset %s: %s', self.display, e)
+            return False
+        finally:
+            display.close()
+        return True
+
+class SessionPool(object):
+    def __init__(self, size=1, width=800, height=600, colordepth=24):
+        self.size = size
+        self.xvfb_args = {
+            'width': width,
+            'height': height,
+            'colordepth': colordepth,
+        }
+        self._sessions = []
+        self._idle = queue.Queue()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def start(self):
+        for i in range(self.size):
+            session = Session(**self.xvfb_args)
+            session.start()
+            self._sessions.append(session)
+            self._idle.put(session)
+
+    def stop(self):
+        for session in self._sessions:
+            session.stop()
+        self._sessions = []
+        self._idle = queue.Queue()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """
+        Hand out an idle session, making it the active $DISPLAY while it is
+        used. Blocks until a session is available.
+        """
+        try:
+            session = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError('Timed out waiting for an idle session')
+
+        original_display = os.environ.get('DISPLAY')
+        os.environ['DISPLAY'] = session.display
+        session.uses += 1
+        try:
+            yield session
+        finally:
+            _restore_display(original_display)
+            if not session.reset():
+                logger.info('Restarting broken session on %s', session.display)
+                session.stop()
+                session.start()
+            self._idle.put(session)
+
+def _restore_display(display):
+    if display is None:
+        os.environ.pop('DISPLAY', None)
+    else:
+        os.environ['DISPLAY'] = display
@@ -0,0 +1,221 @@
+#
+# Lightweight tracing of where the time of an automation run goes: starting
+# KiCad, waiting for its windows and files, typing keys, plotting, merging and
+# zipping. Spans are only recorded while tracing is enabled, otherwise span()
+# returns a shared object that does nothing.
+#
+#     trace.enable('trace.json')
+#     with trace.span('plot F.Cu', 'plot', layer='F.Cu'):
+#         ...
+#
+# The trace is written in the Chrome trace event format, which can be opened
+# with chrome://tracing or https://ui.perfetto.dev, and is summarized per span
+# name and category in a JSON file next to it.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Tracer the spans are recorded in, None when tracing is disabled
+_tracer = None
+
+class Tracer(object):
+    """
+    Collects the spans of one or more processes as Chrome trace events.
+    Spans can end on any thread.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.events = []
+        self._threads = set()
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, args):
+        pid = os.getpid()
+        thread = threading.current_thread()
+        with self._lock:
+            if (pid, thread.ident) not in self._threads:
+                self._add_metadata(pid, thread)
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int(start * 1e6),
+                'dur': int((end - start) * 1e6),
+                'pid': pid,
+                'tid': thread.ident,
+                'args': args,
+            })
+
+    def _add_metadata(self, pid, thread):
+        if not any(process == pid for process, _ in self._threads):
+            process = multiprocessing.current_process()
+            self.events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': thread.ident,
+                'args': {'name': os.path.basename(sys.argv[0]) if process.name == 'MainProcess' else process.name}})
+        self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread.ident,
+            'args': {'name': thread.name}})
+        self._threads.add((pid, thread.ident))
+
+    def add_events(self, events):
+        """
+        Add the events of another tracer, e.g. of a worker process.
+        """
+        with self._lock:
+            for event in events:
+                if event['ph'] == 'M':
+                    if (event['pid'], event['tid']) in self._threads:
+                        continue
+                    if event['name'] == 'thread_name':
+                        self._threads.add((event['pid'], event['tid']))
+                self.events.append(event)
+
+    def summary(self):
+        """
+        Count, total and longest duration in seconds of the spans per name
+        and per category. The totals of nested spans overlap.
+        """
+        names = {}
+        categories = {}
+        for event in self.events:
+            if event['ph'] != 'X':
+                continue
+            for key, totals in [(event['name'], names), (event['cat'], categories)]:
+                total = totals.setdefault(key, {'count': 0, 'total': 0, 'max': 0})
+                seconds = event['dur'] / 1e6
+                total['count'] += 1
+                total['total'] += seconds
+                total['max'] = max(total['max'], seconds)
+        for totals in list(names.values()) + list(categories.values()):
+            totals['total'] = round(totals['total'], 6)
+        return {
+            'duration': round(time.time() - self.start, 6),
+            'categories': categories,
+            'spans': names,
+        }
+
+    def write(self, filename):
+        """
+        Write the trace to filename and its summary to summary_file(filename).
+        """
+        with self._lock:
+            events = list(self.events)
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        with open(summary_file(filename), 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+        logger.info('Wrote trace to %s', filename)
+
+class Span(object):
+    """
+    A span that started when it was created and ends when end() is called or
+    its with block is left. Arguments are shown with the span in the trace.
+    """
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is not None:
+            self.args['error'] = type.__name__
+        self.end()
+
+    def set(self, name, value):
+        self.args[name] = value
+
+    def end(self):
+        if self.tracer is not None:
+            self.tracer.add(self.name, self.category, self.start, time.time(), self.args)
+            self.tracer = None
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def end(self):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, category='automation', **args):
+    """
+    Start a span, use it as a context manager or call end() on it.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, category, args)
+
+def enabled():
+    return _tracer is not None
+
+def enable(filename):
+    """
+    Trace until the script exits, then write the trace to filename.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    atexit.register(_tracer.write, filename)
+
+@contextmanager
+def tracing():
+    """
+    Trace the with block in a tracer of its own. Its events are also added
+    to the tracer that was active before, if any.
+    """
+    global _tracer
+    previous = _tracer
+    tracer = _tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        _tracer = previous
+        if previous is not None:
+            previous.add_events(tracer.events)
+
+def add_events(events):
+    """
+    Add events recorded by another process to the active tracer.
+    """
+    if _tracer is not None and events:
+        _tracer.add_events(events)
+
+def summary_file(filename):
+    return os.path.splitext(filename)[0] + '_summary.json'
@@ -20,6 +20,7 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import atexit
 import logging
 import os
 import subprocess
@@ -30,12 +31,21 @@ import time
 from contextlib import contextmanager
 
 from xvfbwrapper import Xvfb
+from Xlib.error import ConnectionClosedError
 from util import file_util
+from util import trace
+from util import x11
+from util.screenshots import ScreenshotRingBuffer
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class PopenContext(subprocess.Popen):
+    def __init__(self, args, *popen_args, **popen_kwargs):
+        # Traced from the start of the process until it has exited
+        self._span = trace.span('process ' + os.path.basename(args[0]), 'process', args=' '.join(args))
+        super(PopenContext, self).__init__(args, *popen_args, **popen_kwargs)
+
     def __enter__(self):
         return self
     def __exit__(self, type, value, traceback):
@@ -49,51 +59,291 @@ class PopenContext(subprocess.Popen):
             self.terminate()
         # Wait for the process to terminate, to avoid zombies.
         self.wait()
+        self._span.set('returncode', self.returncode)
+        self._span.end()
 
 @contextmanager
-def recorded_xvfb(video_filename, **xvfb_args):
-    with Xvfb(**xvfb_args):
-        with PopenContext([
-                'recordmydesktop',
-                '--no-sound',
-                '--no-frame',
-                '--on-the-fly-encoding',
-                '-o', video_filename], close_fds=True) as screencast_proc: 
+def screencast(video_filename):
+    with PopenContext([
+            'recordmydesktop',
+            '--no-sound',
+            '--no-frame',
+            '--on-the-fly-encoding',
+            '-o', video_filename], close_fds=True) as screencast_proc:
+        yield
+        screencast_proc.terminate()
+
+# Recording modes of virtual_display()
+RECORD_OFF = 'off'
+RECORD_ALWAYS = 'always'
+# Keep screenshots in memory and only write them when the automation fails
+RECORD_ON_FAILURE = 'on_failure'
+RECORD_MODES = [RECORD_OFF, RECORD_ALWAYS, RECORD_ON_FAILURE]
+
+@contextmanager
+def virtual_display(video_filename=None, session=None, record=RECORD_OFF, **xvfb_args):
+    """
+    Provides the X display to run the automation on: the display of session
+    (see util.session_pool) when one is given, a new Xvfb instance otherwise.
+
+    With RECORD_ALWAYS the screen is recorded to video_filename. With
+    RECORD_ON_FAILURE a contact sheet of the last screenshots and the final
+    screenshot are written next to it (as -screenshots.png and -last.png)
+    when an exception escapes the block.
+    """
+    if record not in RECORD_MODES:
+        raise ValueError('record should be one of {}'.format(', '.join(RECORD_MODES)))
+
+    xvfb = None
+    if session is None:
+        xvfb = Xvfb(**xvfb_args)
+        xvfb.start()
+    else:
+        os.environ['DISPLAY'] = session.display
+
+    try:
+        if record == RECORD_ALWAYS:
+            with screencast(video_filename):
+                yield
+        elif record == RECORD_ON_FAILURE:
+            with screenshots_on_failure(os.path.splitext(video_filename)[0]):
+                yield
+        else:
             yield
-            screencast_proc.terminate()
+    finally:
+        x11.close_connection()
+        if xvfb is not None:
+            xvfb.stop()
+
+@contextmanager
+def screenshots_on_failure(filename_base):
+    recorder = ScreenshotRingBuffer(os.environ['DISPLAY'])
+    recorder.start()
+    try:
+        yield
+    except:
+        recorder.stop()
+        logger.info('Automation failed, writing screenshots')
+        recorder.write_contact_sheet(filename_base + '-screenshots.png')
+        recorder.write_last_frame(filename_base + '-last.png')
+        raise
+    recorder.stop()
 
+@contextmanager
+def recorded_xvfb(video_filename, **xvfb_args):
+    with virtual_display(video_filename, record=RECORD_ALWAYS, **xvfb_args):
+        yield
+
+def record_mode(record):
+    """
+    Converts the old boolean record arguments to a recording mode.
+    """
+    if record is True:
+        return RECORD_ALWAYS
+    if record is False or record is None:
+        return RECORD_OFF
+    return record
+
+def add_record_arguments(parser):
+    """
+    Add --record, a flag that records a video like it always did, and
+    --record_mode to choose how to record. Get the mode with
+    record_mode_from_args().
+    """
+    parser.add_argument('--record', help='Record a video of the UI automation, same as --record_mode always',
+        action='store_true'
+    )
+    parser.add_argument('--record_mode', help='Record the UI automation: off, always or only screenshots on failure',
+        choices=RECORD_MODES
+    )
+
+def record_mode_from_args(parser, args):
+    """
+    The recording mode of the arguments added by add_record_arguments().
+    """
+    if args.record_mode is None:
+        return record_mode(args.record)
+    if args.record and args.record_mode != RECORD_ALWAYS:
+        parser.error('--record conflicts with --record_mode {}'.format(args.record_mode))
+    return args.record_mode
+
+
+# xdotool commands that are executed in-process, other commands are passed
+# on to the xdotool executable.
+XDOTOOL_COMMANDS = ('key', 'search', 'windowfocus', 'windowsize')
+
+class _UnsupportedXdotoolCommand(Exception):
+    pass
 
 def xdotool(command):
-    return subprocess.check_output(['xdotool'] + command)
+    """
+    Run an xdotool command chain like ['search', '--name', 'Plot', 'windowfocus']
+    over the persistent X connection. Commands and options that are not
+    emulated fall back to running xdotool itself.
+    """
+    with trace.span('xdotool ' + command[0], 'ui', command=' '.join(command)) as span:
+        try:
+            return _with_connection(lambda connection: _xdotool_in_process(connection, command))
+        except _UnsupportedXdotoolCommand as e:
+            logger.debug('Running xdotool for unsupported command %s', e)
+            span.set('executable', True)
+            return subprocess.check_output(['xdotool'] + command)
+
+def _split_xdotool_chain(command):
+    chain = []
+    for arg in command:
+        if arg in XDOTOOL_COMMANDS or not chain:
+            chain.append([arg])
+        else:
+            chain[-1].append(arg)
+    return chain
+
+def _parse_xdotool_chain(command):
+    """
+    Check a whole command chain before any of it runs, so that a chain with
+    an unsupported command is run once, by the xdotool executable. Returns
+    (command name, arguments) for every command, a window of None stands for
+    the first window found by the search before it.
+    """
+    chain = []
+    searched = False
+    for args in _split_xdotool_chain(command):
+        name, args = args[0], args[1:]
+        if name not in XDOTOOL_COMMANDS:
+            raise _UnsupportedXdotoolCommand(name)
+
+        if name == 'key':
+            if any(arg.startswith('--') for arg in args):
+                raise _UnsupportedXdotoolCommand(' '.join([name] + args))
+            chain.append((name, args))
+
+        elif name == 'search':
+            only_visible = False
+            window_regex = None
+            while args:
+                arg = args.pop(0)
+                if arg == '--onlyvisible':
+                    only_visible = True
+                elif arg == '--name':
+                    continue
+                elif arg.startswith('--') or window_regex is not None:
+                    raise _UnsupportedXdotoolCommand(' '.join(['search', arg]))
+                else:
+                    window_regex = arg
+            chain.append((name, (window_regex, only_visible)))
+            searched = True
+
+        elif name == 'windowfocus':
+            window = _window_argument(args, searched, name)
+            if args:
+                raise _UnsupportedXdotoolCommand(' '.join([name] + args))
+            chain.append((name, window))
+
+        elif name == 'windowsize':
+            sync = '--sync' in args
+            if sync:
+                args.remove('--sync')
+            if len(args) == 3:
+                window = _window_argument(args, searched, name)
+            else:
+                window = _window_argument([], searched, name)
+            try:
+                width, height = [int(arg) for arg in args]
+            except ValueError:
+                raise _UnsupportedXdotoolCommand(' '.join([name] + args))
+            chain.append((name, (window, width, height, sync)))
+    return chain
+
+def _window_argument(args, searched, command_name):
+    if args and not args[0].startswith('-'):
+        try:
+            return int(args.pop(0), 0)
+        except ValueError:
+            raise _UnsupportedXdotoolCommand(command_name)
+    if searched:
+        return None
+    raise _UnsupportedXdotoolCommand(command_name)
+
+def _xdotool_in_process(connection, command):
+    window_stack = []
+    output = ''
+    for name, args in _parse_xdotool_chain(command):
+        if name == 'key':
+            connection.send_keys(args)
+
+        elif name == 'search':
+            window_regex, only_visible = args
+            window_stack = connection.find_windows(window_regex, only_visible)
+            if not window_stack:
+                # Same behavior as xdotool, which exits with 1 when nothing is found
+                raise subprocess.CalledProcessError(1, ['xdotool'] + command)
+            output += ''.join('{}\n'.format(window) for window in window_stack)
+
+        elif name == 'windowfocus':
+            connection.focus_window(args if args is not None else window_stack[0])
+
+        elif name == 'windowsize':
+            window, width, height, sync = args
+            connection.resize_window(window if window is not None else window_stack[0], width, height, sync)
+
+    return output
 
 def clipboard_store(string):
-    p = subprocess.Popen(['xclip', '-selection', 'clipboard'], stdin=subprocess.PIPE)
-    outs, errs = p.communicate(input=string)
-    if (errs):
-        logger.error('Failed to store string in clipboard')
-        logger.error(errs)
+    with trace.span('clipboard store', 'ui', length=len(string)):
+        _with_connection(lambda connection: connection.store_clipboard(string))
 
 def clipboard_retrieve():
-    p = subprocess.Popen(['xclip', '-o', '-selection', 'clipboard'], stdout=subprocess.PIPE)
-    output = '';
-    for line in p.stdout:
-        output += line.decode()
-    return output;
+    with trace.span('clipboard retrieve', 'ui'):
+        return _with_connection(lambda connection: connection.retrieve_clipboard())
+
+# (name, seconds, found) for every wait_for_window call, only recorded after
+# report_wait_times() has been called
+_wait_times = None
+
+def report_wait_times():
+    """
+    Record how long each wait_for_window call takes and log a summary when the
+    script exits.
+    """
+    global _wait_times
+    if _wait_times is None:
+        _wait_times = []
+        atexit.register(_log_wait_times)
+
+def _log_wait_times():
+    total = 0
+    for name, seconds, found in _wait_times:
+        logger.info('Waited %.3f s for %s window%s',
+            seconds, name, '' if found else ' (timed out)')
+        total += seconds
+    logger.info('Waited %.3f s for windows in total', total)
+
+def _with_connection(function):
+    try:
+        return function(x11.get_connection())
+    except ConnectionClosedError:
+        # The cached connection belonged to an Xvfb instance that has been
+        # stopped since, reconnect to the current one.
+        x11.close_connection()
+        return function(x11.get_connection())
 
 def wait_for_window(name, window_regex, timeout=10, focus=True):
-    DELAY = 0.5
     logger.info('Waiting for %s window...', name)
-    xdotool_command = ['search', '--onlyvisible', '--name', window_regex]
-    if focus:
-        xdotool_command.append('windowfocus')
+    start = time.time()
+    with trace.span('wait for {} window'.format(name), 'wait', window_regex=window_regex) as span:
+        window = _with_connection(
+            lambda connection: connection.wait_for_window(window_regex, timeout))
+        span.set('found', window is not None)
+    elapsed = time.time() - start
 
-    for i in range(int(timeout/DELAY)):
-        try:
-            window_id = xdotool(xdotool_command).strip()
-            logger.info('Found %s window', name)
-            logger.debug('Window id: %s', window_id)
-            return window_id
-        except subprocess.CalledProcessError:
-            pass
-        time.sleep(DELAY)
-    raise RuntimeError('Timed out waiting for %s window' % name)
+    if _wait_times is not None:
+        _wait_times.append((name, elapsed, window is not None))
+    if window is None:
+        raise RuntimeError('Timed out waiting for %s window' % name)
+
+    window_id = str(window)
+    logger.info('Found %s window after %.3f s', name, elapsed)
+    logger.debug('Window id: %s', window_id)
+    if focus:
+        xdotool(['windowfocus', window_id])
+    return window_id
@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+#
+# In-process access to the X server used for UI automation. A single Xlib
+# connection is kept per display so the automation scripts can react to X
+# events instead of polling the server with a new xdotool process.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import logging
+import os
+import re
+import select
+import threading
+import time
+
+from Xlib import X, XK, Xatom
+from Xlib import display as xdisplay
+from Xlib.error import ConnectionClosedError, XError
+from Xlib.ext import xtest
+from Xlib.protocol import event as xevent
+
+logger = logging.getLogger(__name__)
+
+# Modifier names accepted in key sequences like 'ctrl+v', as used by xdotool
+MODIFIER_KEYSYMS = {
+    'alt': 'Alt_L',
+    'ctrl': 'Control_L',
+    'control': 'Control_L',
+    'shift': 'Shift_L',
+    'super': 'Super_L',
+    'meta': 'Meta_L',
+}
+
+# xdotool waits 12 ms between keystrokes by default, wx needs some time to
+# process each of them.
+KEY_DELAY = 0.012
+
+class XConnection(object):
+    def __init__(self, display_name=None):
+        self.display_name = display_name or os.environ['DISPLAY']
+        self.display = xdisplay.Display(self.display_name)
+        # Windows regularly disappear between an event and our request for
+        # their properties, that is not an error for us.
+        self.display.set_error_handler(self._ignore_error)
+        self.root = self.display.screen().root
+
+        self.net_wm_name = self.display.intern_atom('_NET_WM_NAME')
+        self.utf8_string = self.display.intern_atom('UTF8_STRING')
+
+        self.clipboard = self.display.intern_atom('CLIPBOARD')
+        self.incr = self.display.intern_atom('INCR')
+        self.selection_property = self.display.intern_atom('KICAD_AUTOMATION_SELECTION')
+
+        # Get notified of top level windows being created and mapped
+        self.root.change_attributes(event_mask=X.SubstructureNotifyMask)
+        self._watched_windows = set()
+
+        self._clipboard_owner = None
+        self._selection_window = None
+
+    @staticmethod
+    def _ignore_error(error, request):
+        logger.debug('Ignoring X error: %s', error)
+
+    def close(self):
+        if self._clipboard_owner is not None:
+            self._clipboard_owner.stop()
+            self._clipboard_owner = None
+        try:
+            self.display.close()
+        except (ConnectionClosedError, IOError, OSError):
+            pass
+
+    def get_window_name(self, window):
+        try:
+            prop = window.get_full_property(self.net_wm_name, self.utf8_string)
+            if prop and prop.value:
+                return _decode(prop.value, 'utf-8')
+            prop = window.get_full_property(Xatom.WM_NAME, X.AnyPropertyType)
+            if prop and prop.value:
+                return _decode(prop.value, 'latin-1')
+        except XError:
+            pass
+        return None
+
+    def is_visible(self, window):
+        try:
+            return window.get_attributes().map_state == X.IsViewable
+        except XError:
+            return False
+
+    def find_windows(self, window_regex, only_visible=True):
+        regex = _compile_window_regex(window_regex)
+        return [window.id for window in self._top_level_windows()
+            if self._matches(window, regex, only_visible)]
+
+    def wait_for_window(self, window_regex, timeout, only_visible=True):
+        """
+        Wait until a top level window with a name matching window_regex exists.
+        Returns the window id or None when the timeout expires.
+        """
+        regex = _compile_window_regex(window_regex)
+        deadline = time.time() + timeout
+
+        # Watch all existing windows before looking at them, so a name change
+        # right after the initial scan still wakes us up.
+        candidates = self._top_level_windows()
+        for window in candidates:
+            self._watch(window)
+        self.display.sync()
+        self._drain_events()
+
+        while True:
+            for window in candidates:
+                if self._matches(window, regex, only_visible):
+                    return window.id
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+
+            # The round trips of _matches may have queued events already,
+            # select only wakes up for events that are still unread
+            if not self.display.pending_events():
+                select.select([self.display.fileno()], [], [], remaining)
+            candidates = self._drain_events()
+
+    def focus_window(self, window_id):
+        window = self.display.create_resource_object('window', window_id)
+        window.set_input_focus(X.RevertToParent, X.CurrentTime)
+        self.display.sync()
+
+    def resize_window(self, window_id, width, height, sync=False, timeout=5):
+        window = self.display.create_resource_object('window', window_id)
+        window.configure(width=width, height=height)
+        self.display.sync()
+        if not sync:
+            return
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            geometry = window.get_geometry()
+            if geometry.width == width and geometry.height == height:
+                return
+            time.sleep(0.01)
+        logger.warning('Window %s did not get resized to %dx%d', window_id, width, height)
+
+    def send_keys(self, keys, delay=KEY_DELAY):
+        """
+        Type key sequences like 'Return' or 'alt+f' with the XTEST extension.
+        """
+        for key in keys:
+            keycodes = self._key_sequence_to_keycodes(key)
+            if keycodes is None:
+                logger.warning("No such key name '%s'. Ignoring it.", key)
+                continue
+
+            for keycode in keycodes:
+                xtest.fake_input(self.display, X.KeyPress, keycode)
+            for keycode in reversed(keycodes):
+                xtest.fake_input(self.display, X.KeyRelease, keycode)
+            self.display.sync()
+            time.sleep(delay)
+
+    def _key_sequence_to_keycodes(self, key_sequence):
+        keycodes = []
+        for name in key_sequence.split('+'):
+            keysym = XK.string_to_keysym(MODIFIER_KEYSYMS.get(name.lower(), name))
+            if keysym == X.NoSymbol:
+                return None
+            keycode = self.display.keysym_to_keycode(keysym)
+            if keycode == 0:
+                return None
+
+            # Characters like 'A' only exist as the shifted symbol of a key
+            if (self.display.keycode_to_keysym(keycode, 0) != keysym
+                    and self.display.keycode_to_keysym(keycode, 1) == keysym):
+                keycodes.append(self.display.keysym_to_keycode(XK.XK_Shift_L))
+            keycodes.append(keycode)
+        return keycodes
+
+    def store_clipboard(self, text):
+        """
+        Make text the content of the CLIPBOARD selection. The selection is
+        served from a background thread until another client takes it over
+        or the connection is closed.
+        """
+        if self._clipboard_owner is None or not self._clipboard_owner.is_alive():
+            if self._clipboard_owner is not None:
+                # Closes the wakeup pipe of the owner that stopped on an error
+                self._clipboard_owner.stop()
+            self._clipboard_owner = ClipboardOwner(self.display_name)
+            self._clipboard_owner.start()
+        self._clipboard_owner.set_text(text)
+
+    def retrieve_clipboard(self, timeout=5):
+        for target in (self.utf8_string, Xatom.STRING):
+            data = self._convert_selection(target, timeout)
+            if data is not None:
+                return _decode(data, 'utf-8' if target == self.utf8_string else 'latin-1')
+        return ''
+
+    def _convert_selection(self, target, timeout):
+        if self._selection_window is None:
+            self._selection_window = self.root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+
+        window = self._selection_window
+        window.convert_selection(self.clipboard, target, self.selection_property, X.CurrentTime)
+        self.display.flush()
+
+        deadline = time.time() + timeout
+        while True:
+            while self.display.pending_events():
+                event = self.display.next_event()
+                if event.type == X.SelectionNotify and event.requestor.id == window.id:
+                    if event.property == X.NONE:
+                        return None
+                    prop = window.get_full_property(self.selection_property, X.AnyPropertyType)
+                    window.delete_property(self.selection_property)
+                    if prop is None:
+                        return None
+                    if prop.property_type == self.incr:
+                        raise RuntimeError('Incremental clipboard transfers are not supported')
+                    return prop.value
+                self._handle_event(event)
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RuntimeError('Timed out waiting for the clipboard content')
+            select.select([self.display.fileno()], [], [], remaining)
+
+    def _top_level_windows(self):
+        try:
+            return self.root.query_tree().children
+        except XError:
+            return []
+
+    def _watch(self, window):
+        if window.id in self._watched_windows:
+            return
+        window.change_attributes(event_mask=X.PropertyChangeMask)
+        self._watched_windows.add(window.id)
+
+    def _drain_events(self):
+        """
+        Handle all queued events, returning the windows that might now match.
+        """
+        changed = []
+        while self.display.pending_events():
+            window = self._handle_event(self.display.next_event())
+            if window is not None:
+                changed.append(window)
+        return changed
+
+    def _handle_event(self, event):
+        if event.type == X.CreateNotify:
+            self._watch(event.window)
+            return event.window
+        elif event.type == X.MapNotify:
+            return event.window
+        elif event.type == X.PropertyNotify:
+            if event.atom in (Xatom.WM_NAME, self.net_wm_name):
+                return event.window
+        elif event.type == X.DestroyNotify:
+            self._watched_windows.discard(event.window.id)
+        return None
+
+    def _matches(self, window, regex, only_visible):
+        if only_visible and not self.is_visible(window):
+            return False
+        name = self.get_window_name(window)
+        return name is not None and regex.search(name) is not None
+
+
+class ClipboardOwner(threading.Thread):
+    """
+    Owns the CLIPBOARD selection on its own X connection and answers paste
+    requests from other clients, like xclip does in the background.
+    """
+
+    def __init__(self, display_name):
+        super(ClipboardOwner, self).__init__(name='ClipboardOwner')
+        self.daemon = True
+
+        self.display = xdisplay.Display(display_name)
+        self.window = self.display.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self.clipboard = self.display.intern_atom('CLIPBOARD')
+        self.targets = self.display.intern_atom('TARGETS')
+        self.utf8_string = self.display.intern_atom('UTF8_STRING')
+        self.text_atom = self.display.intern_atom('TEXT')
+        self.display.flush()
+
+        self.data = None
+        self._pending_data = None
+        self._owned = threading.Event()
+        self._stopped = False
+        # The wakeup pipe is only closed by stop(), under the lock, so its
+        # file descriptors are never written after they could be reused
+        self._lock = threading.Lock()
+        self._closed = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def set_text(self, text, timeout=5):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self._owned.clear()
+        self._pending_data = text
+        with self._lock:
+            if self._stopped or not self.is_alive():
+                raise RuntimeError('The clipboard owner has stopped')
+            os.write(self._wakeup_write, b'x')
+        if not self._owned.wait(timeout):
+            raise RuntimeError('Failed to take ownership of the clipboard')
+
+    def stop(self, timeout=5):
+        with self._lock:
+            if self._closed:
+                return
+            self._stopped = True
+            os.write(self._wakeup_write, b'x')
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+            if self.is_alive():
+                # Still using the pipe, leak it rather than close it under it
+                logger.warning('Clipboard owner did not stop')
+                return
+        with self._lock:
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
+            self._closed = True
+
+    def run(self):
+        try:
+            while not self._stopped:
+                readable, _, _ = select.select([self.display.fileno(), self._wakeup_read], [], [])
+                if self._wakeup_read in readable:
+                    os.read(self._wakeup_read, 64)
+                    if self._pending_data is not None:
+                        self._take_ownership()
+                while self.display.pending_events():
+                    self._handle_event(self.display.next_event())
+        except (ConnectionClosedError, IOError, OSError) as e:
+            logger.debug('Clipboard owner stopped: %s', e)
+        finally:
+            try:
+                self.display.close()
+            except (ConnectionClosedError, IOError, OSError):
+                pass
+
+    def _take_ownership(self):
+        self.data, self._pending_data = self._pending_data, None
+        self.window.set_selection_owner(self.clipboard, X.CurrentTime)
+        owner = self.display.get_selection_owner(self.clipboard)
+        if getattr(owner, 'id', owner) == self.window.id:
+            self._owned.set()
+        else:
+            logger.error('Failed to take ownership of the clipboard')
+
+    def _handle_event(self, event):
+        if event.type == X.SelectionClear:
+            logger.debug('Lost clipboard ownership')
+            self.data = None
+        elif event.type == X.SelectionRequest:
+            self._answer_request(event)
+
+    def _answer_request(self, request):
+        # Obsolete clients don't set a property, ICCCM says to use the target
+        prop = request.property if request.property != X.NONE else request.target
+
+        if self.data is None:
+            prop = X.NONE
+        elif request.target == self.targets:
+            request.requestor.change_property(prop, Xatom.ATOM, 32,
+                [self.targets, self.utf8_string, self.text_atom, Xatom.STRING])
+        elif request.target in (self.utf8_string, self.text_atom):
+            request.requestor.change_property(prop, self.utf8_string, 8, self.data)
+        elif request.target == Xatom.STRING:
+            request.requestor.change_property(prop, Xatom.STRING, 8, self.data)
+        else:
+            prop = X.NONE
+
+        notify = xevent.SelectionNotify(
+            time=request.time,
+            requestor=request.requestor,
+            selection=request.selection,
+            target=request.target,
+            property=prop)
+        request.requestor.send_event(notify)
+        self.display.flush()
+
+
+def _compile_window_regex(window_regex):
+    # xdotool matches window names case insensitively, keep doing the same
+    return re.compile(window_regex, re.IGNORECASE)
+
+def _decode(value, encoding):
+    if isinstance(value, bytes):
+        return value.decode(encoding, 'replace')
+    return value
+
+_connection = None
+
+def get_connection():
+    """
+    Returns the connection to the display in $DISPLAY, opening a new one when
+    the display changed since the last call.
+    """
+    global _connection
+    display_name = os.environ['DISPLAY']
+    if _connection is not None and _connection.display_name != display_name:
+        close_connection()
+    if _connection is None:
+        logger.debug('Opening X connection to %s', display_name)
+        _connection = XConnection(display_name)
+    return _connection
+
+def close_connection(display_name=None):
+    """
+    Close the cached connection, if display_name is given only when it is
+    connected to that display.
+    """
+    global _connection
+    if display_name is not None and _connection is not None \
+            and _connection.display_name != display_name:
+        return
+    if _connection is not None:
+        _connection.close()
+        _connection = None
@@ -0,0 +1,123 @@
+#
+# Zip writer that compresses files on a background thread while the caller
+# keeps producing the next ones.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from util import trace
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_METHODS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+}
+# Not available in the zipfile module of every Python version
+for name, attribute in [('bzip2', 'ZIP_BZIP2'), ('lzma', 'ZIP_LZMA'), ('zstd', 'ZIP_ZSTANDARD')]:
+    if hasattr(zipfile, attribute):
+        COMPRESSION_METHODS[name] = getattr(zipfile, attribute)
+
+MANIFEST_NAME = 'manifest.sha256'
+
+_CHUNK_SIZE = 1024 * 1024
+
+class BackgroundZipWriter(object):
+    """
+    Adds files to a zip file from a background thread, in the order add()
+    was called. Optionally adds a manifest with the SHA-256 checksum of every
+    file, in the format of sha256sum.
+    """
+
+    def __init__(self, filename, compression='deflate', compression_level=None, manifest=False):
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError('Unsupported compression {}, use one of {}'.format(
+                compression, ', '.join(sorted(COMPRESSION_METHODS))))
+
+        method = COMPRESSION_METHODS[compression]
+        try:
+            self.zip_file = zipfile.ZipFile(filename, 'w', method, compresslevel=compression_level)
+        except TypeError:
+            if compression_level is not None:
+                logger.warning('Compression levels are not supported by this Python version')
+            self.zip_file = zipfile.ZipFile(filename, 'w', method)
+
+        self.checksums = [] if manifest else None
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='BackgroundZipWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def add(self, filename, arcname):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((filename, arcname))
+
+    def close(self):
+        self._queue.put(None)
+        with trace.span('zip wait', 'zip'):
+            self._thread.join()
+        try:
+            if self._error is None and self.checksums is not None:
+                self.zip_file.writestr(MANIFEST_NAME, ''.join(
+                    '{}  {}\n'.format(checksum, arcname) for arcname, checksum in self.checksums))
+        finally:
+            self.zip_file.close()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # Drain the queue so close() doesn't block
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.exception('Failed to add %s to zip file', item[0])
+                self._error = e
+
+    def _write(self, filename, arcname):
+        with trace.span('zip add', 'zip', file=os.path.basename(filename)):
+            self._write_file(filename, arcname)
+
+    def _write_file(self, filename, arcname):
+        self.zip_file.write(filename, arcname)
+        if self.checksums is not None:
+            # The file was just read, so this comes from the page cache
+            digest = hashlib.sha256()
+            with open(filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            self.checksums.append((arcname, digest.hexdigest()))
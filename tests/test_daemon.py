@@ -0,0 +1,176 @@
+#
+# Tests of the automation daemon without display, on its worker pool but
+# without the socket server.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(tests_dir)
+test_projects_dir = os.path.join(repo_root, 'test-projects')
+
+sys.path.append(os.path.join(repo_root, 'src'))
+
+from jobs import daemon
+from jobs import tasks as job_tasks
+
+# Seconds to wait for an event
+TIMEOUT = 30
+
+def forks():
+    # Workers only see what the test changed in the modules when they are forked
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    return get_start_method is None or get_start_method() == 'fork'
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+def hang(*args, **kwargs):
+    time.sleep(TIMEOUT * 2)
+
+class AutomationDaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.check_interval = daemon.WORKER_CHECK_INTERVAL
+        daemon.WORKER_CHECK_INTERVAL = 0.1
+        self.daemon = None
+
+    def tearDown(self):
+        if self.daemon is not None:
+            self.daemon.close()
+        daemon.WORKER_CHECK_INTERVAL = self.check_interval
+        shutil.rmtree(self.output_dir)
+
+    def start(self):
+        self.daemon = daemon.AutomationDaemon(self.output_dir, jobs=1, display=False)
+        return self.daemon
+
+    def submit(self, tasks=('bom',), **request):
+        request.setdefault('project', os.path.join(test_projects_dir, 'good-project'))
+        request['tasks'] = list(tasks)
+        return self.daemon.submit(request)
+
+    def events(self, events):
+        """
+        The events of a job up to and including the final one.
+        """
+        received = []
+        while not received or received[-1]['event'] not in daemon.FINAL_EVENTS:
+            received.append(events.get(timeout=TIMEOUT))
+        return received
+
+    def wait_for_status(self, queued, running):
+        deadline = time.time() + TIMEOUT
+        while time.time() < deadline:
+            status = self.daemon.status()
+            if (status['queued'], status['running']) == (queued, running):
+                return
+            time.sleep(0.01)
+        self.fail('Status is {}'.format(status))
+
+    def test_invalid_requests(self):
+        self.start()
+        for request, message in [
+                ({'project': None}, 'is not a single KiCad project'),
+                ({'project': self.output_dir}, 'is not a single KiCad project'),
+                ({'tasks': ['plot_svg']}, 'Unknown tasks plot_svg'),
+                ({'tasks': ['bom', 'run_erc']}, 'without display'),
+                ({'tasks': None}, 'without display'),
+                ({'options': {'verbose': True}}, 'Unknown options verbose')]:
+            request.setdefault('project', os.path.join(test_projects_dir, 'good-project'))
+            request.setdefault('tasks', ['bom'])
+            with self.assertRaises(ValueError) as context:
+                self.daemon.submit(request)
+            self.assertIn(message, str(context.exception))
+        self.assertEqual(self.daemon.status(), {'event': 'status', 'workers': 1, 'display': False,
+            'queued': 0, 'running': 0})
+
+    def test_job_events(self):
+        self.start()
+        output_dir = os.path.join(self.output_dir, 'job')
+        job_id, events = self.submit(output_dir=output_dir)
+        received = self.events(events)
+        self.assertEqual([event['event'] for event in received], ['queued', 'started', 'result', 'finished'])
+        self.assertTrue(all(event['job'] == job_id for event in received))
+
+        queued, started, result, finished = received
+        self.assertEqual((queued['project'], queued['tasks'], queued['output_dir'], queued['position']),
+            ('good-project', ['bom'], output_dir, 0))
+        self.assertNotEqual(started['worker'], os.getpid())
+        self.assertEqual((result['task'], result['status']), ('bom', 'passed'))
+        self.assertEqual(result['outputs'], [os.path.join(output_dir, 'good-project-bom.csv')])
+        self.assertEqual(finished['failures'], 0)
+        self.assertEqual([r['task'] for r in finished['results']], ['bom'])
+        self.wait_for_status(0, 0)
+
+    def test_default_output_dir(self):
+        self.start()
+        job_id, events = self.submit()
+        self.assertEqual(self.events(events)[0]['output_dir'],
+            os.path.join(self.output_dir, '{}-good-project'.format(job_id)))
+
+    def test_dead_worker(self):
+        self.start()
+        # The events a job gets from a worker that dies right after starting it
+        with self.daemon._lock:
+            self.daemon._queued.add(100)
+            self.daemon._listeners[100] = events = daemon.queue.Queue()
+        worker = dead_pid()
+        self.daemon._events.put((100, {'event': 'started', 'worker': worker}))
+
+        self.assertEqual(self.events(events), [
+            {'event': 'started', 'job': 100, 'worker': worker},
+            {'event': 'error', 'job': 100, 'message': 'Worker {} died'.format(worker)}])
+        self.wait_for_status(0, 0)
+
+    @unittest.skipUnless(forks(), 'the workers are not forked')
+    def test_killed_worker(self):
+        run_project_tasks = job_tasks.run_project_tasks
+        job_tasks.run_project_tasks = hang
+        try:
+            self.start()
+        finally:
+            job_tasks.run_project_tasks = run_project_tasks
+
+        _, events = self.submit()
+        self.assertEqual(events.get(timeout=TIMEOUT)['event'], 'queued')
+        started = events.get(timeout=TIMEOUT)
+        self.assertEqual(started['event'], 'started')
+        self.wait_for_status(0, 1)
+        # Crash in the job, like pcbnew would, not while sending an event
+        with self.daemon._events._lock:
+            os.kill(started['worker'], signal.SIGKILL)
+
+        error = events.get(timeout=TIMEOUT)
+        self.assertEqual(error['event'], 'error')
+        self.assertEqual(error['message'], 'Worker {} died'.format(started['worker']))
+        self.wait_for_status(0, 0)
+
+        # The pool replaced the worker
+        self.assertEqual(self.events(self.submit()[1])[-1]['event'], 'finished')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#
+# Tests of the DRC report parser and of parse_drc on DRC reports of the test
+# projects.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(tests_dir, 'data')
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from pcbnew_automation.drc_report import (DrcReport, DrcReportError, SECTION_DRC, SECTION_UNCONNECTED,
+    fingerprint)
+from pcbnew_automation.run_drc import parse_drc
+from util.baseline import Baseline, BaselineDiff
+
+def parse(name):
+    with io.open(os.path.join(data_dir, name + '.rpt'), encoding='utf-8') as f:
+        report = DrcReport(f, name)
+        violations = list(report)
+    return report, violations
+
+class DrcReportTest(unittest.TestCase):
+    def test_good_project(self):
+        report, violations = parse('good-project')
+        self.assertEqual(violations, [])
+        self.assertEqual(report.error_count(), 0)
+
+    def test_warning_project(self):
+        report, violations = parse('warning-project')
+        self.assertEqual((report.drc_errors, report.unconnected_pads), (0, 2))
+        self.assertEqual(report.error_count(), 2)
+        self.assertEqual(report.error_count(ignore_unconnected=True), 0)
+        self.assertEqual([violation.section for violation in violations], [SECTION_UNCONNECTED] * 2)
+        self.assertEqual(violations[0].layer, 'All copper layers')
+
+    def test_fail_project(self):
+        report, violations = parse('fail-project')
+        self.assertEqual((report.drc_errors, report.unconnected_pads, report.footprint_errors), (2, 1, 0))
+        self.assertEqual(report.summary()['rules'], {'drc:3': 1, 'drc:45': 1, 'unconnected:1': 1})
+
+        violation = violations[0]
+        self.assertEqual(violation.section, SECTION_DRC)
+        self.assertEqual(violation.rule, 3)
+        self.assertEqual(violation.message, 'Track too close to pad')
+        self.assertEqual(violation.layer, 'F.Cu')
+        self.assertEqual([item.position for item in violation.items], [(146.1, 109.2), (147.362, 108.4)])
+        self.assertEqual(violation.items[1].description, 'Pad 2 of D1 on F.Cu and others')
+
+    def test_fingerprint_without_position_and_length(self):
+        _, violations = parse('fail-project')
+        violation = violations[0]
+        moved = violation._replace(items=[
+            item._replace(position=(0.0, 0.0), description=item.description.replace('2.175', '3.000'))
+            for item in violation.items])
+        self.assertEqual(fingerprint(moved), fingerprint(violation))
+
+    def test_empty_report(self):
+        with self.assertRaises(DrcReportError):
+            list(DrcReport(io.StringIO(u'')))
+
+class ParseDrcTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.baseline_file = os.path.join(self.output_dir, 'drc_baseline.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def parse_drc(self, name, ignore_unconnected=False, baseline_diff=None):
+        drc_file = os.path.join(self.output_dir, name + '.rpt')
+        shutil.copy(os.path.join(data_dir, name + '.rpt'), drc_file)
+        return parse_drc(drc_file, ignore_unconnected, True, True, baseline_diff)
+
+    def read_reports(self):
+        junit = ET.parse(os.path.join(self.output_dir, 'junit.xml')).getroot()
+        with open(os.path.join(self.output_dir, 'drc.json')) as f:
+            return junit, json.load(f)
+
+    def test_fail_project(self):
+        result = self.parse_drc('fail-project')
+        self.assertEqual(result, {'drc_errors': 2, 'unconnected_pads': 1, 'footprint_errors': 0, 'violations': 3})
+        junit, report = self.read_reports()
+        self.assertEqual([(suite.get('name'), suite.get('failures')) for suite in junit.findall('testsuite')],
+            [('DRC drc', '2'), ('DRC unconnected', '1')])
+        self.assertEqual(len(report['violations']), 3)
+        self.assertEqual(report['violations'][0]['items'][0]['layer'], 'F.Cu')
+
+    def test_ignore_unconnected(self):
+        self.assertEqual(self.parse_drc('fail-project', ignore_unconnected=True)['violations'], 2)
+        junit, report = self.read_reports()
+        self.assertEqual([suite.get('name') for suite in junit.findall('testsuite')], ['DRC drc'])
+        self.assertEqual(len(report['violations']), 2)
+
+    def test_good_project(self):
+        self.assertEqual(self.parse_drc('good-project')['violations'], 0)
+        junit, report = self.read_reports()
+        self.assertEqual([suite.get('name') for suite in junit.findall('testsuite')], ['DRC'])
+        self.assertEqual(report['violations'], [])
+
+    def test_write_baseline_alone(self):
+        baseline_diff = BaselineDiff()
+        self.assertEqual(self.parse_drc('fail-project', baseline_diff=baseline_diff)['violations'], 3)
+        self.assertNotIn('baseline', self.read_reports()[1]['summary'])
+
+    def test_baseline(self):
+        baseline_diff = BaselineDiff()
+        self.parse_drc('warning-project', baseline_diff=baseline_diff)
+        baseline_diff.current.save(self.baseline_file)
+
+        # The unconnected pads of warning-project are known, its DRC errors are new
+        baseline_diff = BaselineDiff(Baseline.load(self.baseline_file))
+        self.assertEqual(self.parse_drc('fail-project', baseline_diff=baseline_diff)['violations'], 2)
+        self.assertEqual(len(baseline_diff.resolved()), 1)
+
+    def test_baseline_ignore_unconnected(self):
+        baseline_diff = BaselineDiff()
+        self.parse_drc('fail-project', ignore_unconnected=True, baseline_diff=baseline_diff)
+        baseline_diff.current.save(self.baseline_file)
+        # Ignored unconnected pads are not written to the baseline
+        self.assertEqual(len(Baseline.load(self.baseline_file)), 2)
+
+        # nor compared with it, so they don't show up as resolved
+        baseline_diff = BaselineDiff(Baseline.load(self.baseline_file))
+        self.assertEqual(self.parse_drc('fail-project', ignore_unconnected=True,
+            baseline_diff=baseline_diff)['violations'], 0)
+        self.assertEqual(baseline_diff.new, [])
+        self.assertEqual(baseline_diff.resolved(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#
+# Tests of the ERC baseline handling on reports of the test projects.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(tests_dir, 'data')
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from eeschema.schematic import eeschema_parse_erc
+from util.baseline import Baseline, BaselineDiff
+
+class ErcBaselineTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.erc_file = os.path.join(self.output_dir, 'warning-project.erc')
+        shutil.copy(os.path.join(data_dir, 'warning-project.erc'), self.erc_file)
+        self.baseline_file = os.path.join(self.output_dir, 'erc_baseline.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def write_baseline(self, warning_as_error=False):
+        baseline_diff = BaselineDiff()
+        errors = eeschema_parse_erc(self.erc_file, warning_as_error, generate_json=True,
+            baseline_diff=baseline_diff)
+        baseline_diff.current.save(self.baseline_file)
+        return errors
+
+    def test_write_baseline_alone(self):
+        # Writing a baseline does not make the warnings fail the ERC
+        self.assertEqual(self.write_baseline(), 0)
+        self.assertEqual(len(Baseline.load(self.baseline_file)), 2)
+        with open(os.path.join(self.output_dir, 'erc.json')) as f:
+            report = json.load(f)
+        self.assertEqual(len(report['violations']), 2)
+        self.assertNotIn('baseline', report['summary'])
+
+    def test_write_baseline_warnings_as_errors(self):
+        self.assertEqual(self.write_baseline(warning_as_error=True), 2)
+
+    def test_baseline(self):
+        self.write_baseline()
+        baseline_diff = BaselineDiff(Baseline.load(self.baseline_file))
+        self.assertEqual(eeschema_parse_erc(self.erc_file, True, generate_json=True,
+            baseline_diff=baseline_diff), 0)
+        with open(os.path.join(self.output_dir, 'erc.json')) as f:
+            report = json.load(f)
+        self.assertEqual(report['violations'], [])
+        self.assertEqual(report['summary']['baseline']['new'], 0)
+
+    def test_new_violations(self):
+        baseline_diff = BaselineDiff(Baseline())
+        self.assertEqual(eeschema_parse_erc(self.erc_file, baseline_diff=baseline_diff), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#
+# Tests of the pre-ERC checks on the schematics of the test projects.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import sys
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(tests_dir)
+test_projects_dir = os.path.join(repo_root, 'test-projects')
+
+sys.path.append(os.path.join(repo_root, 'src'))
+
+from eeschema import erc_precheck
+
+def precheck(name):
+    return erc_precheck.precheck(os.path.join(test_projects_dir, name, name + '.sch'))
+
+class PrecheckTest(unittest.TestCase):
+    def test_good_project(self):
+        self.assertEqual(precheck('good-project'), [])
+
+    def test_warning_project(self):
+        issues = precheck('warning-project')
+        self.assertEqual([(issue.error_type, issue.severity, issue.message) for issue in issues], [
+            (erc_precheck.ERCE_PIN_NOT_CONNECTED, erc_precheck.SEVERITY_WARNING,
+                'Pin 2 (Passive) of component R1 is unconnected.'),
+            (erc_precheck.ERCE_PIN_NOT_DRIVEN, erc_precheck.SEVERITY_WARNING,
+                'Pin 1 (Power input) of component #PWR01 is not driven.'),
+        ])
+
+    def test_fail_project(self):
+        issues = precheck('fail-project')
+        errors = [issue.message for issue in issues if issue.severity == erc_precheck.SEVERITY_ERROR]
+        self.assertEqual(errors, ['Duplicate reference U1 (unit 1)'])
+        self.assertEqual(len(issues), 7)
+
+if __name__ == '__main__':
+    unittest.main()
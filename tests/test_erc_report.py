@@ -0,0 +1,149 @@
+#
+# Tests of the ERC report parser and the junit XML and JSON report writers on
+# ERC reports of the test projects.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(tests_dir, 'data')
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from eeschema.erc_report import ErcReport, ErcReportError, fingerprint
+from eeschema.schematic import eeschema_parse_erc
+from util.report_writers import JunitXmlWriter, JsonReportWriter
+
+def parse(name):
+    with io.open(os.path.join(data_dir, name + '.erc'), encoding='utf-8') as f:
+        report = ErcReport(f, name)
+        violations = list(report)
+    return report, violations
+
+class ErcReportTest(unittest.TestCase):
+    def test_good_project(self):
+        report, violations = parse('good-project')
+        self.assertEqual(violations, [])
+        self.assertEqual(report.summary(), {'messages': 0, 'errors': 0, 'warnings': 0, 'sheets': ['/'],
+            'rules': {}})
+
+    def test_warning_project(self):
+        report, violations = parse('warning-project')
+        self.assertEqual((report.errors, report.warnings), (0, 2))
+        self.assertEqual(report.error_count(), 0)
+        self.assertEqual(report.error_count(warning_as_error=True), 2)
+        self.assertEqual(report.rule_counts, {2: 1, 3: 1})
+
+        violation = violations[0]
+        self.assertEqual(violation.sheet, '/')
+        self.assertEqual(violation.rule, 2)
+        self.assertEqual(violation.message, 'Pin not connected (use a "no connection" flag to suppress this error)')
+        self.assertEqual(violation.position, (78.74, 90.8))
+        self.assertEqual(violation.item, 'Pin 2 (Passive) of component R1 is unconnected.')
+
+    def test_fail_project(self):
+        report, violations = parse('fail-project')
+        self.assertEqual((report.messages, report.errors, report.warnings), (7, 1, 6))
+        self.assertEqual(len(violations), 7)
+        self.assertEqual(report.rule_counts, {2: 5, 3: 1, 4: 1})
+        # Only the first location of a violation with two is used
+        self.assertEqual(violations[-1].position, (69.22, 49.53))
+
+    def test_fingerprint_without_position(self):
+        _, violations = parse('warning-project')
+        moved = violations[0]._replace(position=(0.0, 0.0),
+            location='@(0.00 mm, 0.00 mm): ' + violations[0].item)
+        self.assertEqual(fingerprint(moved), fingerprint(violations[0]))
+        self.assertNotEqual(fingerprint(violations[1]), fingerprint(violations[0]))
+
+    def test_empty_report(self):
+        with self.assertRaises(ErcReportError):
+            list(ErcReport(io.StringIO(u'')))
+
+    def test_missing_summary(self):
+        with self.assertRaises(ErcReportError):
+            list(ErcReport(io.StringIO(u'ERC report\n\n***** Sheet /\n')))
+
+class ReportWritersTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_junit_xml(self):
+        filename = os.path.join(self.output_dir, 'junit.xml')
+        with JunitXmlWriter(filename) as junit:
+            junit.start_suite('first')
+            junit.add_case('passed', 'a')
+            junit.add_case('failed', 'a', failure_message='<bad> & "quoted"', failure_type='2')
+            junit.start_suite('empty')
+        suites = ET.parse(filename).getroot().findall('testsuite')
+        self.assertEqual([(suite.get('name'), suite.get('tests'), suite.get('failures')) for suite in suites],
+            [('first', '2', '1'), ('empty', '0', '0')])
+        failure = suites[0].findall('testcase')[1].find('failure')
+        self.assertEqual(failure.get('message'), '<bad> & "quoted"')
+        self.assertEqual(failure.get('type'), '2')
+
+    def test_json(self):
+        filename = os.path.join(self.output_dir, 'erc.json')
+        writer = JsonReportWriter(filename)
+        writer.add({'rule': 2})
+        writer.add({'rule': 3})
+        writer.close({'errors': 0})
+        with open(filename) as f:
+            self.assertEqual(json.load(f), {'violations': [{'rule': 2}, {'rule': 3}], 'summary': {'errors': 0}})
+
+    def test_empty_json(self):
+        filename = os.path.join(self.output_dir, 'erc.json')
+        JsonReportWriter(filename).close()
+        with open(filename) as f:
+            self.assertEqual(json.load(f), {'violations': [], 'summary': {}})
+
+    def parse_erc(self, name, warning_as_error=False):
+        erc_file = os.path.join(self.output_dir, name + '.erc')
+        shutil.copy(os.path.join(data_dir, name + '.erc'), erc_file)
+        errors = eeschema_parse_erc(erc_file, warning_as_error, generate_junit_xml=True, generate_json=True)
+        junit = ET.parse(os.path.join(self.output_dir, 'junit.xml')).getroot()
+        with open(os.path.join(self.output_dir, 'erc.json')) as f:
+            return errors, junit, json.load(f)
+
+    def test_parse_fail_project(self):
+        errors, junit, report = self.parse_erc('fail-project')
+        self.assertEqual(errors, 1)
+        suites = junit.findall('testsuite')
+        self.assertEqual([(suite.get('name'), suite.get('failures')) for suite in suites], [('ERC /', '7')])
+        self.assertEqual(len(report['violations']), 7)
+        self.assertEqual(report['violations'][0]['rule'], 2)
+        self.assertEqual(report['summary']['warnings'], 6)
+
+    def test_parse_good_project(self):
+        errors, junit, report = self.parse_erc('good-project', warning_as_error=True)
+        self.assertEqual(errors, 0)
+        # Sheets without violations still get a test suite
+        suites = junit.findall('testsuite')
+        self.assertEqual([(suite.get('name'), suite.get('tests')) for suite in suites], [('ERC /', '0')])
+        self.assertEqual(report['violations'], [])
+
+if __name__ == '__main__':
+    unittest.main()
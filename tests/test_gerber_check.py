@@ -0,0 +1,246 @@
+#
+# Tests of the Gerber and Excellon checks on small plots written to a
+# temporary directory.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from pcbnew_automation import gerber_check
+
+# A line, a flash, a region and a full circle, in mm with 6 decimals
+COPPER = '''G04 Copper layer*
+%FSLAX46Y46*%
+%MOMM*%
+%TF.FileFunction,Copper,L1,Top*%
+%ADD10C,0.250000*%
+%ADD11R,1.000000X2.000000*%
+D10*
+X10000000Y10000000D02*
+X20000000Y10000000D01*
+D11*
+X15000000Y15000000D03*
+G36*
+X12000000Y12000000D02*
+X13000000Y12000000D01*
+X13000000Y13000000D01*
+X12000000Y12000000D01*
+G37*
+D10*
+G75*
+X20000000Y20000000D02*
+G03X20000000Y20000000I-5000000J0D01*
+M02*
+'''
+
+# The same kind of flash in inch with 4 decimals
+COPPER_INCH = '''%FSLAX24Y24*%
+%MOIN*%
+%TF.FileFunction,Copper,L2,Bot*%
+%ADD10C,0.1000*%
+D10*
+X10000Y20000D03*
+M02*
+'''
+
+COPPER_EMPTY = '''%FSLAX46Y46*%
+%MOMM*%
+%TF.FileFunction,Copper,L2,Bot*%
+M02*
+'''
+
+OUTLINE = '''%FSLAX46Y46*%
+%MOMM*%
+%TF.FileFunction,Profile,NP*%
+%ADD10C,0.050000*%
+D10*
+X0Y0D02*
+X30000000Y0D01*
+X30000000Y30000000D01*
+X0Y30000000D01*
+X0Y0D01*
+M02*
+'''
+
+OPEN_OUTLINE = '''%FSLAX46Y46*%
+%MOMM*%
+%TF.FileFunction,Profile,NP*%
+%ADD10C,0.050000*%
+D10*
+X0Y0D02*
+X30000000Y0D01*
+X30000000Y30000000D01*
+X0Y30000000D01*
+M02*
+'''
+
+# The outline plotted on a copper layer, without anything else
+COPPER_OUTLINE_ONLY = OUTLINE.replace('Profile,NP', 'Copper,L2,Bot')
+
+# A flash at (40, 40), outside of OUTLINE
+COPPER_OUTSIDE = '''%FSLAX46Y46*%
+%MOMM*%
+%TF.FileFunction,Copper,L1,Top*%
+%ADD10C,1.000000*%
+D10*
+X15000000Y15000000D03*
+X40000000Y40000000D03*
+M02*
+'''
+
+# Two holes and a slot
+DRILL = '''M48
+; DRILL file {KiCad 5.1.2} date Thu 04 Apr 2019 12:00:00 CEST
+; FORMAT={-:-/ absolute / metric / decimal}
+FMAT,2
+METRIC
+T1C0.800
+T2C1.000
+%
+G90
+G05
+T1
+X10.0Y10.0
+X20.0Y10.0
+T2
+X15.0Y20.0G85X18.0Y20.0
+T0
+M30
+'''
+
+DRILL_INCH = '''M48
+INCH
+T1C0.0400
+%
+G90
+G05
+T1
+X1.0Y1.0
+T0
+M30
+'''
+
+def mm(bbox):
+    return [round(value / gerber_check.NM_PER_MM, 4) for value in bbox]
+
+class GerberFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def check(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content.encode('ascii'))
+        return gerber_check.check_file(path)
+
+class CheckFileTest(GerberFilesTest):
+    def test_gerber(self):
+        report = self.check('board-F_Cu.gbr', COPPER)
+        self.assertEqual(report.kind, gerber_check.GERBER)
+        self.assertEqual(report.function, gerber_check.FUNCTION_COPPER)
+        self.assertEqual(report.counts, {'lines': 1, 'arcs': 1, 'flashes': 1, 'regions': 1})
+        self.assertEqual(report.primitives(), 4)
+        # The circle of radius 5 around (15, 20) and the rectangle flash
+        # reach furthest, extended with half of their apertures
+        self.assertEqual(mm(report.bbox), [9.875, 9.875, 20.125, 25.125])
+        self.assertEqual(report.to_dict()['bbox'], [9.875, 9.875, 20.125, 25.125])
+
+    def test_inch(self):
+        report = self.check('board-B_Cu.gbr', COPPER_INCH)
+        self.assertEqual(report.counts['flashes'], 1)
+        self.assertEqual(mm(report.bbox), [24.13, 49.53, 26.67, 52.07])
+
+    def test_checksum_independent_of_format(self):
+        mm_report = self.check('mm.gbr', COPPER_INCH.replace('%FSLAX24Y24*%\n%MOIN*%',
+            '%FSLAX46Y46*%\n%MOMM*%').replace('0.1000', '2.540000').replace('X10000Y20000', 'X25400000Y50800000'))
+        inch_report = self.check('inch.gbr', COPPER_INCH)
+        self.assertEqual(mm_report.checksum, inch_report.checksum)
+        self.assertNotEqual(self.check('copper.gbr', COPPER).checksum, inch_report.checksum)
+
+    def test_function_from_name(self):
+        without_attributes = COPPER_INCH.replace('%TF.FileFunction,Copper,L2,Bot*%\n', '')
+        self.assertEqual(self.check('board-B_Cu.gbl', without_attributes).function, gerber_check.FUNCTION_COPPER)
+        self.assertEqual(self.check('board-Edge_Cuts.gm1', without_attributes).function,
+            gerber_check.FUNCTION_PROFILE)
+        self.assertIsNone(self.check('board-F_SilkS.gto', without_attributes).function)
+
+    def test_excellon(self):
+        report = self.check('board.drl', DRILL)
+        self.assertEqual(report.kind, gerber_check.EXCELLON)
+        self.assertEqual(report.function, gerber_check.FUNCTION_DRILL)
+        self.assertEqual(report.counts, {'tools': 2, 'hits': 2, 'slots': 1})
+        self.assertEqual(report.primitives(), 3)
+        # The 1 mm slot ends at (18, 20)
+        self.assertEqual(mm(report.bbox), [9.6, 9.6, 20.4, 20.5])
+
+    def test_excellon_inch(self):
+        report = self.check('board.drl', DRILL_INCH)
+        self.assertEqual(report.counts, {'tools': 1, 'hits': 1, 'slots': 0})
+        self.assertEqual(mm(report.bbox), [24.892, 24.892, 25.908, 25.908])
+
+class ValidateTest(GerberFilesTest):
+    def test_valid(self):
+        reports = [self.check('board-F_Cu.gbr', COPPER), self.check('board-Edge_Cuts.gm1', OUTLINE),
+            self.check('board.drl', DRILL)]
+        self.assertTrue(reports[1].is_closed())
+        self.assertEqual(gerber_check.validate(reports), [])
+
+    def test_outside_outline(self):
+        reports = [self.check('board-F_Cu.gbr', COPPER_OUTSIDE), self.check('board-Edge_Cuts.gm1', OUTLINE)]
+        self.assertEqual(gerber_check.validate(reports),
+            ['board-F_Cu.gbr extends outside the board outline board-Edge_Cuts.gm1'])
+
+    def test_tolerance(self):
+        # The outline reaches 30.025 mm with its aperture, the flash 30.03 mm
+        copper = COPPER_OUTSIDE.replace('1.000000', '0.020000').replace('X40000000Y40000000', 'X30020000Y15000000')
+        reports = [self.check('board-F_Cu.gbr', copper), self.check('board-Edge_Cuts.gm1', OUTLINE)]
+        self.assertEqual(gerber_check.validate(reports), [])
+        self.assertEqual(gerber_check.validate(reports, tolerance=0),
+            ['board-F_Cu.gbr extends outside the board outline board-Edge_Cuts.gm1'])
+
+    def test_open_outline(self):
+        reports = [self.check('board-F_Cu.gbr', COPPER), self.check('board-Edge_Cuts.gm1', OPEN_OUTLINE)]
+        self.assertFalse(reports[1].is_closed())
+        self.assertEqual(gerber_check.validate(reports),
+            ['The board outline board-Edge_Cuts.gm1 is not closed'])
+
+    def test_empty_copper(self):
+        reports = [self.check('board-F_Cu.gbr', COPPER), self.check('board-B_Cu.gbr', COPPER_EMPTY)]
+        self.assertEqual(gerber_check.validate(reports), ['board-B_Cu.gbr is an empty copper layer'])
+
+    def test_outline_is_not_copper(self):
+        reports = [self.check('board-B_Cu.gbr', COPPER_OUTLINE_ONLY), self.check('board-Edge_Cuts.gm1', OUTLINE)]
+        self.assertEqual(gerber_check.validate(reports), ['board-B_Cu.gbr is an empty copper layer'])
+
+    def test_allow_empty(self):
+        reports = [self.check('board-F_Cu.gbr', COPPER), self.check('board-B_Cu.gbr', COPPER_EMPTY),
+            self.check('board-In1_Cu.gbr', COPPER_EMPTY)]
+        self.assertEqual(gerber_check.validate(reports, allow_empty=['board-B_Cu.gbr']),
+            ['board-In1_Cu.gbr is an empty copper layer'])
+        self.assertEqual(gerber_check.validate(reports, allow_empty=['board-B_Cu.gbr', 'board-In1_Cu.gbr']), [])
+
+if __name__ == '__main__':
+    unittest.main()
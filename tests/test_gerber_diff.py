@@ -0,0 +1,182 @@
+#
+# Tests of the rasterizing Gerber diff on small layers written to a temporary
+# directory.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from pcbnew_automation import gerber_check
+from pcbnew_automation import gerber_diff
+
+# Two flashes of a 1.7 mm round aperture, the first one at x
+FLASHES = '''%FSLAX46Y46*%
+%MOMM*%
+%TF.FileFunction,Copper,L1,Top*%
+%ADD10C,1.700000*%
+D10*
+X{}Y10000000D03*
+X20000000Y20000000D03*
+M02*
+'''
+
+FLASH_AREA = math.pi * 0.85 ** 2
+
+# A 2 by 1 mm rectangle flash and a 4 mm long track of 0.5 mm
+RECTANGLE_AND_TRACK = '''%FSLAX46Y46*%
+%MOMM*%
+%ADD10R,2.000000X1.000000*%
+%ADD11C,0.500000*%
+D10*
+X0Y0D03*
+D11*
+X0Y5000000D02*
+X4000000Y5000000D01*
+M02*
+'''
+
+def square(x0, y0, x1, y1):
+    """
+    The edges of a counterclockwise rectangle, as start and end arrays.
+    """
+    xs = np.array([x0, x1, x1, x0], float)
+    ys = np.array([y0, y0, y1, y1], float)
+    return xs, ys, np.roll(xs, -1), np.roll(ys, -1)
+
+class FillEdgesTest(unittest.TestCase):
+    def test_rectangle(self):
+        # Pixel centers from (2.5, 2.5) to (5.5, 4.5) are inside
+        bitmap = gerber_diff._fill_edges(*square(2, 2, 6, 5), first_row=0, rows=8, width=10)
+        self.assertEqual(bitmap.shape, (8, 10))
+        expected = np.zeros((8, 10), bool)
+        expected[2:5, 2:6] = True
+        self.assertTrue(np.array_equal(bitmap, expected))
+
+    def test_orientation(self):
+        x0, y0, x1, y1 = square(2, 2, 6, 5)
+        clockwise = gerber_diff._fill_edges(x1, y1, x0, y0, first_row=0, rows=8, width=10)
+        self.assertTrue(np.array_equal(clockwise,
+            gerber_diff._fill_edges(x0, y0, x1, y1, first_row=0, rows=8, width=10)))
+
+    def test_nonzero_winding(self):
+        # A square inside another one with the same orientation stays filled
+        edges = [np.concatenate(pair) for pair in zip(square(1, 1, 9, 9), square(3, 3, 6, 6))]
+        self.assertEqual(np.count_nonzero(gerber_diff._fill_edges(*edges, first_row=0, rows=10, width=10)), 64)
+
+    def test_bands(self):
+        edges = square(1.2, 0.7, 7.9, 6.3)
+        whole = gerber_diff._fill_edges(*edges, first_row=0, rows=8, width=10)
+        bands = np.concatenate([gerber_diff._fill_edges(*edges, first_row=first_row, rows=rows, width=10)
+            for first_row, rows in [(0, 3), (3, 3), (6, 2)]])
+        self.assertTrue(np.array_equal(bands, whole))
+
+class LayerRasterTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_areas(self):
+        filename = os.path.join(self.temp_dir, 'layer.gbr')
+        with open(filename, 'w') as f:
+            f.write(RECTANGLE_AND_TRACK)
+        geometry = gerber_check.GerberGeometry()
+        report = gerber_check.check_gerber(filename, geometry)
+        self.assertEqual(len(geometry), 2)
+
+        bitmaps = []
+        for band_height in [5, gerber_diff.BAND_HEIGHT]:
+            grid = gerber_diff.Grid(report.bbox, dpi=600, band_height=band_height)
+            raster = gerber_diff.LayerRaster(geometry, grid)
+            bitmaps.append(np.concatenate([raster.band(band) for band in range(grid.bands)]))
+            self.assertEqual(bitmaps[-1].shape, (grid.height, grid.width))
+        self.assertTrue(np.array_equal(bitmaps[0], bitmaps[1]))
+
+        # The rectangle, and the track with its round ends
+        area = np.count_nonzero(bitmaps[0]) * grid.pixel_area()
+        self.assertAlmostEqual(area, 2 + 4 * 0.5 + math.pi * 0.25 ** 2, delta=0.1)
+
+class DiffFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, x):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(FLASHES.format(x))
+        return path
+
+    def test_identical(self):
+        old_file = self.write('old.gbr', 10000000)
+        new_file = self.write('new.gbr', 10000000)
+        image_file = os.path.join(self.temp_dir, 'diff.png')
+        diff = gerber_diff.diff_files(old_file, new_file, image_file)
+        self.assertFalse(diff['changed'])
+        self.assertEqual((diff['added_mm2'], diff['removed_mm2'], diff['changed_bbox']), (0.0, 0.0, None))
+        self.assertIsNone(diff['image'])
+        self.assertFalse(os.path.exists(image_file))
+
+    def test_moved_flash(self):
+        old_file = self.write('old.gbr', 10000000)
+        new_file = self.write('new.gbr', 11700000)
+        image_file = os.path.join(self.temp_dir, 'diff.png')
+        diff = gerber_diff.diff_files(old_file, new_file, image_file)
+        self.assertTrue(diff['changed'])
+        # Moved by its diameter, the flash does not overlap itself
+        self.assertAlmostEqual(diff['added_mm2'], FLASH_AREA, delta=0.1)
+        self.assertAlmostEqual(diff['removed_mm2'], FLASH_AREA, delta=0.1)
+        for value, expected in zip(diff['changed_bbox'], [9.15, 9.15, 12.55, 10.85]):
+            self.assertAlmostEqual(value, expected, delta=0.1)
+
+        self.assertEqual(diff['image'], 'diff.png')
+        with open(image_file, 'rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+    def test_band_height(self):
+        old_file = self.write('old.gbr', 10000000)
+        new_file = self.write('new.gbr', 11700000)
+        self.assertEqual(gerber_diff.diff_files(old_file, new_file, band_height=3),
+            gerber_diff.diff_files(old_file, new_file, band_height=256))
+
+    def test_missing_layer(self):
+        new_file = self.write('new.gbr', 10000000)
+        diff = gerber_diff.diff_files(None, new_file)
+        self.assertIsNone(diff['old'])
+        self.assertTrue(diff['changed'])
+        self.assertAlmostEqual(diff['added_mm2'], 2 * FLASH_AREA, delta=0.2)
+        self.assertEqual(diff['removed_mm2'], 0.0)
+
+        diff = gerber_diff.diff_files(new_file, None)
+        self.assertIsNone(diff['new'])
+        self.assertEqual(diff['added_mm2'], 0.0)
+        self.assertAlmostEqual(diff['removed_mm2'], 2 * FLASH_AREA, delta=0.2)
+
+if __name__ == '__main__':
+    unittest.main()
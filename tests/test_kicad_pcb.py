@@ -0,0 +1,100 @@
+#
+# Tests of the .kicad_pcb parser on the layouts of the test projects.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import io
+import os
+import sys
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(tests_dir)
+test_projects_dir = os.path.join(repo_root, 'test-projects')
+
+sys.path.append(os.path.join(repo_root, 'src'))
+
+from pcbnew_automation import kicad_pcb
+
+def board_file(name):
+    return os.path.join(test_projects_dir, name, name + '.kicad_pcb')
+
+class TokenizeTest(unittest.TestCase):
+    def test_nested_lists(self):
+        tokens = kicad_pcb.tokenize(io.StringIO(u'(a (b "c d") e)'))
+        self.assertEqual(kicad_pcb.read_list(tokens), ['a', ['b', 'c d'], 'e'])
+
+    def test_escaped_quotes(self):
+        tokens = kicad_pcb.tokenize(io.StringIO(u'(text "say \\"hi\\"")'))
+        self.assertEqual(kicad_pcb.read_list(tokens), ['text', 'say "hi"'])
+
+    def test_not_a_layout(self):
+        with self.assertRaises(kicad_pcb.ParseError):
+            kicad_pcb.load(os.path.join(test_projects_dir, 'good-project', 'good-project.pro'))
+
+class TestProjectBoardsTest(unittest.TestCase):
+    def test_good_project(self):
+        board = kicad_pcb.load(board_file('good-project'))
+        self.assertEqual(board.name, 'good-project')
+        self.assertEqual(board.version, '20171130')
+        self.assertEqual((len(board.nets), len(board.footprints), len(board.tracks), len(board.vias),
+            len(board.zones), board.drawing_count), (4, 2, 2, 0, 1, 4))
+        self.assertEqual(sorted(footprint.reference for footprint in board.footprints), ['D1', 'R1'])
+
+        track = board.tracks[0]
+        self.assertEqual(track.start, (146.5, 108.0375))
+        self.assertEqual(track.end, (146.8625, 108.4))
+        self.assertEqual(track.width, 0.25)
+        self.assertEqual(track.layer, kicad_pcb.F_Cu)
+        self.assertEqual(track.net, 3)
+
+        zone = board.zones[0]
+        self.assertEqual(zone.net_name, 'GND')
+        self.assertEqual(zone.layers, [kicad_pcb.F_Cu])
+        self.assertEqual(len(zone.outline), 8)
+        self.assertEqual(len(zone.filled_polygons), 1)
+
+    def test_layers(self):
+        board = kicad_pcb.load(board_file('good-project'))
+        self.assertEqual(board.layer_id('Edge.Cuts'), kicad_pcb.Edge_Cuts)
+        self.assertEqual(board.layer_name(kicad_pcb.B_Cu), 'B.Cu')
+        self.assertEqual(len(board.enabled_layers()), 20)
+        self.assertEqual([board.layer_name(layer_id) for layer_id in board.plot_enabled_layers()],
+            ['F.Cu', 'B.Cu', 'F.SilkS', 'B.SilkS'])
+
+    def test_through_hole_pads(self):
+        for name in ['warning-project', 'fail-project']:
+            board = kicad_pcb.load(board_file(name))
+            pads = [pad for footprint in board.footprints for pad in footprint.pads if pad.type == 'thru_hole']
+            self.assertEqual(len(pads), 2)
+            self.assertEqual(pads[0].drill, 1.0)
+            self.assertEqual(pads[0].layers, ('*.Cu', '*.Mask'))
+
+    def test_counts(self):
+        for name, tracks, footprints in [('warning-project', 3, 3), ('fail-project', 4, 3)]:
+            board = kicad_pcb.load(board_file(name))
+            self.assertEqual((len(board.tracks), len(board.footprints), len(board.nets)), (tracks, footprints, 5))
+
+    def test_copper_layers_with_items(self):
+        # Only SMD footprints, tracks and a zone on the front
+        self.assertEqual(kicad_pcb.load(board_file('good-project')).copper_layers_with_items(),
+            [kicad_pcb.F_Cu])
+        # Through hole pads are on all copper layers
+        for name in ['warning-project', 'fail-project']:
+            self.assertEqual(kicad_pcb.load(board_file(name)).copper_layers_with_items(),
+                [kicad_pcb.F_Cu, kicad_pcb.B_Cu])
+
+if __name__ == '__main__':
+    unittest.main()
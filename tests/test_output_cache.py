@@ -0,0 +1,106 @@
+#
+# Tests of the output cache in a temporary directory.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from util.output_cache import OutputCache
+
+class OutputCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.output_dir = os.path.join(self.temp_dir, 'output')
+        self.cache = OutputCache(self.cache_dir, max_size=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def store(self, name, size=100):
+        path = self.write(name + '.pdf', name[0] * size)
+        key = self.cache.key([path], name=name)
+        self.cache.store(key, [path])
+        return key
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.cache_dir) if not name.startswith('.'))
+
+    def test_key(self):
+        board = self.write('board.kicad_pcb', '(kicad_pcb)')
+        key = self.cache.key([board], file_format='pdf', layers=['F.Cu'])
+        self.assertEqual(self.cache.key([board], layers=['F.Cu'], file_format='pdf'), key)
+        self.assertNotEqual(self.cache.key([board], file_format='svg', layers=['F.Cu']), key)
+        self.write('board.kicad_pcb', '(kicad_pcb (version 20171130))')
+        self.assertNotEqual(self.cache.key([board], file_format='pdf', layers=['F.Cu']), key)
+
+    def test_store_and_fetch(self):
+        pdf = self.write('board.pdf', 'pdf')
+        report = self.write('board.json', '{}')
+        self.cache.store('key', [pdf, report])
+        self.assertEqual(self.cache.fetch('key', self.output_dir),
+            [os.path.join(self.output_dir, 'board.pdf'), os.path.join(self.output_dir, 'board.json')])
+        with open(os.path.join(self.output_dir, 'board.pdf')) as f:
+            self.assertEqual(f.read(), 'pdf')
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.fetch('unknown', self.output_dir))
+
+    def test_lru_eviction(self):
+        first = self.store('first')
+        second = self.store('second')
+        # Make the order of use explicit, mtimes can be equal within a test
+        os.utime(os.path.join(self.cache_dir, first), (100, 100))
+        os.utime(os.path.join(self.cache_dir, second), (200, 200))
+        self.assertIsNotNone(self.cache.fetch(first, self.output_dir))
+
+        # A third entry does not fit in 250 bytes, second is used least recently
+        third = self.store('third')
+        self.assertEqual(self.entries(), sorted([first, third]))
+        self.assertIsNone(self.cache.fetch(second, self.output_dir))
+
+    def test_evicted_while_copied(self):
+        pdf = self.write('board.pdf', 'pdf')
+        report = self.write('board.json', '{}')
+        self.cache.store('key', [pdf, report])
+
+        # Evict the entry right after its first file is copied
+        copyfile = shutil.copyfile
+        def copy_and_evict(source, destination):
+            copyfile(source, destination)
+            shutil.rmtree(os.path.join(self.cache_dir, 'key'))
+        shutil.copyfile = copy_and_evict
+        try:
+            self.assertIsNone(self.cache.fetch('key', self.output_dir))
+        finally:
+            shutil.copyfile = copyfile
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+#
+# Tests of the legacy schematic and symbol library parser, and of the BOM
+# that is grouped from it, on the test projects.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_root = os.path.dirname(tests_dir)
+test_projects_dir = os.path.join(repo_root, 'test-projects')
+
+sys.path.append(os.path.join(repo_root, 'src'))
+
+from eeschema import sch_parser
+from eeschema import export_bom
+
+def schematic_file(name):
+    return os.path.join(test_projects_dir, name, name + '.sch')
+
+def bom_rows(name):
+    return [(group['references'], group['quantity'], group['value'], group['footprint'])
+        for group in export_bom.bom_groups(schematic_file(name))]
+
+# Three resistors of the same value, one with a different footprint
+GROUPED_SCHEMATIC = u'''EESchema Schematic File Version 4
+$Comp
+L Device:R R10
+U 1 1 5CA75B01
+P 1000 1000
+F 0 "R10" H 1070 1046 50  0000 L CNN
+F 1 "10k" H 1070 955 50  0000 L CNN
+F 2 "Resistor_SMD:R_0603_1608Metric" V 930 1000 50  0001 C CNN
+F 3 "" H 1000 1000 50  0001 C CNN
+\t1    1000 1000
+\t1    0    0    -1
+$EndComp
+$Comp
+L Device:R R2
+U 1 1 5CA75B02
+P 2000 1000
+F 0 "R2" H 2070 1046 50  0000 L CNN
+F 1 "10k" H 2070 955 50  0000 L CNN
+F 2 "Resistor_SMD:R_0603_1608Metric" V 1930 1000 50  0001 C CNN
+F 3 "" H 2000 1000 50  0001 C CNN
+\t1    2000 1000
+\t1    0    0    -1
+$EndComp
+$Comp
+L Device:R R3
+U 1 1 5CA75B03
+P 3000 1000
+F 0 "R3" H 3070 1046 50  0000 L CNN
+F 1 "10k" H 3070 955 50  0000 L CNN
+F 2 "Resistor_SMD:R_0805_2012Metric" V 2930 1000 50  0001 C CNN
+F 3 "" H 3000 1000 50  0001 C CNN
+F 4 "Yageo" H 3000 1000 50  0001 C CNN "Manufacturer"
+\t1    3000 1000
+\t1    0    0    -1
+$EndComp
+$EndSCHEMATC
+'''
+
+class LoadSchematicTest(unittest.TestCase):
+    def test_good_project(self):
+        schematic = sch_parser.load_schematic(schematic_file('good-project'))
+        self.assertEqual(len(schematic.components), 6)
+        self.assertEqual(schematic.sheets, [])
+
+        resistor = schematic.components[0]
+        self.assertEqual(resistor.reference, 'R1')
+        self.assertEqual(resistor.lib_id, 'Device:R')
+        self.assertEqual(resistor.value, 'R')
+        self.assertEqual(resistor.footprint, 'Resistor_SMD:R_0603_1608Metric')
+        self.assertEqual(resistor.position, (5700, 2975))
+        self.assertEqual(resistor.matrix, (1, 0, 0, -1))
+
+        led = schematic.components[1]
+        self.assertEqual((led.reference, led.value, led.footprint),
+            ('D1', 'LED', 'Diode_SMD:D_0805_2012Metric'))
+        self.assertEqual(led.matrix, (0, -1, -1, 0))
+
+    def test_references(self):
+        for name, references in [
+                ('good-project', ['#FLG0101', '#FLG0102', '#PWR0101', '#PWR0102', 'D1', 'R1']),
+                ('warning-project', ['#FLG04', '#PWR01', '#PWR02', '#PWR03', '#PWR05', 'D1', 'J1', 'R1']),
+                ('fail-project', ['#FLG04', '#PWR01', '#PWR02', '#PWR03', '#PWR05', 'D1', 'J1', 'R1', 'U1', 'U1'])]:
+            schematic = sch_parser.load_schematic(schematic_file(name))
+            self.assertEqual(sorted(component.reference for component in schematic.components), references)
+
+    def test_values_and_footprints(self):
+        schematic = sch_parser.load_schematic(schematic_file('warning-project'))
+        components = dict((component.reference, component) for component in schematic.components)
+        self.assertEqual(components['R1'].value, '330')
+        self.assertEqual(components['D1'].footprint, 'LED_SMD:LED_0805_2012Metric')
+        self.assertEqual(components['J1'].lib_id, 'Connector_Generic:Conn_01x02')
+        self.assertEqual(components['J1'].footprint,
+            'Connector_PinHeader_2.54mm:PinHeader_1x02_P2.54mm_Vertical')
+        self.assertEqual(components['#PWR01'].value, 'VCC')
+        self.assertEqual(components['#PWR01'].footprint, '')
+
+    def test_not_a_schematic(self):
+        with self.assertRaises(sch_parser.ParseError):
+            sch_parser.load_schematic(os.path.join(test_projects_dir, 'good-project', 'good-project-cache.lib'))
+
+class LoadLibraryTest(unittest.TestCase):
+    def test_good_project(self):
+        library = sch_parser.load_library(sch_parser.cache_library_file(schematic_file('good-project')))
+        self.assertEqual(sorted(library),
+            ['Device_LED', 'Device_R', 'power_GND', 'power_PWR_FLAG', 'power_VCC'])
+
+        led = sch_parser.lib_symbol(library, 'Device:LED')
+        self.assertEqual((led.reference, led.unit_count, led.power), ('D', 1, False))
+        self.assertEqual([(pin.number, pin.name, pin.electrical_type) for pin in led.pins],
+            [('1', 'K', 'P'), ('2', 'A', 'P')])
+
+        vcc = sch_parser.lib_symbol(library, 'power:VCC')
+        self.assertTrue(vcc.power)
+        self.assertEqual([(pin.number, pin.name, pin.electrical_type) for pin in vcc.pins],
+            [('1', 'VCC', 'W')])
+
+    def test_aliases(self):
+        library = sch_parser.load_library(sch_parser.cache_library_file(schematic_file('fail-project')))
+        symbol = sch_parser.lib_symbol(library, '74xx:7400')
+        self.assertEqual(symbol.name, '74xx_7400')
+        self.assertEqual(symbol.unit_count, 5)
+        self.assertEqual(sorted(symbol.aliases), ['7400', '74HC00', '74HCT00', '74LS37'])
+        self.assertIs(library['74HC00'], symbol)
+        self.assertEqual(len(symbol.pins), 26)
+
+    def test_not_a_library(self):
+        with self.assertRaises(sch_parser.ParseError):
+            sch_parser.load_library(schematic_file('good-project'))
+
+class BomTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_groups(self):
+        self.assertEqual(bom_rows('good-project'), [
+            (['D1'], 1, 'LED', 'Diode_SMD:D_0805_2012Metric'),
+            (['R1'], 1, 'R', 'Resistor_SMD:R_0603_1608Metric')])
+        self.assertEqual(bom_rows('warning-project'), [
+            (['D1'], 1, 'LED', 'LED_SMD:LED_0805_2012Metric'),
+            (['J1'], 1, 'Conn_01x02', 'Connector_PinHeader_2.54mm:PinHeader_1x02_P2.54mm_Vertical'),
+            (['R1'], 1, '330', 'Resistor_SMD:R_0603_1608Metric')])
+
+    def test_units_counted_once(self):
+        # The two placed units of U1 are one part
+        self.assertEqual(bom_rows('fail-project')[-1], (['U1'], 1, '7400', ''))
+
+    def test_grouped_references(self):
+        schematic = os.path.join(self.output_dir, 'grouped.sch')
+        with io.open(schematic, 'w', encoding='utf-8') as f:
+            f.write(GROUPED_SCHEMATIC)
+        bom = export_bom.bom_groups(schematic)
+        self.assertEqual([(group['references'], group['quantity'], group['fields']) for group in bom], [
+            (['R2', 'R10'], 2, {}),
+            (['R3'], 1, {'Manufacturer': 'Yageo'})])
+
+    def test_csv(self):
+        output_file = export_bom.export_bom(schematic_file('warning-project'), self.output_dir)
+        self.assertEqual(output_file, os.path.join(self.output_dir, 'warning-project-bom.csv'))
+        with open(output_file) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], export_bom.BOM_COLUMNS)
+        self.assertEqual(rows[1:], [
+            ['D1', '1', 'LED', 'LED_SMD:LED_0805_2012Metric', '', 'Device:LED'],
+            ['J1', '1', 'Conn_01x02', 'Connector_PinHeader_2.54mm:PinHeader_1x02_P2.54mm_Vertical', '',
+                'Connector_Generic:Conn_01x02'],
+            ['R1', '1', '330', 'Resistor_SMD:R_0603_1608Metric', '', 'Device:R']])
+
+    def test_json(self):
+        output_file = export_bom.export_bom(schematic_file('good-project'), self.output_dir, 'json')
+        self.assertEqual(output_file, os.path.join(self.output_dir, 'good-project-bom.json'))
+        with open(output_file) as f:
+            bom = json.load(f)
+        self.assertEqual(bom, export_bom.bom_groups(schematic_file('good-project')))
+        self.assertEqual([group['references'] for group in bom], [['D1'], ['R1']])
+        self.assertEqual(bom[1]['symbol'], 'Device:R')
+
+if __name__ == '__main__':
+    unittest.main()
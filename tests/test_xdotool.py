@@ -0,0 +1,82 @@
+#
+# Tests of the in-process emulation of xdotool command chains, on a
+# connection that records what it is asked to do instead of an X server.
+#
+#   Copyright 2019 Productize SPRL
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import subprocess
+import sys
+import unittest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.append(os.path.join(os.path.dirname(tests_dir), 'src'))
+
+from util import ui_automation
+
+class RecordingConnection(object):
+    def __init__(self, windows=()):
+        self.windows = list(windows)
+        self.calls = []
+
+    def send_keys(self, keys):
+        self.calls.append(('key', list(keys)))
+
+    def find_windows(self, window_regex, only_visible):
+        self.calls.append(('search', window_regex, only_visible))
+        return self.windows
+
+    def focus_window(self, window):
+        self.calls.append(('windowfocus', window))
+
+    def resize_window(self, window, width, height, sync):
+        self.calls.append(('windowsize', window, width, height, sync))
+
+def run(command, windows=()):
+    connection = RecordingConnection(windows)
+    output = ui_automation._xdotool_in_process(connection, command)
+    return output, connection.calls
+
+class XdotoolChainTest(unittest.TestCase):
+    def test_search_and_focus(self):
+        output, calls = run(['search', '--onlyvisible', '--name', 'Plot', 'windowfocus'], [7, 9])
+        self.assertEqual(output, '7\n9\n')
+        self.assertEqual(calls, [('search', 'Plot', True), ('windowfocus', 7)])
+
+    def test_keys_and_resize(self):
+        _, calls = run(['key', 'ctrl+s', 'Return', 'windowsize', '--sync', '0x20', '800', '600'])
+        self.assertEqual(calls, [('key', ['ctrl+s', 'Return']), ('windowsize', 0x20, 800, 600, True)])
+
+    def test_nothing_found(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            run(['search', '--name', 'Plot', 'windowfocus'])
+
+    def test_unsupported_command_runs_nothing(self):
+        # The first key must not be sent when the chain falls back to the
+        # xdotool executable, which runs the whole chain again
+        for command in [
+                ['key', 'a', 'key', '--delay', '5', 'b'],
+                ['key', 'a', 'search', '--class', 'eeschema'],
+                ['key', 'a', 'windowfocus'],
+                ['key', 'a', 'windowsize', '800', 'wide'],
+                ['getactivewindow', 'key', 'a']]:
+            connection = RecordingConnection([7])
+            with self.assertRaises(ui_automation._UnsupportedXdotoolCommand):
+                ui_automation._xdotool_in_process(connection, command)
+            self.assertEqual(connection.calls, [], command)
+
+if __name__ == '__main__':
+    unittest.main()